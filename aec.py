@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Acoustic echo cancellation for the G1 mic stream.
+
+The mic array hears the robot's own speaker. We hold the exact PCM handed to
+PlayStream (ReferenceTrack), so the echo can be predicted and subtracted before
+the audio reaches VAD, Vosk or the Gemini uplink.
+
+EchoCanceller works in two stages:
+
+- bulk delay: the robot buffers, PC1 multicasts, the room adds its own delay, so
+  the echo shows up somewhere within `max_delay` after the hand-over. Every
+  `delay_interval` seconds the last `history` seconds of mic and reference are
+  cross-correlated (GCC-PHAT); a clear peak sets the delay.
+- echo path: a `taps` long FIR models speaker, room and mic from the delayed
+  reference. The echo estimate is computed in the time domain, one matrix product
+  per `block` samples, so there is no added latency and any packet size works.
+  The filter adapts in the frequency domain: the error/reference cross-spectrum is
+  normalized per bin by the smoothed reference power before it goes back to the
+  taps (frequency-domain NLMS), which keeps convergence fast on speech, whose
+  spectrum is far from flat. Adaptation is frozen while the residual is much
+  louder than the predicted echo (the user talking over the robot). That check
+  needs a filter that already predicts the echo, so it only applies once the
+  recent ERLE is above 3 dB: while the filter first converges, and again after a
+  delay jump too large to carry the taps over, the user's voice is adapted on as
+  well.
+
+ERLE (echo return loss enhancement: mic power over residual power while only the
+robot talks) is tracked per block and reported by summary(). Until a delay has
+been found the mic passes through unchanged.
+"""
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MIC_RATE = 16000
+
+
+def gcc_phat(mic: np.ndarray, ref: np.ndarray, max_lag: int) -> tuple[int, float]:
+    """Lag (mic behind ref, 0..max_lag samples) with the strongest PHAT correlation, and its peak-to-median ratio."""
+    n = len(mic) + len(ref)
+    size = 1 << (n - 1).bit_length()
+    spec = np.fft.rfft(mic, size) * np.conj(np.fft.rfft(ref, size))
+    spec /= np.abs(spec) + 1e-12
+    corr = np.abs(np.fft.irfft(spec, size)[:max_lag + 1])
+    lag = int(np.argmax(corr))
+    return lag, float(corr[lag] / (np.median(corr) + 1e-12))
+
+
+class EchoCanceller:
+    def __init__(self, reference=None, rate: int = MIC_RATE, taps: int = 1024, max_delay: float = 0.5,
+                 mu: float = 0.3, block: int = 256, history: float = 2.0, delay_interval: float = 0.5,
+                 min_peak_ratio: float = 8.0, pre_delay: int = 64, min_reference_db: float = -50.0,
+                 double_talk_ratio: float = 4.0):
+        self.reference = reference      # ReferenceTrack, for process(); process_aligned() takes the reference directly
+        self.rate = rate
+        self.taps = taps
+        self.max_lag = int(max_delay * rate)
+        self.mu = mu                    # adaptation step per block
+        self.block = block
+        self.history = int(history * rate)
+        self.delay_interval = int(delay_interval * rate)
+        self.min_peak_ratio = min_peak_ratio
+        self.pre_delay = pre_delay      # taps kept before the estimated delay, for a slightly early echo
+        self.min_reference_power = (10 ** (min_reference_db / 10)) * 32768.0 ** 2
+        self.double_talk_ratio = double_talk_ratio
+
+        # reference history: _ref[k] is sample (_base + k); enough for the longest delay plus the filter
+        self._ref = np.zeros(self.max_lag + taps + 4 * block, dtype=np.float32)
+        self._base = -len(self._ref)
+        self._pos = 0               # samples processed
+        # mic and reference of the last `history` seconds, for the delay search
+        self._est_mic = np.zeros(self.history, dtype=np.float32)
+        self._est_ref = np.zeros(self.history, dtype=np.float32)
+        self._since_estimate = 0
+
+        self._w = np.zeros(taps, dtype=np.float32)     # in window order: _w[-1] is the tap at the bulk delay
+        self._fft_size = 1 << (taps + block - 1).bit_length()
+        self._ref_spectrum = None   # smoothed reference power per bin
+        self.delay = None           # bulk delay in samples, once found
+        self.delay_changes = 0
+
+        # ERLE bookkeeping (echo-only blocks)
+        self._mic_power = 0.0
+        self._err_power = 0.0
+        self.erle_db = 0.0          # recent, smoothed
+        self._echo_mic = 0.0
+        self._echo_err = 0.0
+        self.echo_seconds = 0.0
+        self.double_talk_seconds = 0.0
+
+    def process(self, pcm, t: float | None = None) -> np.ndarray:
+        """Cancel the echo in one packet of int16 mic PCM whose last sample was captured at `t`."""
+        x = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+        t = time.monotonic() if t is None else t
+        ref = self.reference.read(t - len(x) / self.rate, len(x)) if self.reference is not None else None
+        return self.process_aligned(x, ref)
+
+    def process_aligned(self, mic, ref=None) -> np.ndarray:
+        """Cancel the echo given what the robot was handed over the same span (int16 arrays, same length)."""
+        mic = np.asarray(mic)
+        n = len(mic)
+        if n == 0:
+            return mic.astype(np.int16)
+        ref = np.zeros(n, dtype=np.float32) if ref is None else np.asarray(ref, dtype=np.float32)
+        d = mic.astype(np.float32)
+        self._append_estimation(d, ref)
+
+        if self.delay is None:
+            self._append_ref(ref)
+            self._pos += n
+            return mic.astype(np.int16)
+
+        out = np.empty(n, dtype=np.float32)
+        for i in range(0, n, self.block):
+            j = min(n, i + self.block)
+            # the reference history only holds one block beyond the filter, so it goes in block by block
+            self._append_ref(ref[i:j])
+            out[i:j] = self._filter(d[i:j], self._pos + i)
+        self._pos += n
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def _filter(self, d: np.ndarray, pos: int) -> np.ndarray:
+        """One block: predict the echo of mic samples pos.. from the delayed reference, subtract, adapt."""
+        m = len(d)
+        # window k ends at reference sample (pos + k - offset)
+        last = pos - self._offset(self.delay) - self._base
+        first = last - self.taps + 1
+        windows = sliding_window_view(self._ref[first:last + m], self.taps)
+        y = windows @ self._w
+        e = d - y
+
+        ref_power = float(np.mean(windows[-1] * windows[-1]))
+        if ref_power < self.min_reference_power:
+            return e
+        mic_power = float(np.mean(d * d))
+        err_power = float(np.mean(e * e))
+        echo_power = float(np.mean(y * y))
+        converged = self.erle_db > 3.0
+        double_talk = converged and err_power > self.double_talk_ratio * echo_power
+        seconds = m / self.rate
+        if double_talk:
+            self.double_talk_seconds += seconds
+            return e
+
+        # gradient: correlation of the error with the reference under each tap, whitened per bin
+        segment = self._ref[first:last + m]
+        ref_f = np.fft.rfft(segment, self._fft_size)
+        power = (ref_f.real * ref_f.real + ref_f.imag * ref_f.imag).astype(np.float32)
+        if self._ref_spectrum is None:
+            self._ref_spectrum = power
+        else:
+            self._ref_spectrum += 0.1 * (power - self._ref_spectrum)
+        spectrum = self._ref_spectrum + 1e-2 * float(np.mean(self._ref_spectrum)) + 1.0
+        grad = np.fft.irfft(np.conj(np.fft.rfft(e, self._fft_size)) * ref_f / spectrum, self._fft_size)
+        self._w += self.mu * grad[:self.taps].astype(np.float32)
+
+        self._mic_power += 0.05 * (mic_power - self._mic_power)
+        self._err_power += 0.05 * (err_power - self._err_power)
+        self.erle_db = 10.0 * np.log10((self._mic_power + 1e-9) / (self._err_power + 1e-9))
+        self._echo_mic += mic_power * m
+        self._echo_err += err_power * m
+        self.echo_seconds += seconds
+        return e
+
+    def _append_ref(self, ref: np.ndarray):
+        n = len(ref)
+        if n >= len(self._ref):
+            self._ref[:] = ref[-len(self._ref):]
+        else:
+            self._ref[:-n] = self._ref[n:]
+            self._ref[-n:] = ref
+        self._base += n
+
+    def _append_estimation(self, d: np.ndarray, ref: np.ndarray):
+        n = min(len(d), self.history)
+        self._est_mic[:-n] = self._est_mic[n:]
+        self._est_mic[-n:] = d[-n:]
+        self._est_ref[:-n] = self._est_ref[n:]
+        self._est_ref[-n:] = ref[-n:]
+        self._since_estimate += len(d)
+        if self._since_estimate >= self.delay_interval:
+            self._since_estimate = 0
+            self._estimate_delay()
+
+    def _estimate_delay(self):
+        # only worth it when the robot talked for a good part of the window
+        active = np.mean(self._est_ref[::160] ** 2 > self.min_reference_power)
+        if active < 0.3:
+            return
+        lag, ratio = gcc_phat(self._est_mic, self._est_ref, self.max_lag)
+        if ratio < self.min_peak_ratio:
+            return
+        if self.delay is None:
+            self.delay = lag
+            self.delay_changes += 1
+        elif abs(lag - self.delay) > self.pre_delay // 2:
+            # keep what was learned when the path only moved within the filter
+            shift = self._offset(lag) - self._offset(self.delay)
+            if abs(shift) < self.taps // 2:
+                # shift is 0 when both delays are within pre_delay: the taps already line up
+                self._w = np.roll(self._w, shift)
+                if shift > 0:
+                    self._w[:shift] = 0
+                elif shift < 0:
+                    self._w[shift:] = 0
+            else:
+                self._w[:] = 0
+                # start over unconverged, or the double-talk check (nothing predicted, so any
+                # residual looks like the user) would freeze the empty filter for good
+                self._err_power = self._mic_power
+                self.erle_db = 0.0
+            self.delay = lag
+            self.delay_changes += 1
+
+    def _offset(self, delay: int) -> int:
+        """Samples between the newest reference sample under the filter and the mic sample."""
+        return delay - min(self.pre_delay, delay)
+
+    @property
+    def mean_erle_db(self) -> float:
+        """ERLE over everything processed while only the robot talked."""
+        if self._echo_err <= 0:
+            return 0.0
+        return 10.0 * np.log10(self._echo_mic / self._echo_err)
+
+    def summary(self) -> str:
+        delay = f"{1000 * self.delay / self.rate:.0f}ms" if self.delay is not None else "unknown"
+        return (f"[AEC] delay={delay} (changes={self.delay_changes}) erle={self.mean_erle_db:.1f}dB "
+                f"recent={self.erle_db:.1f}dB echo={self.echo_seconds:.0f}s double_talk={self.double_talk_seconds:.1f}s")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Echo cancellation: ERLE, delay estimate and near-end preservation of EchoCanceller.
+
+A reply is "played" and reaches the mic `--delay` seconds later through a room
+(direct path plus a decaying diffuse tail) at each echo gain, over room noise. In
+the double-talk runs a second voice talks over the second half of the reply.
+The mic goes through EchoCanceller in `--packet` sample packets, with the
+reference a ReferenceTrack returns for the same span (as MicCapture does).
+
+Reported per echo gain: the estimated against the true delay, ERLE over the
+echo-only part after the first `--settle` seconds, and for double-talk the
+near-end distortion (residual minus clean user voice, relative to the voice, dB)
+against what the uncancelled mic would give. Also reported: CPU time per second
+of mic audio. The run fails on a wrong delay, ERLE under `--min-erle`, or on the
+user voice being damaged more than the echo it replaced.
+
+Recorded sessions can be measured instead: --mic and --ref take 16 kHz mono
+WAV files of the raw mic and of the reply PCM, aligned at the start.
+
+    python3 benchmarks/bench_aec.py --gains=-20,-12,-6,0
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aec import EchoCanceller  # noqa: E402
+from playout import ReferenceTrack  # noqa: E402
+
+RATE = 16000
+
+
+def voice(seconds: float, f0: float, level_db: float, seed: int) -> np.ndarray:
+    """Speech-like float audio at `level_db` dBFS RMS: harmonics with a syllable envelope."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    f = f0 + 0.2 * f0 * np.sin(2 * np.pi * 0.7 * t + seed)
+    phase = 2 * np.pi * np.cumsum(f) / RATE
+    x = sum(np.sin(k * phase) / k for k in range(1, 10))
+    x *= 0.2 + 0.8 * np.clip(np.sin(2 * np.pi * 2.5 * t + seed), 0, None)
+    x += 0.05 * rng.normal(0, 1, len(t))
+    return x * (32768 * 10 ** (level_db / 20) / np.sqrt(np.mean(x * x)))
+
+
+def power_db(x: np.ndarray) -> float:
+    return 10 * np.log10(np.mean(np.asarray(x, dtype=np.float64) ** 2) + 1e-9)
+
+
+def cancel(mic: np.ndarray, ref: np.ndarray, packet: int) -> tuple[np.ndarray, EchoCanceller, float]:
+    """Run the mic through EchoCanceller packet by packet; the reference goes through a ReferenceTrack."""
+    reference = ReferenceTrack(rate=RATE, seconds=len(ref) / RATE + 1)
+    reference.add(ref, 0.0)
+    echo = EchoCanceller(reference, rate=RATE)
+    out = np.empty_like(mic)
+    t0 = time.process_time()
+    for i in range(0, len(mic), packet):
+        j = min(len(mic), i + packet)
+        out[i:j] = echo.process(mic[i:j], j / RATE)
+    return out, echo, time.process_time() - t0
+
+
+def simulate(args, gain_db: float, double_talk: bool) -> dict:
+    n = int(args.seconds * RATE)
+    reply = np.clip(voice(args.seconds, 150, -16, 1), -32768, 32767).astype(np.int16)
+    delay = int(args.delay * RATE)
+    rng = np.random.default_rng(7)
+    tail = int(0.1 * RATE)
+    room = rng.normal(0, 0.3, tail) * np.exp(-np.arange(tail) / (0.02 * RATE))
+    room[0] = 1.0
+    room *= 10 ** (gain_db / 20) / np.sqrt(np.sum(room * room))
+    echo = np.zeros(n)
+    echo[delay:] = np.convolve(reply.astype(np.float64), room)[:n - delay]
+    mic = echo + rng.normal(0, 32768 * 10 ** (-60 / 20), n)
+    user = np.zeros(n)
+    half = n // 2
+    if double_talk:
+        user[half:] = voice(args.seconds - half / RATE, 230, args.user_db, 2)[:n - half]
+        mic += user
+    mic = np.clip(mic, -32768, 32767).astype(np.int16)
+
+    out, canceller, cpu = cancel(mic, reply, args.packet)
+    settle = int(args.settle * RATE)
+    quiet = slice(settle, half) if double_talk else slice(settle, n)
+    result = {"bench": "aec", "echo_gain_db": gain_db, "double_talk": double_talk,
+              "true_delay_ms": round(1000 * args.delay),
+              "delay_ms": round(1000 * canceller.delay / RATE) if canceller.delay is not None else None,
+              "erle_db": round(power_db(mic[quiet]) - power_db(out[quiet]), 1),
+              "reported_erle_db": round(canceller.mean_erle_db, 1),
+              "cpu_ms_per_audio_s": round(1000 * cpu / args.seconds, 2)}
+    if double_talk:
+        talk = slice(half + RATE // 2, n)
+        voice_db = power_db(user[talk])
+        result["near_end_distortion_db"] = round(power_db(out[talk] - user[talk]) - voice_db, 1)
+        result["uncancelled_distortion_db"] = round(power_db(mic[talk] - user[talk]) - voice_db, 1)
+        result["double_talk_s"] = round(canceller.double_talk_seconds, 1)
+    return result
+
+
+def read_wav(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != RATE or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise SystemExit(f"{path}: expected 16 kHz mono 16-bit WAV")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gains", default="-20,-12,-6,0", help="echo gains from playback to mic, dB")
+    parser.add_argument("--seconds", type=float, default=12.0)
+    parser.add_argument("--delay", type=float, default=0.18, help="hand-over to captured echo, seconds")
+    parser.add_argument("--user-db", type=float, default=-26.0, help="user speech level at the mic, dBFS RMS")
+    parser.add_argument("--packet", type=int, default=512, help="mic samples per multicast packet")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds left out of the ERLE")
+    parser.add_argument("--min-erle", type=float, default=15.0, help="lowest acceptable ERLE, dB")
+    parser.add_argument("--mic", help="recorded mic, 16 kHz mono WAV (with --ref)")
+    parser.add_argument("--ref", help="recorded reply PCM, 16 kHz mono WAV (with --mic)")
+    args = parser.parse_args()
+
+    if args.mic or args.ref:
+        mic, ref = read_wav(args.mic), read_wav(args.ref)
+        out, canceller, cpu = cancel(mic, ref, args.packet)
+        print(json.dumps({"bench": "aec_recording", "seconds": round(len(mic) / RATE, 1),
+                          "delay_ms": round(1000 * canceller.delay / RATE) if canceller.delay is not None else None,
+                          "reported_erle_db": round(canceller.mean_erle_db, 1),
+                          "double_talk_s": round(canceller.double_talk_seconds, 1),
+                          "cpu_ms_per_audio_s": round(1000 * cpu * RATE / len(mic), 2)}))
+        return
+
+    ok = True
+    for gain in (float(g) for g in args.gains.split(",")):
+        for double_talk in (False, True):
+            r = simulate(args, gain, double_talk)
+            print(json.dumps(r), flush=True)
+            ok &= r["delay_ms"] is not None and abs(r["delay_ms"] - r["true_delay_ms"]) <= 5
+            ok &= r["erle_db"] >= args.min_erle
+            if double_talk:
+                ok &= r["near_end_distortion_db"] < r["uncancelled_distortion_db"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
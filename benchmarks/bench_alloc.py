@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Memory allocated on the reply audio path, per second of reply audio (tracemalloc).
+
+The same reply, cut into Live-message-sized blocks of 24 kHz PCM, goes through
+(a) the original path of the chatbot scripts: bytes(inline.data), a bytearray
+    accumulator, array_resample() every 72000 bytes and play_pcm_stream()'s
+    bytes(pcm_list) plus one slice per PlayStream chunk, and
+(b) the buffer path: StreamingResampler writing into a pooled PcmBuffer that
+    PlayoutEngine hands to PlayStream as memoryview chunks.
+Both hand the robot a block every 1.5 s of audio; PlayStream is a stand-in that
+only counts the bytes.
+
+For every message, the growth of the tracemalloc peak over the memory in use
+before it is added up: the bytes the path had to allocate at once for that
+message (temporaries included). Also reported: memory still held at the end and
+the CPU time per second of audio (untraced run). The run fails if the buffer path
+does not deliver exactly the samples of a one-shot StreamingResampler.
+
+    python3 benchmarks/bench_alloc.py --seconds 30
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from playout import PlayoutEngine  # noqa: E402
+from resampler import StreamingResampler  # noqa: E402
+
+IN_RATE = 24000
+OUT_RATE = 16000
+CHUNK_SIZE = 96000
+FLUSH_BYTES = 72000     # chunk_accum threshold of the original scripts (1.5 s at 24 kHz)
+
+
+class CountingClient:
+    """AudioClient stand-in: PlayStream only counts (and optionally keeps) the bytes."""
+
+    def __init__(self, keep: bool = False):
+        self.keep = keep
+        self.chunks = []
+        self.nbytes = 0
+
+    def PlayStream(self, stream_name, stream_id, pcm_data):
+        self.nbytes += len(pcm_data)
+        if self.keep:
+            self.chunks.append(bytes(pcm_data))
+        return 0, None
+
+    def PlayStop(self, stream_name):
+        return 0
+
+
+def array_resample(array: bytearray, in_rate: int, out_rate: int):
+    """The per-block resampler of the chatbot scripts."""
+    factor = math.gcd(in_rate, out_rate)
+    up = out_rate // factor
+    down = in_rate // factor
+    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
+    y = signal.resample_poly(x, up, down)
+    return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def play_pcm_stream(client, pcm_list, chunk_size=CHUNK_SIZE):
+    """play_pcm_stream() of the chatbot scripts without the sleeps."""
+    pcm_data = bytes(pcm_list)
+    offset = 0
+    while offset < len(pcm_data):
+        chunk = pcm_data[offset:offset + min(chunk_size, len(pcm_data) - offset)]
+        client.PlayStream("example", "1", chunk)
+        offset += len(chunk)
+
+
+def messages(seconds: float, block: int) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * IN_RATE)) / IN_RATE
+    x = 6000 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 300, len(t))
+    pcm = np.clip(x, -32768, 32767).astype(np.int16).tobytes()
+    return [pcm[i:i + 2 * block] for i in range(0, len(pcm), 2 * block)]
+
+
+class OriginalPath:
+    def __init__(self, client):
+        self.client = client
+        self.array = bytearray([])
+        self.chunk_accum = 0
+
+    async def message(self, data: bytes):
+        self.array.extend(bytes(data))
+        self.chunk_accum += len(data)
+        if self.chunk_accum > FLUSH_BYTES:
+            play_pcm_stream(self.client, array_resample(self.array, IN_RATE, OUT_RATE))
+            self.chunk_accum = 0
+            self.array = bytearray([])
+
+    async def end(self):
+        play_pcm_stream(self.client, array_resample(self.array, IN_RATE, OUT_RATE))
+
+
+class BufferPath:
+    def __init__(self, client):
+        # the engine thread is not started; queued blocks are played inline
+        self.playout = PlayoutEngine(client, chunk_size=CHUNK_SIZE)
+        self.resampler = StreamingResampler(IN_RATE, OUT_RATE)
+        self.stream_id = self.playout.new_stream()
+        self.block = self.playout.new_block()
+
+    async def write(self):
+        await self.playout.write(self.block, self.stream_id)
+        self.playout._play(self.playout._blocks.get_nowait())
+        self.block = self.playout.new_block()
+
+    async def message(self, data: bytes):
+        self.resampler.process(data, out=self.block)
+        if self.block.nbytes > FLUSH_BYTES * OUT_RATE // IN_RATE:
+            await self.write()
+
+    async def end(self):
+        self.resampler.flush(out=self.block)
+        await self.write()
+
+
+async def traced(path, msgs: list[bytes]) -> tuple[int, int]:
+    """(sum of per-message peak growth, bytes still allocated at the end)."""
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    allocated = 0
+    for data in msgs + [None]:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        if data is None:
+            await path.end()
+        else:
+            await path.message(data)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated, end - start
+
+
+async def timed(path, msgs: list[bytes]) -> float:
+    t0 = time.process_time()
+    for data in msgs:
+        await path.message(data)
+    await path.end()
+    return time.process_time() - t0
+
+
+async def main_async(args) -> bool:
+    msgs = messages(args.seconds, args.block)
+    results = {}
+    for name, cls in (("original", OriginalPath), ("buffers", BufferPath)):
+        # warm-up run: filter design caches, pool buffers, numpy internals
+        await timed(cls(CountingClient()), msgs)
+        allocated, retained = await traced(cls(CountingClient()), msgs)
+        cpu = min([await timed(cls(CountingClient()), msgs) for _ in range(args.repeat)])
+        results[name] = allocated
+        print(json.dumps({
+            "bench": "alloc",
+            "path": name,
+            "audio_s": args.seconds,
+            "messages": len(msgs),
+            "alloc_kb_per_audio_s": round(allocated / 1024 / args.seconds, 1),
+            "alloc_bytes_per_message": round(allocated / len(msgs)),
+            "retained_kb": round(retained / 1024, 1),
+            "cpu_ms_per_audio_s": round(1000 * cpu / args.seconds, 3),
+        }), flush=True)
+
+    client = CountingClient(keep=True)
+    await timed(BufferPath(client), msgs)
+    got = np.frombuffer(b"".join(client.chunks), dtype=np.int16)
+    resampler = StreamingResampler(IN_RATE, OUT_RATE)
+    expected = np.concatenate((resampler.process(b"".join(msgs)), resampler.flush()))
+    ok = len(got) == len(expected) and bool(np.array_equal(got, expected))
+    print(json.dumps({"bench": "alloc_check", "buffers_match_oneshot": ok, "samples": len(got),
+                      "alloc_ratio": round(results["original"] / max(1, results["buffers"]), 1)}))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="seconds of 24 kHz reply audio")
+    parser.add_argument("--block", type=int, default=1920, help="samples per Live message (1920 = 80 ms)")
+    parser.add_argument("--repeat", type=int, default=3, help="untraced runs for the CPU time, the fastest is reported")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Barge-in: time from the user talking over a reply to the robot going quiet.
+
+Detection is simulated on a virtual clock, the way gemini_chatbot_g1_flash.py
+listens: the reply is handed to a ReferenceTrack in blocks ahead of playback, the
+robot plays it `--robot-delay` later and the mic hears it `--mic-delay` after that,
+attenuated by the echo gain and smeared by a short reverb tail, plus room noise.
+In the "user" runs a second voice starts `--onset` seconds into the reply. The mic
+is fed to BargeInDetector in BARGE_IN_FRAME steps together with what the
+ReferenceTrack says was playing over the same span, as in the script; the
+detector has to find the delay itself.
+
+The stop path is measured for real: a PlayoutEngine thread feeds a stand-in robot
+whose PlayStream takes `--rpc-ms`, stop() is called while blocks are queued and
+an RPC is in flight, and the run checks that no PlayStream landed after the last
+PlayStop. Reported are how long stop() held the loop and how long until the
+playout thread's PlayStop returned (the in-flight PlayStream finishes first).
+
+Reported per echo gain: false barge-ins on echo only, detection delay after the
+onset and onset-to-silence (detection delay plus the time to PlayStop). The run
+fails on a false barge-in, on a missed or slower than `--max-detect` barge-in
+with the echo at or below -12 dB, when a PlayStream lands after PlayStop, or
+when stop() holds the loop for more than a millisecond.
+
+    python3 benchmarks/bench_barge_in.py --gains=-30,-20,-12,-6
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from playout import PlayoutEngine, ReferenceTrack  # noqa: E402
+from vad import BargeInDetector  # noqa: E402
+
+RATE = 16000
+BARGE_IN_FRAME = 1600
+BLOCK_SECONDS = 0.5
+LEAD_SECONDS = 0.3      # blocks are handed over this long before they are due
+
+
+def voice(seconds: float, f0: float, level_db: float, seed: int) -> np.ndarray:
+    """Speech-like float audio at `level_db` dBFS RMS: harmonics with a syllable envelope."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    f = f0 + 0.2 * f0 * np.sin(2 * np.pi * 0.7 * t + seed)
+    phase = 2 * np.pi * np.cumsum(f) / RATE
+    x = sum(np.sin(k * phase) / k for k in range(1, 10))
+    x *= 0.2 + 0.8 * np.clip(np.sin(2 * np.pi * 2.5 * t + seed), 0, None)
+    x += 0.05 * rng.normal(0, 1, len(t))
+    return x * (32768 * 10 ** (level_db / 20) / np.sqrt(np.mean(x * x)))
+
+
+def simulate(args, gain_db: float, user: bool) -> dict:
+    reply = np.clip(voice(args.reply_seconds, 150, -16, 1), -32768, 32767).astype(np.int16)
+    total = args.reply_seconds + 1.0
+    n = int(total * RATE)
+
+    # what the robot plays and what reaches the mic
+    delay = int((args.robot_delay + args.mic_delay) * RATE)
+    played = np.zeros(n)
+    played[delay:delay + len(reply)] = reply[:n - delay]
+    rng = np.random.default_rng(7)
+    # direct path plus a short diffuse tail, unit energy
+    room = rng.normal(0, 0.3, int(0.05 * RATE)) * np.exp(-np.arange(int(0.05 * RATE)) / (0.015 * RATE))
+    room[0] = 1.0
+    echo = np.convolve(played, room / np.sqrt(np.sum(room * room)))[:n] * 10 ** (gain_db / 20)
+    mic = echo + rng.normal(0, 32768 * 10 ** (-60 / 20), n)
+    onset = int(args.onset * RATE)
+    if user:
+        speech = voice(2.0, 230, args.user_db, 2)
+        mic[onset:onset + len(speech)] += speech[:n - onset]
+    mic = np.clip(mic, -32768, 32767).astype(np.int16)
+
+    reference = ReferenceTrack(rate=RATE)
+    detector = BargeInDetector(rate=RATE)
+    detector.calibrate(mic[:0])
+    block = int(BLOCK_SECONDS * RATE)
+    next_block = 0
+    detected = None
+    for end in range(BARGE_IN_FRAME, n + 1, BARGE_IN_FRAME):
+        t1 = end / RATE
+        # hand over every block that is due within LEAD_SECONDS
+        while next_block < len(reply) and next_block / RATE - LEAD_SECONDS <= t1:
+            reference.add(reply[next_block:next_block + block], max(0.0, next_block / RATE - LEAD_SECONDS))
+            next_block += block
+        t0 = t1 - BARGE_IN_FRAME / RATE
+        if detector.process(mic[end - BARGE_IN_FRAME:end], reference.read(t0, BARGE_IN_FRAME)):
+            detected = end
+            break
+
+    result = {"bench": "barge_in", "echo_gain_db": gain_db, "user": user,
+              "true_delay_ms": round(1000 * (args.robot_delay + args.mic_delay)),
+              "echo_return_db": round(detector.erl_db, 1),
+              "delay_ms": detector.lag * detector.frame_ms if detector.lag is not None else None}
+    if user:
+        result["detected"] = detected is not None and detected >= onset
+        result["detect_ms"] = round(1000 * (detected - onset) / RATE) if result["detected"] else None
+        result["onset_error_ms"] = round(1000 * (detected - detector.onset_samples - onset) / RATE) \
+            if result["detected"] else None
+    else:
+        result["false_barge_in"] = detected is not None
+    return result
+
+
+class StandInRobot:
+    """AudioClient stand-in: PlayStream takes `rpc` seconds; every call is logged."""
+
+    def __init__(self, rpc: float):
+        self.rpc = rpc
+        self.log = []
+        self._lock = threading.Lock()
+
+    def PlayStream(self, stream_name, stream_id, pcm_data):
+        time.sleep(self.rpc)
+        with self._lock:
+            self.log.append(("stream", time.monotonic()))
+        return 0, None
+
+    def PlayStop(self, stream_name):
+        time.sleep(self.rpc / 4)
+        with self._lock:
+            self.log.append(("stop", time.monotonic()))
+        return 0
+
+
+async def measure_stop(args) -> dict:
+    robot = StandInRobot(args.rpc_ms / 1000)
+    reference = ReferenceTrack(rate=RATE)
+    playout = PlayoutEngine(robot, chunk_size=int(BLOCK_SECONDS * RATE) * 2, reference=reference)
+    playout.start()
+    stream_id = playout.new_stream()
+    pcm = np.full(int(BLOCK_SECONDS * RATE), 1000, dtype=np.int16)
+    for _ in range(20):
+        await playout.write(pcm, stream_id)
+    await asyncio.sleep(2.5 * args.rpc_ms / 1000)      # a few blocks sent, one in flight
+    queued = playout.queued
+    t0 = time.monotonic()
+    stopped = playout.stop()
+    call_s = time.monotonic() - t0
+    play_stop_s = await asyncio.wrap_future(stopped)
+    stop_s = time.monotonic() - t0
+    await asyncio.sleep(3 * args.rpc_ms / 1000)
+    await playout.close()
+    last = robot.log[-1][0] if robot.log else None
+    return {
+        "bench": "barge_in_stop",
+        "rpc_ms": args.rpc_ms,
+        "queued_blocks_dropped": queued,
+        "stop_call_ms": round(1000 * call_s, 3),
+        "play_stop_rpc_ms": round(1000 * play_stop_s, 1),
+        "stop_ms": round(1000 * stop_s, 1),
+        "stream_after_stop": last != "stop",
+        "reference_playing_after_stop": reference.playing(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gains", default="-30,-20,-12,-6", help="echo gains from playback to mic, dB")
+    parser.add_argument("--reply-seconds", type=float, default=8.0)
+    parser.add_argument("--onset", type=float, default=4.0, help="when the user starts talking, seconds into the reply")
+    parser.add_argument("--user-db", type=float, default=-26.0, help="user speech level at the mic, dBFS RMS")
+    parser.add_argument("--robot-delay", type=float, default=0.1, help="hand-over to loudspeaker, seconds")
+    parser.add_argument("--mic-delay", type=float, default=0.05, help="loudspeaker to captured sample, seconds")
+    parser.add_argument("--rpc-ms", type=float, default=40.0, help="PlayStream duration of the stand-in robot")
+    parser.add_argument("--max-detect", type=float, default=0.6, help="slowest acceptable detection, seconds")
+    args = parser.parse_args()
+
+    stop = asyncio.run(measure_stop(args))
+    print(json.dumps(stop), flush=True)
+    ok = not stop["stream_after_stop"] and not stop["reference_playing_after_stop"] and stop["stop_call_ms"] <= 1.0
+
+    for gain in (float(g) for g in args.gains.split(",")):
+        quiet = simulate(args, gain, user=False)
+        print(json.dumps(quiet), flush=True)
+        talk = simulate(args, gain, user=True)
+        if talk["detected"]:
+            talk["onset_to_silence_ms"] = round(talk["detect_ms"] + stop["stop_ms"])
+        print(json.dumps(talk), flush=True)
+        ok &= not quiet["false_barge_in"]
+        if gain <= -12:
+            ok &= talk["detected"] and talk["detect_ms"] <= 1000 * args.max_detect
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+CPU cost of receiving the mic stream, per second of audio.
+
+Compares the old receive loop (one asyncio Task + asyncio.wait per packet) with the
+two MicCapture receivers. A sender process replays packets to a local UDP socket
+faster than real time; only the receiving process is measured (time.process_time
+counts every thread, so the reader thread is included).
+
+For the MicCapture receivers it also measures how long a packet waits in the
+ring before the loop is woken for it: from the arrival of the first packet of a
+batch to the wakeup. Halfway through, the sender pauses for `--pause` seconds
+(longer than the reader thread's 0.5 s select timeout) to check the receiver
+survives silence. The run fails if a packet is lost, or if a wakeup comes later
+than one packet period of real-time audio (`--packet-bytes` / 2 samples, 64 ms
+at the default) after the packet arrived.
+
+Run it on PC2 to get numbers for the robot:
+
+    python3 benchmarks/bench_capture_rx.py --seconds 60 --speed 20
+
+One JSON line is printed per receiver.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from mic_capture import MicCapture, MIC_RATE  # noqa: E402
+
+
+def sender(port: int, packets: int, packet_bytes: int, speed: float, pause: float):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = os.urandom(packet_bytes)
+    period = packet_bytes / 2 / MIC_RATE / speed
+    t0 = time.monotonic()
+    for i in range(packets):
+        if i == packets // 2:
+            t0 += pause
+        delay = t0 + i * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        sock.sendto(payload, ("127.0.0.1", port))
+    sock.close()
+
+
+def make_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    return sock
+
+
+async def receive_task_per_packet(sock, packets: int, packet_bytes: int, timeout: float) -> tuple[int, list]:
+    """The receive loop the chatbot scripts used before MicCapture."""
+    loop = asyncio.get_running_loop()
+    frames = []
+    while len(frames) < packets:
+        recv_task = asyncio.create_task(loop.sock_recvfrom(sock, packet_bytes))
+        done, _ = await asyncio.wait({recv_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if recv_task not in done:
+            recv_task.cancel()
+            break
+        data, _ = recv_task.result()
+        frames.append(data)
+    sock.close()
+    return len(frames), []
+
+
+async def receive_capture(sock, packets: int, packet_bytes: int, receiver: str, timeout: float) -> tuple[int, list]:
+    """Wake on every batch like a reader would; returns packets received and the wake delay of every batch."""
+    capture = MicCapture(sock=sock, receiver=receiver)
+    await capture.start()
+    last = packets * (packet_bytes // 2) - 1
+    wakes = []
+    while capture.write_pos <= last:
+        before = capture.write_pos
+        if not await capture.wait_for(before, timeout=timeout):
+            break
+        # the last sample of the first new packet is stamped with that packet's arrival
+        arrived = capture.time_of(before + packet_bytes // 2 - 1) + 1 / capture.rate
+        wakes.append(time.monotonic() - arrived)
+    received = capture.packets
+    await capture.close()
+    return received, wakes
+
+
+async def run_one(mode: str, args) -> dict:
+    sock = make_socket()
+    port = sock.getsockname()[1]
+    packets = int(args.seconds * MIC_RATE * 2 / args.packet_bytes)
+
+    proc = multiprocessing.Process(target=sender, args=(port, packets, args.packet_bytes, args.speed, args.pause))
+    timeout = args.pause + 2.0
+    cpu0 = time.process_time()
+    wall0 = time.monotonic()
+    proc.start()
+    if mode == "task":
+        received, wakes = await receive_task_per_packet(sock, packets, args.packet_bytes, timeout)
+    else:
+        received, wakes = await receive_capture(sock, packets, args.packet_bytes, mode, timeout)
+    cpu = time.process_time() - cpu0
+    wall = time.monotonic() - wall0
+    proc.join()
+
+    audio_s = received * args.packet_bytes / 2 / MIC_RATE
+    max_wake_ms = 1000 * args.packet_bytes / 2 / MIC_RATE
+    wake_ms = 1000 * np.array(wakes)
+    ok = received == packets and (not wakes or wake_ms.max() <= max_wake_ms)
+    return {
+        "bench": "capture_rx",
+        "receiver": mode,
+        "packet_bytes": args.packet_bytes,
+        "packets_sent": packets,
+        "packets_received": received,
+        "audio_s": round(audio_s, 3),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 4),
+        "cpu_ms_per_audio_s": round(1000 * cpu / audio_s, 4) if audio_s else None,
+        "wakes": len(wakes),
+        "wake_p50_ms": round(float(np.percentile(wake_ms, 50)), 3) if wakes else None,
+        "wake_p99_ms": round(float(np.percentile(wake_ms, 99)), 3) if wakes else None,
+        "wake_max_ms": round(float(wake_ms.max()), 3) if wakes else None,
+        "ok": bool(ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0, help="seconds of audio to send per receiver")
+    parser.add_argument("--speed", type=float, default=20.0, help="send rate as a multiple of real time")
+    parser.add_argument("--packet-bytes", type=int, default=2048, help="datagram size (2048 = 1024 samples)")
+    parser.add_argument("--pause", type=float, default=1.0, help="sender pause halfway through, seconds")
+    parser.add_argument("--receivers", default="task,protocol,thread")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.receivers.split(","):
+        results[mode] = asyncio.run(run_one(mode, args))
+        print(json.dumps(results[mode]), flush=True)
+
+    base = results.get("task")
+    if base and base["cpu_ms_per_audio_s"]:
+        for mode, r in results.items():
+            if mode != "task" and r["cpu_ms_per_audio_s"]:
+                saved = base["cpu_ms_per_audio_s"] - r["cpu_ms_per_audio_s"]
+                print(json.dumps({"bench": "capture_rx_saving", "receiver": mode,
+                                  "cpu_ms_saved_per_audio_s": round(saved, 4),
+                                  "ratio_vs_task": round(r["cpu_ms_per_audio_s"] / base["cpu_ms_per_audio_s"], 3)}))
+    sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
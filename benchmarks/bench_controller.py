@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Push-to-talk detection: ControllerInput edges vs polling a flag every 50 ms.
+
+A thread plays the wireless remote: it calls the subscriber callback with the
+button state every `--period` seconds, like the DDS reader thread, and presses
+the talk button `--presses` times for random lengths. Every edge bounces: the
+state flips back and forth a few times within `--bounce` seconds.
+
+Two consumers watch the same message stream:
+(a) polling, as the controller script did: the callback sets a global flag,
+    the loop checks it every 50 ms;
+(b) ControllerInput: debounced edges posted to the loop with call_soon_threadsafe,
+    awaited with wait_press()/wait_release().
+
+Reported per consumer: detection latency of press and release (the message that
+changed the state to the loop seeing it; p50/p95/max ms), presses seen, and how
+often the loop woke up while nothing happened. For (b) also the error of the
+edge timestamps against the first message of the real edge. The run fails if
+(b) does not see exactly one press and one release per real press.
+
+    python3 benchmarks/bench_controller.py --presses 20 --period 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controller_input import KEYS, ControllerInput  # noqa: E402
+
+TALK_KEYS = KEYS["B"]
+POLL = 0.05
+
+
+class FakeRemote(threading.Thread):
+    """Sends the button state to the subscribers every `period` seconds, with bouncy presses."""
+
+    def __init__(self, subscribers, presses: int, period: float, bounce: float, seed: int = 0):
+        super().__init__(name="fake-remote", daemon=True)
+        self.subscribers = subscribers
+        self.period = period
+        rng = np.random.default_rng(seed)
+        # (state, from time offset): held 0.3-2 s, idle 0.5-1.5 s, bounces at each edge
+        self.script = []
+        t = 0.5
+        for _ in range(presses):
+            hold = rng.uniform(0.3, 2.0)
+            for state, at in ((True, t), (False, t + hold)):
+                self.script.append((state, at))
+                flips = rng.integers(1, 4) * 2
+                for k, dt in enumerate(np.sort(rng.uniform(0, bounce, flips))):
+                    self.script.append((state if k % 2 else not state, at + dt))
+                self.script.append((state, at + bounce))
+            t += hold + rng.uniform(0.5, 1.5)
+        self.script.sort(key=lambda x: x[1])
+        self.duration = t
+        self.edges = []     # (state, monotonic time of the first message of every real edge)
+
+    def run(self):
+        t0 = time.monotonic()
+        state = sent = False
+        k = 0
+        n = 0
+        while True:
+            due = t0 + n * self.period
+            time.sleep(max(0.0, due - time.monotonic()))
+            now = time.monotonic()
+            while k < len(self.script) and t0 + self.script[k][1] <= now:
+                state = self.script[k][0]
+                k += 1
+            # a real edge starts with the first message that differs; the bounces after it are not edges
+            if state != sent and (not self.edges or now - self.edges[-1][1] > 0.1):
+                self.edges.append((state, now))
+            sent = state
+            msg = SimpleNamespace(keys=TALK_KEYS if state else 0)
+            for subscriber in self.subscribers:
+                subscriber(msg)
+            n += 1
+            if now - t0 > self.duration + 0.5:
+                return
+
+
+class FlagPoller:
+    """The old script: the callback sets a flag, the loop checks it every POLL seconds."""
+
+    def __init__(self):
+        self.pressed = False
+        self.changed_at = None
+        self.detections = []    # (state, message time, seen time)
+        self.wakeups = 0
+
+    def callback(self, msg):
+        pressed = msg.keys == TALK_KEYS
+        if pressed != self.pressed:
+            self.changed_at = time.monotonic()
+        self.pressed = pressed
+
+    async def run(self, stop: asyncio.Event):
+        seen = False
+        while not stop.is_set():
+            await asyncio.sleep(POLL)
+            self.wakeups += 1
+            if self.pressed != seen:
+                seen = self.pressed
+                self.detections.append((seen, self.changed_at, time.monotonic()))
+
+
+async def watch_events(pad: ControllerInput, stop: asyncio.Event, detections: list):
+    while not stop.is_set():
+        t = await pad.wait_press("talk", timeout=0.5)
+        if t is None:
+            continue
+        detections.append((True, t, time.monotonic()))
+        t = await pad.wait_release("talk")
+        detections.append((False, t, time.monotonic()))
+
+
+def latency_stats(detections, state: bool) -> dict:
+    ms = [1000 * (seen - sent) for s, sent, seen in detections if s == state and sent is not None]
+    if not ms:
+        return {}
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "max_ms": round(max(ms), 2)}
+
+
+async def main_async(args) -> bool:
+    pad = ControllerInput({"talk": TALK_KEYS}, debounce=args.debounce, verbose=False)
+    poller = FlagPoller()
+    await pad.start()
+    remote = FakeRemote([poller.callback, pad.callback], args.presses, args.period, args.bounce)
+
+    stop = asyncio.Event()
+    detections = []
+    tasks = [asyncio.create_task(poller.run(stop)), asyncio.create_task(watch_events(pad, stop, detections))]
+    remote.start()
+    await asyncio.to_thread(remote.join)
+    await asyncio.sleep(0.2)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    real = remote.edges
+    idle_s = remote.duration
+    ok = [s for s, _, _ in detections] == [s for s, _ in real]
+    stamp_error = [1000 * abs(t - rt) for (_, t, _), (_, rt) in zip(detections, real)] if ok else []
+    results = [
+        {"bench": "controller", "consumer": "poll_50ms", "real_presses": sum(s for s, _ in real),
+         "presses_seen": sum(s for s, _, _ in poller.detections),
+         "press": latency_stats(poller.detections, True), "release": latency_stats(poller.detections, False),
+         "wakeups_per_s": round(poller.wakeups / idle_s, 1)},
+        {"bench": "controller", "consumer": "events", "real_presses": sum(s for s, _ in real),
+         "presses_seen": pad.presses, "releases_seen": pad.releases, "bounces_ignored": pad.bounces,
+         "press": latency_stats(detections, True), "release": latency_stats(detections, False),
+         "wakeups_per_s": round((pad.presses + pad.releases) / idle_s, 1),
+         "edge_time_error_max_ms": round(max(stamp_error), 2) if stamp_error else None,
+         "edges_match": ok},
+    ]
+    for r in results:
+        print(json.dumps(r))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presses", type=int, default=10)
+    parser.add_argument("--period", type=float, default=0.02, help="seconds between remote messages")
+    parser.add_argument("--bounce", type=float, default=0.03, help="contact bounce after every edge, seconds")
+    parser.add_argument("--debounce", type=float, default=0.05)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+End-to-end turn latency against the local stand-ins, no robot and no network.
+
+The LiveStandIn of benchmarks/standin.py plays Gemini, FakeAudioClient the robot.
+Each turn goes through the same pieces as the streaming chatbot scripts:
+
+- the user speaks: `--speech-seconds` of speech-like mic audio becomes available
+  in real time, frame by frame, and is streamed through UplinkScheduler (policy
+  from policy_for(--turn-end)), then ended with silence padding or activityEnd;
+- the reply is received on the genai Live session, resampled by
+  StreamingResampler into pooled blocks, handed over as AdaptivePlayout decides
+  and sent to the fake robot by a PlayoutEngine thread;
+- a TurnTracer stamps every stage, as in the scripts, and the next turn starts
+  once the fake speaker went quiet (with `--overlap` as soon as the reply was
+  received, while it still plays, as in the repeater).
+
+Printed per turn: the tracer record (stage durations in ms) plus, from the
+modeled speaker, end of speech to first sound, underruns and the audio played.
+The summary line has p50/p95 per stage. The run fails if the stand-in did not see
+every turn, a reply did not reach the speaker complete, or a stage came out
+negative (a stamp of one reply landing in another turn's record).
+
+    python3 benchmarks/bench_e2e.py --turns 5 --first-byte-delay 0.4 --send-rate 1.2 --jitter 0.05
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from standin import MIC_RATE, REPLY_RATE, FakeAudioClient, LiveStandIn, make_client, voice
+from latency import TurnTracer
+from playout import AdaptivePlayout, PlayoutEngine
+from resampler import StreamingResampler
+from uplink import UplinkScheduler, policy_for
+
+OUT_RATE = 16000
+CHUNK_SIZE = 96000
+FRAME_SAMPLES = 4096        # CHUNK // 2 of the scripts
+PADDING_FRAMES = 6
+
+
+async def speak(session, args, tracer: TurnTracer, seed: int) -> float:
+    """Stream one utterance as it is spoken; returns the end-of-speech time."""
+    pcm = voice(args.speech_seconds, MIC_RATE, f0=220, level_db=-26, seed=seed)
+    frames = [pcm[i:i + 2 * FRAME_SAMPLES] for i in range(0, len(pcm), 2 * FRAME_SAMPLES)]
+    uplink = UplinkScheduler(session, MIC_RATE, policy=policy_for(args.turn_end))
+    uplink.start_turn()
+    t0 = time.monotonic()
+    tracer.mark("speech_start", t0)
+    if args.turn_end == "activity":
+        await session.send_realtime_input(activity_start={})
+    spoken = 0
+    for frame in frames:
+        # a frame can only be sent once its last sample was spoken
+        spoken += len(frame) // 2
+        await asyncio.sleep(max(0.0, t0 + spoken / MIC_RATE - time.monotonic()))
+        await uplink.send(frame)
+    speech_end = time.monotonic()
+    tracer.mark("speech_end", speech_end)
+    if args.turn_end == "activity":
+        await session.send_realtime_input(activity_end={})
+    else:
+        for _ in range(PADDING_FRAMES):
+            await uplink.send(bytes(2 * FRAME_SAMPLES))
+    tracer.mark("uplink_last")
+    uplink.end_turn()
+    return speech_end
+
+
+async def play_reply(session, playout: PlayoutEngine, playback: AdaptivePlayout, tracer: TurnTracer) -> str:
+    """play_reply_streaming() of the scripts, without the transcript and tool printing."""
+    resampler = StreamingResampler(REPLY_RATE, OUT_RATE)
+    block = playout.new_block()
+    playback.start_turn()
+    stream_id = playout.new_stream()
+    async for resp in session.receive():
+        tracer.mark("first_message")
+        sc = resp.server_content
+        if not sc:
+            continue
+        if sc.model_turn:
+            for part in sc.model_turn.parts:
+                inline = part.inline_data
+                if inline and isinstance(inline.data, (bytes, bytearray)):
+                    tracer.mark("first_audio")
+                    playback.arrived(resampler.process(inline.data, out=block).nbytes)
+        if playback.should_flush(block.nbytes):
+            playback.flushed(await playout.write(block, stream_id))
+            block = playout.new_block()
+        if sc.turn_complete:
+            tracer.mark("turn_complete")
+            resampler.flush(out=block)
+            playback.flushed(await playout.write(block, stream_id))
+            break
+    return stream_id
+
+
+def expected_samples(reply: bytes) -> int:
+    resampler = StreamingResampler(REPLY_RATE, OUT_RATE)
+    return len(resampler.process(reply)) + len(resampler.flush())
+
+
+async def main_async(args) -> bool:
+    reply = voice(args.reply_seconds)
+    server = LiveStandIn(reply=reply, first_byte_delay=args.first_byte_delay, chunk_bytes=args.chunk_bytes,
+                         send_rate=args.send_rate, jitter=args.jitter, turn_complete_delay=args.turn_complete_delay)
+    robot = FakeAudioClient(rate=OUT_RATE, rpc=args.rpc_ms / 1000, latency=args.speaker_latency_ms / 1000)
+    tracer = TurnTracer(args.log, info={"bench": "e2e", "turn_end": args.turn_end})
+    playout = PlayoutEngine(robot, chunk_size=CHUNK_SIZE, tracer=tracer)
+    playback = AdaptivePlayout(rate=OUT_RATE)
+    config = {"response_modalities": ["AUDIO"]}
+    if args.turn_end == "activity":
+        config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
+
+    ok = True
+    first_sound = []
+    playout.start()
+    async with server.running() as port:
+        async with make_client(port).aio.live.connect(model="stand-in", config=config) as session:
+            turns = []
+            for k in range(args.turns):
+                tracer.start_turn()
+                tracer.mark("wake")
+                speech_end = await speak(session, args, tracer, seed=10 + k)
+                stream_id = await play_reply(session, playout, playback, tracer)
+                if not args.overlap:
+                    await playout.drain()
+                    # the user listens to the whole reply before talking again
+                    await asyncio.sleep(max(0.0, robot.play_end - time.monotonic()) + 0.05)
+                turns.append((tracer.end_turn(), stream_id, speech_end))
+
+            await playout.drain()
+            await asyncio.sleep(max(0.0, robot.play_end - time.monotonic()) + 0.05)
+            for record, stream_id, speech_end in turns:
+                ok &= all(ms >= 0 for ms in record["stages"].values())
+                stream = robot.streams.get(stream_id, {})
+                played = stream.get("samples", 0)
+                complete = played == expected_samples(reply)
+                ok &= complete
+                if "first_sound" in stream:
+                    first_sound.append(1000 * (stream["first_sound"] - speech_end))
+                record.update({
+                    "first_sound_ms": round(first_sound[-1]) if "first_sound" in stream else None,
+                    "underruns": stream.get("underruns", 0),
+                    "underrun_ms": round(1000 * stream.get("underrun_s", 0.0)),
+                    "played_s": round(played / OUT_RATE, 3),
+                    "complete": complete,
+                })
+                print(json.dumps(record), flush=True)
+    await playout.close()
+
+    ok &= len(server.turns) == args.turns
+    stats = tracer.percentiles()
+    summary = {"bench": "e2e_summary", "turns": args.turns, "server_turns": len(server.turns),
+               "first_byte_delay": args.first_byte_delay, "chunk_bytes": args.chunk_bytes,
+               "send_rate": args.send_rate, "jitter": args.jitter,
+               "stages_p50_p95_ms": {name: [round(p50), round(p95)] for name, (p50, p95, _) in stats.items()},
+               "first_sound_p50_p95_ms": [round(float(np.percentile(first_sound, q))) for q in (50, 95)]
+               if first_sound else None,
+               "underruns": sum(s["underruns"] for s in robot.streams.values()),
+               "ok": bool(ok)}
+    print(json.dumps(summary))
+    tracer.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--speech-seconds", type=float, default=1.5)
+    parser.add_argument("--reply-seconds", type=float, default=2.0)
+    parser.add_argument("--turn-end", default="activity", choices=("activity", "padding"))
+    parser.add_argument("--first-byte-delay", type=float, default=0.3, help="turn end to first reply audio, seconds")
+    parser.add_argument("--chunk-bytes", type=int, default=3840, help="bytes of 24 kHz audio per Live message")
+    parser.add_argument("--send-rate", type=float, default=2.0, help="reply audio sent per second, in seconds (0: at once)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay per message, up to this many seconds")
+    parser.add_argument("--turn-complete-delay", type=float, default=0.0)
+    parser.add_argument("--rpc-ms", type=float, default=20.0, help="PlayStream duration of the fake robot")
+    parser.add_argument("--speaker-latency-ms", type=float, default=50.0, help="hand-over to sound on the fake robot")
+    parser.add_argument("--overlap", action="store_true",
+                        help="start the next turn once the reply is received, while it still plays")
+    parser.add_argument("--log", help="also append the tracer records to this JSONL file")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
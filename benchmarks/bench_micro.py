@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the per-packet and per-block work, for catching regressions on PC2.
+
+Every case calls one function on one input size over and over and times each
+call. Printed per case, one JSON line: calls, p50/p95/mean microseconds per call
+and, for audio, how many times faster than real time (audio seconds / mean time).
+The first line describes the host (machine, Python, numpy, scipy, vosk), so
+results from the aarch64 PC2 and a laptop are not mixed up.
+
+Groups (`--only` runs a subset):
+- resample: array_resample() of the chatbot scripts vs StreamingResampler, on
+  24 kHz blocks from a small Live message up to the 72000-byte accumulator;
+- energy: the mean-square silence check record_until_silence() used, the framed
+  energy/zero-crossing features, EnergyGate and Endpointer, per mic read;
+- vosk: KaldiRecognizer.AcceptWaveform (full model and the wake-word grammar)
+  per mic read, i.e. per CHUNK of the scripts. Skipped if libvosk or the model
+  cannot be loaded;
+- json: json.loads of Vosk Result()/PartialResult() strings with word timings,
+  plus TimedRecognizer.annotate();
+- play: cutting a reply into PlayStream chunks, as play_pcm_stream() did
+  (bytes() of the whole reply, then one slice per chunk), vs the memoryview
+  chunks PlayoutEngine sends from a pooled block.
+
+Mic reads follow the scripts: CHUNK = 8192 reads 4096 samples (g1, vad,
+repeater), 5120 reads 5120 (flash), 1024 reads 1024 (controller).
+
+With `--baseline` the p50 of every case is compared with an earlier run (its
+output saved to a file); a case slower by more than `--tolerance` is marked
+"regression" and the run exits non-zero.
+
+    python3 benchmarks/bench_micro.py > pc2.jsonl
+    python3 benchmarks/bench_micro.py --baseline pc2.jsonl --tolerance 0.25
+    python3 benchmarks/bench_micro.py --only vosk,energy --min-time 2
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from pcm_buffer import PcmBuffer  # noqa: E402
+from resampler import StreamingResampler  # noqa: E402
+from vad import Endpointer, EnergyGate, frame_features  # noqa: E402
+
+MIC_RATE = 16000
+IN_RATE = 24000
+OUT_RATE = 16000
+CHUNK_SIZE = 96000
+# CHUNK of the scripts -> samples per mic read
+CHUNKS = {8192: 4096, 5120: 5120, 1024: 1024}
+# 24 kHz reply blocks: 10 ms, a 3840-byte Live message, 0.25 s, the 72000-byte accumulator
+RESAMPLE_BLOCKS = (240, 1920, 6000, 36000)
+REPLY_SECONDS = (2.0, 10.0, 30.0)
+GROUPS = ("resample", "energy", "vosk", "json", "play")
+
+
+def array_resample(array: bytearray, in_rate: int, out_rate: int):
+    """The per-block resampler of the chatbot scripts."""
+    factor = math.gcd(in_rate, out_rate)
+    up = out_rate // factor
+    down = in_rate // factor
+    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
+    y = signal.resample_poly(x, up, down)
+    return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def mean_square(data: bytes) -> float:
+    """The silence check of record_until_silence() before the Endpointer."""
+    audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    return np.mean(audio_data ** 2)
+
+
+def pcm_stream_chunks(pcm_list, chunk_size: int = CHUNK_SIZE) -> int:
+    """play_pcm_stream()'s slicing, without PlayStream and the prints."""
+    pcm_data = bytes(pcm_list)
+    offset = 0
+    total_size = len(pcm_data)
+    sent = 0
+    while offset < total_size:
+        current_chunk_size = min(chunk_size, total_size - offset)
+        chunk = pcm_data[offset:offset + current_chunk_size]
+        sent += len(chunk)
+        offset += current_chunk_size
+    return sent
+
+
+def block_chunks(block: PcmBuffer, chunk_size: int = CHUNK_SIZE) -> int:
+    """PlayoutEngine._send()'s slicing of a pooled block."""
+    data = block.bytes()
+    sent = 0
+    for offset in range(0, len(data), chunk_size):
+        sent += len(data[offset:offset + chunk_size])
+    return sent
+
+
+def speech(seconds: float, rate: int, seed: int = 0) -> np.ndarray:
+    """Speech-like int16 audio over a noise floor: harmonics with a syllable envelope, pauses between bursts."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    phase = 2 * np.pi * np.cumsum(160 + 30 * np.sin(2 * np.pi * 0.5 * t)) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.3)
+    x = 6000 * voice * envelope + rng.normal(0, 150, len(t))
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def vosk_result(words: int, partial: bool = False) -> str:
+    """A Vosk result string with word timings, as SetWords/SetPartialWords produce."""
+    entries = [{"conf": 0.93, "end": 0.42 * k + 0.38, "start": 0.42 * k, "word": "palabra"} for k in range(words)]
+    text = " ".join(e["word"] for e in entries)
+    if partial:
+        return json.dumps({"partial": text, "partial_result": entries}, indent=2)
+    return json.dumps({"result": entries, "text": text}, indent=2)
+
+
+class Runner:
+    def __init__(self, min_time: float, max_calls: int, baseline: dict, tolerance: float):
+        self.min_time = min_time
+        self.max_calls = max_calls
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.regressions = []
+
+    def run(self, name: str, fn, inputs, audio_s: float | None = None, **params) -> dict:
+        """Time fn(x) for x cycling over `inputs` until min_time has passed (at least a few calls)."""
+        fn(inputs[0])    # warm-up: imports, caches, first allocations
+        times = []
+        start = time.perf_counter()
+        k = 0
+        while len(times) < self.max_calls and (len(times) < 5 or time.perf_counter() - start < self.min_time):
+            x = inputs[k % len(inputs)]
+            t0 = time.perf_counter_ns()
+            fn(x)
+            times.append(time.perf_counter_ns() - t0)
+            k += 1
+        us = np.array(times) / 1000.0
+        result = {"bench": "micro", "name": name, **params, "calls": len(us),
+                  "p50_us": round(float(np.median(us)), 2),
+                  "p95_us": round(float(np.percentile(us, 95)), 2),
+                  "mean_us": round(float(us.mean()), 2)}
+        if audio_s is not None:
+            result["x_realtime"] = round(audio_s / (us.mean() / 1e6), 1)
+        key = case_key(result)
+        if key in self.baseline:
+            before = self.baseline[key]["p50_us"]
+            result["baseline_p50_us"] = before
+            result["regression"] = bool(result["p50_us"] > before * (1 + self.tolerance))
+            if result["regression"]:
+                self.regressions.append(key)
+        print(json.dumps(result), flush=True)
+        return result
+
+
+def case_key(result: dict) -> str:
+    """What identifies a case across runs: the name and its parameters."""
+    skip = {"bench", "calls", "p50_us", "p95_us", "mean_us", "x_realtime", "baseline_p50_us", "regression"}
+    return json.dumps({k: v for k, v in result.items() if k not in skip}, sort_keys=True)
+
+
+def bench_resample(runner: Runner):
+    x = speech(60.0, IN_RATE)
+    for block in RESAMPLE_BLOCKS:
+        blocks = [x[i:i + block].tobytes() for i in range(0, len(x) - block + 1, block)][:200]
+        resampler = StreamingResampler(IN_RATE, OUT_RATE)
+        runner.run("resample/array_resample", lambda b: array_resample(b, IN_RATE, OUT_RATE), blocks,
+                   audio_s=block / IN_RATE, block=block)
+        runner.run("resample/streaming", resampler.process, blocks, audio_s=block / IN_RATE, block=block)
+
+
+def bench_energy(runner: Runner):
+    x = speech(60.0, MIC_RATE)
+    for chunk, samples in CHUNKS.items():
+        reads = [x[i:i + samples].tobytes() for i in range(0, len(x) - samples + 1, samples)]
+        gate = EnergyGate(rate=MIC_RATE)
+        endpointer = Endpointer(rate=MIC_RATE)
+        endpointer.calibrate(x[:MIC_RATE])
+
+        def endpoint(data):
+            if endpointer.process(data):
+                endpointer.reset()
+
+        audio_s = samples / MIC_RATE
+        runner.run("energy/mean_square", mean_square, reads, audio_s=audio_s, chunk=chunk)
+        runner.run("energy/frame_features", lambda d: frame_features(np.frombuffer(d, dtype=np.int16), MIC_RATE),
+                   reads, audio_s=audio_s, chunk=chunk)
+        runner.run("energy/gate", gate.process, reads, audio_s=audio_s, chunk=chunk)
+        runner.run("energy/endpointer", endpoint, reads, audio_s=audio_s, chunk=chunk)
+
+
+def load_vosk(model_path: str):
+    """(Model, TimedRecognizer) or a reason why not."""
+    try:
+        from vosk import Model, SetLogLevel
+        from vosk_stt import TimedRecognizer
+        SetLogLevel(-1)
+        return Model(model_path), TimedRecognizer
+    except Exception as e:      # no libvosk for this platform, missing model, ...
+        return None, f"{type(e).__name__}: {e}"
+
+
+def bench_vosk(runner: Runner, model_path: str):
+    model, recognizer_class = load_vosk(model_path)
+    if model is None:
+        print(json.dumps({"bench": "micro", "name": "vosk", "skipped": recognizer_class}), flush=True)
+        return
+    x = speech(60.0, MIC_RATE)
+    for chunk, samples in CHUNKS.items():
+        reads = [x[i:i + samples].tobytes() for i in range(0, len(x) - samples + 1, samples)]
+        for mode, keywords in (("lm", None), ("grammar", ["robot", "adios"])):
+            rec = recognizer_class(model, MIC_RATE, keywords=keywords)
+            runner.run(f"vosk/accept_{mode}", rec.AcceptWaveform, reads, audio_s=samples / MIC_RATE, chunk=chunk)
+
+
+def bench_json(runner: Runner, model_path: str):
+    cases = [("partial", vosk_result(3, partial=True))] + [(f"final_{n}", vosk_result(n)) for n in (1, 8, 40)]
+    for kind, text in cases:
+        runner.run("json/loads", json.loads, [text], kind=kind, bytes=len(text))
+    model, recognizer_class = load_vosk(model_path)
+    if model is None:
+        return
+    rec = recognizer_class(model, MIC_RATE)
+    rec.AcceptWaveform(bytes(2 * MIC_RATE * 20), 0)
+    for kind, text in cases:
+        runner.run("json/loads_annotate", lambda t: rec.annotate(json.loads(t)), [text], kind=kind, bytes=len(text))
+
+
+def bench_play(runner: Runner):
+    for seconds in REPLY_SECONDS:
+        pcm = speech(seconds, OUT_RATE)
+        # the scripts accumulated reply audio in a bytearray
+        reply = bytearray(pcm.tobytes())
+        block = PcmBuffer(len(pcm))
+        block.append(pcm)
+        runner.run("play/bytes_slices", pcm_stream_chunks, [reply], audio_s=seconds, reply_s=seconds)
+        runner.run("play/memoryview", block_chunks, [block], audio_s=seconds, reply_s=seconds)
+
+
+def host_info() -> dict:
+    info = {"bench": "micro_host", "machine": platform.machine(), "system": platform.system(),
+            "python": platform.python_version(), "numpy": np.__version__}
+    import scipy
+    info["scipy"] = scipy.__version__
+    try:
+        sys.path.append(os.path.join(ROOT, "vendor"))
+        import vosk
+        info["vosk"] = getattr(vosk, "__version__", "unknown")
+    except Exception as e:
+        info["vosk"] = f"unavailable ({type(e).__name__})"
+    return info
+
+
+def load_baseline(path: str | None) -> dict:
+    if path is None:
+        return {}
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            result = json.loads(line)
+            if result.get("bench") == "micro" and "p50_us" in result:
+                baseline[case_key(result)] = result
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma separated subset of {','.join(GROUPS)}")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent per case")
+    parser.add_argument("--max-calls", type=int, default=20000)
+    parser.add_argument("--model", default=os.path.join(ROOT, "vosk-model-small-es-0.42"))
+    parser.add_argument("--baseline", help="earlier output of this benchmark to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+    groups = [g for g in args.only.split(",") if g]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s) {', '.join(sorted(unknown))}")
+
+    print(json.dumps(host_info()), flush=True)
+    runner = Runner(args.min_time, args.max_calls, load_baseline(args.baseline), args.tolerance)
+    if "resample" in groups:
+        bench_resample(runner)
+    if "energy" in groups:
+        bench_energy(runner)
+    if "vosk" in groups:
+        bench_vosk(runner, args.model)
+    if "json" in groups:
+        bench_json(runner, args.model)
+    if "play" in groups:
+        bench_play(runner)
+
+    if args.baseline:
+        print(json.dumps({"bench": "micro_summary", "baseline": args.baseline, "tolerance": args.tolerance,
+                          "regressions": runner.regressions}))
+    sys.exit(1 if runner.regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
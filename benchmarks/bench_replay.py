@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Mic recordings: record, replay at N times real time, process with the VAD stages.
+
+Without --recording a plant-like session is made up: compressor hum and noise
+with bursts of speech, in 512-sample packets every 32 ms with arrival jitter,
+saved with MicRecorder exactly as MicCapture would record the multicast stream.
+
+The recording is then replayed into a MicCapture through ReplaySource at each of
+`--speeds` (0: unpaced) while a reader consumes it through a CaptureCursor, the
+way the wake-word stage does: EnergyGate on every chunk and the Endpointer on
+what the gate lets through. The replayed capture is itself recorded again.
+
+Reported per speed: wall time, achieved speed, reader overruns, gate openings
+and duty cycle, turns the endpointer closed. The run fails if the ring or the
+re-recording does not hold exactly the recorded samples, if the gate results
+differ between speeds, or if a paced replay (speed > 0) falls behind.
+
+    python3 benchmarks/bench_replay.py --seconds 600 --speeds 60,0
+    python3 benchmarks/bench_replay.py --recording plant.g1mic --speeds 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from mic_capture import MicCapture  # noqa: E402
+from mic_sources import MicRecorder, ReplaySource, read_recording, recording_info  # noqa: E402
+from vad import Endpointer, EnergyGate  # noqa: E402
+
+RATE = 16000
+PACKET = 512
+READ_SAMPLES = 4096     # CHUNK // 2 of the scripts
+
+
+def make_recording(path: str, seconds: float, seed: int = 0):
+    """Compressor noise with speech bursts, recorded packet by packet with jittered arrival times."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * RATE) // PACKET * PACKET
+    t = np.arange(n) / RATE
+    x = 300 * np.sin(2 * np.pi * 50 * t) + 150 * np.sin(2 * np.pi * 100 * t) + rng.normal(0, 200, n)
+    # a 1-3 s utterance every 6-12 s
+    start = 2.0
+    while start < seconds - 3:
+        length = rng.uniform(1, 3)
+        i, j = int(start * RATE), int((start + length) * RATE)
+        tt = t[i:j] - start
+        f0 = rng.uniform(120, 240)
+        phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.2 * np.sin(2 * np.pi * 0.7 * tt))) / RATE
+        speech = sum(np.sin(k * phase) / k for k in range(1, 8))
+        x[i:j] += 4000 * speech * (0.2 + 0.8 * np.clip(np.sin(2 * np.pi * 2.5 * tt), 0, None))
+        start += length + rng.uniform(6, 12)
+    pcm = np.clip(x, -32768, 32767).astype(np.int16)
+
+    recorder = MicRecorder(path, RATE)
+    for k in range(0, n, PACKET):
+        arrival = 1000.0 + (k + PACKET) / RATE + rng.uniform(0, 0.004)
+        recorder.write(pcm[k:k + PACKET].tobytes(), arrival)
+    recorder.close()
+
+
+async def replay(path: str, speed: float, expected: np.ndarray) -> dict:
+    rerecorded = tempfile.NamedTemporaryFile(suffix=".g1mic", delete=False).name
+    source = ReplaySource(path, speed=speed)
+    # a ring long enough to compare the whole replay afterwards
+    capture = MicCapture(rate=RATE, seconds=len(expected) / RATE + 1, source=source, record=rerecorded)
+    gate = EnergyGate(rate=RATE)
+    endpointer = Endpointer(rate=RATE)
+    endpointer.calibrate(expected[:RATE])
+    cursor = capture.cursor(0)
+    turns = 0
+
+    t0 = time.monotonic()
+    await capture.start()
+    # whole frames only, so the gate sees the same chunks whatever the replay speed
+    while not (source.done.is_set() and cursor.available() < READ_SAMPLES):
+        if not await capture.wait_for(cursor.pos + READ_SAMPLES - 1, timeout=0.1):
+            continue
+        data = cursor.read_available(READ_SAMPLES)
+        if gate.process(data):
+            if endpointer.process(data):
+                turns += 1
+                endpointer.reset()
+        elif endpointer.speech_frames:
+            endpointer.reset()
+    wall = time.monotonic() - t0
+    ring = capture.read(0, capture.write_pos)
+    await capture.close()
+
+    again = np.frombuffer(b"".join(d for _, d in read_recording(rerecorded)), dtype=np.int16)
+    os.unlink(rerecorded)
+    audio_s = len(expected) / RATE
+    return {
+        "bench": "replay",
+        "speed": speed,
+        "audio_s": round(audio_s, 1),
+        "wall_s": round(wall, 2),
+        "achieved_speed": round(audio_s / wall, 1),
+        "overruns": cursor.overruns,
+        "gate_openings": gate.openings,
+        "gate_duty": round(gate.duty_cycle, 3),
+        "turns": turns,
+        "ring_matches": bool(len(ring) == len(expected) and np.array_equal(ring, expected)),
+        "rerecording_matches": bool(len(again) == len(expected) and np.array_equal(again, expected)),
+    }
+
+
+async def main_async(args) -> bool:
+    path = args.recording
+    if path is None:
+        path = tempfile.NamedTemporaryFile(suffix=".g1mic", delete=False).name
+        make_recording(path, args.seconds)
+    info = recording_info(path)
+    expected = np.frombuffer(b"".join(d for _, d in read_recording(path)), dtype=np.int16)
+    print(json.dumps({"bench": "replay_recording", "path": path if args.recording else None,
+                      "bytes": os.path.getsize(path), **info}), flush=True)
+
+    ok = True
+    gates = set()
+    for speed in (float(s) for s in args.speeds.split(",")):
+        r = await replay(path, speed, expected)
+        print(json.dumps(r), flush=True)
+        ok &= r["ring_matches"] and r["rerecording_matches"]
+        ok &= speed == 0 or r["overruns"] == 0
+        gates.add((r["gate_openings"], r["turns"]))
+    ok &= len(gates) == 1
+    if args.recording is None:
+        os.unlink(path)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=120.0, help="length of the made-up session")
+    parser.add_argument("--recording", help="replay this recording instead (mic_sources.py record)")
+    parser.add_argument("--speeds", default="10,100,0", help="replay speeds, multiples of real time (0: unpaced)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
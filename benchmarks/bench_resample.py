@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+24 kHz -> 16 kHz playback resampling: array_resample() per block vs StreamingResampler.
+
+The reply audio is cut into blocks the size of a Live message and resampled
+(a) block by block with the array_resample() the chatbot scripts used,
+(b) block by block with StreamingResampler, and
+(c) in one call with resample_poly as the reference.
+
+Reported per method: CPU time per second of audio and the largest deviation from
+the one-shot reference (block edges show up there as clicks). The run fails if
+the streaming output differs from the one-shot output by more than 1 LSB.
+
+    python3 benchmarks/bench_resample.py --seconds 60 --block 1920
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from resampler import StreamingResampler  # noqa: E402
+
+IN_RATE = 24000
+OUT_RATE = 16000
+
+
+def array_resample(array: bytearray, in_rate: int, out_rate: int):
+    """The per-block resampler of the chatbot scripts."""
+    factor = math.gcd(in_rate, out_rate)
+    up = out_rate // factor
+    down = in_rate // factor
+    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
+    y = signal.resample_poly(x, up, down)
+    return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def test_signal(seconds: float) -> np.ndarray:
+    """Speech-like test audio: a few harmonics with a syllable envelope plus noise."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * IN_RATE)) / IN_RATE
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / IN_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    x = 6000 * voice * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 300, len(t))
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def blocks_of(x: np.ndarray, block: int) -> list[bytes]:
+    return [x[i:i + block].tobytes() for i in range(0, len(x), block)]
+
+
+def run(name: str, fn, audio_s: float, reference: np.ndarray, repeat: int) -> tuple[dict, np.ndarray]:
+    best = None
+    for _ in range(repeat):
+        t0 = time.process_time()
+        y = fn()
+        cpu = time.process_time() - t0
+        best = cpu if best is None else min(best, cpu)
+    n = min(len(y), len(reference))
+    err = int(np.abs(y[:n].astype(np.int32) - reference[:n].astype(np.int32)).max()) if n else 0
+    return {
+        "bench": "resample",
+        "method": name,
+        "samples_out": len(y),
+        "cpu_ms_per_audio_s": round(1000 * best / audio_s, 4),
+        "max_abs_diff_vs_oneshot": err,
+    }, y
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0, help="seconds of 24 kHz audio")
+    parser.add_argument("--block", type=int, default=1920, help="samples per Live message (1920 = 80 ms)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per method, the fastest is reported")
+    args = parser.parse_args()
+
+    x = test_signal(args.seconds)
+    blocks = blocks_of(x, args.block)
+    reference = array_resample(x.tobytes(), IN_RATE, OUT_RATE)
+    resampler = StreamingResampler(IN_RATE, OUT_RATE)
+
+    def legacy():
+        return np.concatenate([array_resample(b, IN_RATE, OUT_RATE) for b in blocks])
+
+    def streaming():
+        out = [resampler.process(b) for b in blocks]
+        out.append(resampler.flush())
+        return np.concatenate(out)
+
+    def streaming_oneshot():
+        return np.concatenate([resampler.process(x), resampler.flush()])
+
+    results = []
+    for name, fn in (("array_resample_per_block", legacy), ("streaming_per_block", streaming),
+                     ("streaming_oneshot", streaming_oneshot)):
+        result, y = run(name, fn, args.seconds, reference, args.repeat)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    stream = streaming()
+    oneshot = streaming_oneshot()
+    ok = len(stream) == len(oneshot) == len(reference) and \
+        int(np.abs(stream.astype(np.int32) - oneshot.astype(np.int32)).max()) <= 1
+    print(json.dumps({"bench": "resample_check", "streaming_matches_oneshot": ok,
+                      "length": len(stream), "reference_length": len(reference)}))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+LiveSession against the Live stand-in: pre-warming, GoAway, dropped connections.
+
+1. prewarm: `--conversations` times, the user wakes the robot after some idle time
+   and says one turn. Either the connection is opened at the wake word (what a
+   script restarted after a dropped socket does) or a LiveSession entered at
+   startup is already connected. Reported: wake to first reply audio, p50/p95.
+   The stand-in takes `--setup-delay` to set a connection up, as TLS plus the
+   Live setup do.
+
+2. churn: `--turns` turns over one LiveSession while the stand-in sends a GoAway
+   `--go-away-after` seconds into every connection (closing it `--go-away-notice`
+   later) and cuts the connection without a close frame in the middle of the
+   reply of the turns in `--drop-turns`. Every turn streams `--speech-seconds`
+   of audio in real time with activity_start/activity_end and reads the reply.
+   Reported: the session metrics (reconnects, resumed, reconnect times, cold
+   turns) plus what the stand-in saw.
+
+3. hibernate: a LiveSession with `--idle-timeout` and idle periods longer than
+   that before every conversation, so it closes the connection each time. The
+   user says the wake word (`--wake-word-seconds`), the recognizer confirms it
+   `--decode-delay` later and the turn is sent from then on. The reopen is
+   started by the first audio sent ("on_send"), by wake() on the keyword's
+   partial result, which with the grammar is the confirmation itself
+   ("keyword"), or by wake() when the energy gate opens, one `--gate-delay` after
+   the onset ("gate", what the wake word scripts do). Reported: confirmation to
+   first reply audio, how far ahead of the confirmation wake() came, cold turns,
+   reopen times and the share of the run spent connected.
+
+The run fails if a turn does not get the whole reply, if the audio of a turn
+whose connection was cut does not reach the new connection complete, if a
+reconnect or reopen loses the context (no resumption), if the session does not
+hibernate in every idle period, or if the gate reopen leaves a turn waiting
+although it comes earlier than the setup takes.
+
+    python3 benchmarks/bench_session.py --turns 12 --go-away-after 4 --drop-turns 2,7
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from standin import MIC_RATE, LiveStandIn, make_client, voice
+from live_session import LiveSession
+
+FRAME_SAMPLES = 4096
+CONFIG = {"response_modalities": ["AUDIO"],
+          "realtime_input_config": {"automatic_activity_detection": {"disabled": True}}}
+
+
+async def speak(session, seconds: float, seed: int):
+    pcm = voice(seconds, MIC_RATE, f0=220, level_db=-26, seed=seed)
+    await session.send_realtime_input(activity_start={})
+    t0 = time.monotonic()
+    for i in range(0, len(pcm), 2 * FRAME_SAMPLES):
+        frame = pcm[i:i + 2 * FRAME_SAMPLES]
+        await asyncio.sleep(max(0.0, t0 + (i + len(frame)) / 2 / MIC_RATE - time.monotonic()))
+        await session.send_realtime_input(audio={"data": frame, "mime_type": f"audio/pcm;rate={MIC_RATE}"})
+    await session.send_realtime_input(activity_end={})
+    return len(pcm) // 2
+
+
+async def hear(session) -> tuple[int, float | None, int]:
+    """Reply bytes, time of the first audio and how often the reply was interrupted (and restarted)."""
+    nbytes = 0
+    first = None
+    restarts = 0
+    async for resp in session.receive():
+        sc = resp.server_content
+        if not sc:
+            continue
+        if sc.interrupted:
+            nbytes = 0
+            restarts += 1
+        if sc.model_turn:
+            for part in sc.model_turn.parts:
+                if part.inline_data and part.inline_data.data:
+                    first = first or time.monotonic()
+                    nbytes += len(part.inline_data.data)
+    return nbytes, first, restarts
+
+
+def ms(values) -> list[int]:
+    return [round(1000 * float(np.percentile(values, q))) for q in (50, 95)]
+
+
+async def prewarm(args, reply: bytes) -> bool:
+    server = LiveStandIn(reply=reply, first_byte_delay=args.first_byte_delay, send_rate=0.0,
+                         setup_delay=args.setup_delay)
+    results = {}
+    async with server.running() as port:
+        client = make_client(port)
+        on_demand = []
+        for k in range(args.conversations):
+            await asyncio.sleep(args.idle)
+            wake = time.monotonic()
+            async with client.aio.live.connect(model="stand-in", config=CONFIG) as session:
+                await speak(session, args.speech_seconds, seed=k)
+                _, first, _ = await hear(session)
+            on_demand.append(first - wake)
+
+        warm = []
+        async with LiveSession(client, "stand-in", CONFIG) as session:
+            for k in range(args.conversations):
+                await asyncio.sleep(args.idle)
+                wake = time.monotonic()
+                await speak(session, args.speech_seconds, seed=k)
+                _, first, _ = await hear(session)
+                warm.append(first - wake)
+            results["cold_turns"] = session.cold_turns
+    print(json.dumps({"bench": "session_prewarm", "setup_delay": args.setup_delay,
+                      "conversations": args.conversations, "speech_s": args.speech_seconds,
+                      "connect_at_wake_p50_p95_ms": ms(on_demand), "prewarmed_p50_p95_ms": ms(warm),
+                      "prewarmed_cold_turns": results["cold_turns"]}))
+    return results["cold_turns"] == 0
+
+
+async def churn(args, reply: bytes) -> bool:
+    drop_turns = [int(t) for t in args.drop_turns.split(",") if t]
+    # the stand-in counts the resent turns too: shift the later drops by the earlier ones
+    server = LiveStandIn(reply=reply, first_byte_delay=args.first_byte_delay, send_rate=args.send_rate,
+                         setup_delay=args.setup_delay, go_away_after=args.go_away_after,
+                         go_away_notice=args.go_away_notice,
+                         drop_turns=[t + k for k, t in enumerate(sorted(drop_turns))])
+    ok = True
+    async with server.running() as port:
+        async with LiveSession(make_client(port), "stand-in", CONFIG) as session:
+            for k in range(args.turns):
+                samples = await speak(session, args.speech_seconds, seed=k)
+                nbytes, _, restarts = await hear(session)
+                turn_ok = nbytes == len(reply)
+                ok &= turn_ok
+                heard = [t for t in server.all_turns if not t.get("dropped")][-1]
+                ok &= heard["turn_samples"] == samples
+                print(json.dumps({"bench": "session_turn", "turn": k, "reply_complete": turn_ok,
+                                  "restarted": restarts, "server_turn_samples": heard["turn_samples"],
+                                  "samples": samples, "connected": session.connected}), flush=True)
+                await asyncio.sleep(args.idle)
+            metrics = session.metrics()
+    ok &= server.drops == len(drop_turns)
+    ok &= metrics["fresh"] == 0 and server.refused == 0
+    print(json.dumps({"bench": "session_churn", "turns": args.turns, "go_away_after": args.go_away_after,
+                      "server": {"connections": server.connections, "resumed": server.resumed,
+                                 "refused": server.refused, "go_aways": server.go_aways, "drops": server.drops},
+                      **metrics, "ok": bool(ok)}))
+    return ok
+
+
+async def hibernate(args, reply: bytes) -> bool:
+    server = LiveStandIn(reply=reply, first_byte_delay=args.first_byte_delay, send_rate=0.0,
+                         setup_delay=args.setup_delay)
+    ok = True
+    async with server.running() as port:
+        client = make_client(port)
+        confirm_after = args.wake_word_seconds + args.decode_delay
+        for mode in ("on_send", "keyword", "gate"):
+            latency = []
+            leads = []
+            hibernated = 0
+            t0 = time.monotonic()
+            async with LiveSession(client, "stand-in", CONFIG, idle_timeout=args.idle_timeout) as session:
+                await session.wait_ready()
+                for k in range(args.conversations):
+                    await asyncio.sleep(args.idle_timeout + args.idle)
+                    hibernated += session.hibernating
+                    onset = time.monotonic()
+                    woke = None
+                    if mode == "gate":
+                        # the first chunk with speech in it opens the gate
+                        await asyncio.sleep(args.gate_delay)
+                        woke = time.monotonic()
+                        session.wake()
+                    await asyncio.sleep(max(0.0, onset + confirm_after - time.monotonic()))
+                    if mode == "keyword":
+                        woke = time.monotonic()
+                        session.wake()
+                    confirmed = time.monotonic()
+                    if woke is not None:
+                        leads.append(confirmed - woke)
+                    await speak(session, args.speech_seconds, seed=k)
+                    nbytes, first, _ = await hear(session)
+                    ok &= nbytes == len(reply)
+                    latency.append(first - confirmed)
+                m = session.metrics()
+            elapsed = time.monotonic() - t0
+            ok &= hibernated == args.conversations and m["fresh"] == 0
+            if mode == "gate" and confirm_after - args.gate_delay > args.setup_delay:
+                ok &= m["cold_turns"] == 0
+            print(json.dumps({"bench": "session_hibernate", "reopen": mode, "idle_timeout": args.idle_timeout,
+                              "wake_lead_ms": ms(leads)[0] if leads else None, "setup_delay": args.setup_delay,
+                              "confirm_to_first_audio_p50_p95_ms": ms(latency), "hibernated": hibernated,
+                              "cold_turns": m["cold_turns"], "cold_wait_s": m["cold_wait_s"],
+                              "reopen_p50_p95_ms": m["reopen_p50_p95_ms"], "resumed": m["resumed"],
+                              "connected_share": round(m["connected_s"] / elapsed, 2)}), flush=True)
+    return ok
+
+
+async def main_async(args) -> bool:
+    reply = voice(args.reply_seconds)
+    ok = await prewarm(args, reply)
+    ok &= await churn(args, reply)
+    ok &= await hibernate(args, reply)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--speech-seconds", type=float, default=1.0)
+    parser.add_argument("--reply-seconds", type=float, default=1.0)
+    parser.add_argument("--idle", type=float, default=0.5, help="seconds between turns")
+    parser.add_argument("--setup-delay", type=float, default=0.3, help="stand-in connection setup time")
+    parser.add_argument("--first-byte-delay", type=float, default=0.2)
+    parser.add_argument("--send-rate", type=float, default=2.0)
+    parser.add_argument("--go-away-after", type=float, default=4.0)
+    parser.add_argument("--go-away-notice", type=float, default=2.0)
+    parser.add_argument("--drop-turns", default="2,6", help="turns whose connection is cut during the reply")
+    parser.add_argument("--idle-timeout", type=float, default=1.0, help="hibernate after this long without traffic")
+    parser.add_argument("--wake-word-seconds", type=float, default=0.5, help="how long saying the wake word takes")
+    parser.add_argument("--decode-delay", type=float, default=0.15,
+                        help="end of the wake word to the recognizer's result, seconds")
+    parser.add_argument("--gate-delay", type=float, default=0.064,
+                        help="speech onset to the gate opening (one mic packet), seconds")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+All-day soak of one LiveSession against the Live stand-in, time-compressed.
+
+`--hours` of use with a turn every `--turn-every` seconds are played back to
+back: every turn sends `--speech-seconds` of audio at once (activity_start,
+audio, activity_end) and reads a `--reply-seconds` reply, `--gap` wall seconds
+apart. What grows with the hours is the session context, not the wall time: the
+stand-in counts its tokens (25 per second of audio) and delays the first reply
+audio by `--context-delay` seconds per 1000 tokens. Without compression a session
+ends once it carries `--session-limit` seconds of audio. Connections get a
+GoAway every `--go-away-after` wall seconds, so the context has to survive
+resumption as well.
+
+Modes (`--modes`):
+  plain     the config as the scripts had it: the context grows until the
+            session limit ends the session, and the conversation starts over;
+  compress  long_running(): sliding-window compression (`--trigger-tokens`
+            down to `--target-tokens`) and transcription;
+  rotate    transcription only, and a fresh session seeded with a summary of
+            the transcript every `--rotate-after` seconds of audio;
+  both      compression and rotation, as the scripts run.
+
+Reported per mode: end of activity to first reply audio per simulated hour
+(p50/p95 ms), largest context per hour, session limits hit, sessions that lost
+the context, rotations and the LiveSession metrics. The run fails if a reply is
+incomplete or, in any mode but plain, if a session hits the limit, loses its
+context, or a later hour's p50 is more than `--tolerance` above the slowest of
+the first two hours (latency not flat; the p95 is reported too, at these delays
+it is mostly host noise).
+
+    python3 benchmarks/bench_soak.py --hours 8 --modes compress,both
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from standin import MIC_RATE, LiveStandIn, make_client, voice
+from live_session import LiveSession, long_running
+
+FRAME_SAMPLES = 4096
+CONFIG = {"response_modalities": ["AUDIO"],
+          "realtime_input_config": {"automatic_activity_detection": {"disabled": True}}}
+
+
+async def turn(session, speech: bytes) -> tuple[int, float | None]:
+    """One turn with the audio sent at once; reply bytes and end of activity to first audio."""
+    await session.send_realtime_input(activity_start={})
+    for i in range(0, len(speech), 2 * FRAME_SAMPLES):
+        await session.send_realtime_input(audio={"data": speech[i:i + 2 * FRAME_SAMPLES],
+                                                 "mime_type": f"audio/pcm;rate={MIC_RATE}"})
+    await session.send_realtime_input(activity_end={})
+    t0 = time.monotonic()
+    nbytes = 0
+    first = None
+    async for resp in session.receive():
+        sc = resp.server_content
+        if sc and sc.interrupted:
+            nbytes = 0
+        if sc and sc.model_turn:
+            for part in sc.model_turn.parts:
+                if part.inline_data and part.inline_data.data:
+                    first = first or time.monotonic() - t0
+                    nbytes += len(part.inline_data.data)
+    return nbytes, first
+
+
+def session_args(mode: str, args) -> tuple[dict, dict]:
+    if mode == "plain":
+        return CONFIG, {}
+    if mode == "rotate":
+        config = dict(CONFIG, input_audio_transcription={}, output_audio_transcription={})
+        return config, {"rotate_after": args.rotate_after}
+    config = long_running(CONFIG, args.trigger_tokens, args.target_tokens)
+    return config, {"rotate_after": args.rotate_after} if mode == "both" else {}
+
+
+async def soak(mode: str, args, speech: bytes, reply: bytes) -> bool:
+    server = LiveStandIn(reply=reply, first_byte_delay=args.first_byte_delay, send_rate=0.0,
+                         setup_delay=args.setup_delay, go_away_after=args.go_away_after,
+                         go_away_notice=args.go_away_notice, context_delay=args.context_delay,
+                         session_limit=args.session_limit)
+    per_hour = round(3600 / args.turn_every)
+    turns = round(args.hours * per_hour)
+    latency = []
+    complete = True
+    t0 = time.monotonic()
+    config, kwargs = session_args(mode, args)
+    async with server.running() as port:
+        async with LiveSession(make_client(port), "stand-in", config, **kwargs) as session:
+            for k in range(turns):
+                nbytes, first = await turn(session, speech)
+                complete &= nbytes == len(reply)
+                latency.append(first)
+                await asyncio.sleep(args.gap)
+            m = session.metrics()
+
+    hours = [slice(h * per_hour, (h + 1) * per_hour) for h in range(int(np.ceil(turns / per_hour)))]
+    p50 = [round(1000 * float(np.percentile(latency[h], 50))) for h in hours]
+    p95 = [round(1000 * float(np.percentile(latency[h], 95))) for h in hours]
+    context = [max(t["context_tokens"] for t in server.all_turns[h] or [{"context_tokens": 0}]) for h in hours]
+    ok = complete
+    flat = len(p50) < 3 or max(p50[2:]) <= max(p50[:2]) * (1 + args.tolerance)
+    if mode != "plain":
+        ok &= flat and server.limits == 0 and m["fresh"] == 0
+    if mode in ("rotate", "both"):
+        ok &= m["rotations"] > 0 and server.seeds == m["seeded"]
+    print(json.dumps({"bench": "soak", "mode": mode, "hours": args.hours, "turns": turns,
+                      "wall_s": round(time.monotonic() - t0, 1), "hourly_p50_ms": p50, "hourly_p95_ms": p95,
+                      "hourly_max_context_tokens": context, "flat": flat,
+                      "server": {"sessions": server.sessions, "connections": server.connections,
+                                 "resumed": server.resumed, "refused": server.refused,
+                                 "session_limits": server.limits, "compressions": server.compressions,
+                                 "seeds": server.seeds},
+                      "session": {key: m[key] for key in ("reconnects", "resumed", "fresh", "go_aways",
+                                                          "cold_turns", "rotations", "seeded")},
+                      "replies_complete": complete, "ok": bool(ok)}), flush=True)
+    return ok
+
+
+async def main_async(args) -> bool:
+    speech = voice(args.speech_seconds, MIC_RATE, f0=220, level_db=-26)
+    reply = voice(args.reply_seconds)
+    ok = True
+    for mode in args.modes.split(","):
+        ok &= await soak(mode, args, speech, reply)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="plain,compress,rotate,both")
+    parser.add_argument("--hours", type=float, default=8.0, help="simulated hours of use")
+    parser.add_argument("--turn-every", type=float, default=30.0, help="simulated seconds between turns")
+    parser.add_argument("--speech-seconds", type=float, default=4.0)
+    parser.add_argument("--reply-seconds", type=float, default=4.0)
+    parser.add_argument("--gap", type=float, default=0.02, help="wall seconds between turns")
+    parser.add_argument("--first-byte-delay", type=float, default=0.02)
+    parser.add_argument("--context-delay", type=float, default=0.01,
+                        help="stand-in: extra first-byte delay per 1000 tokens of context, seconds")
+    parser.add_argument("--session-limit", type=float, default=900.0,
+                        help="stand-in: seconds of audio a session without compression may carry")
+    parser.add_argument("--setup-delay", type=float, default=0.05)
+    parser.add_argument("--go-away-after", type=float, default=20.0, help="wall seconds into every connection")
+    parser.add_argument("--go-away-notice", type=float, default=2.0)
+    parser.add_argument("--trigger-tokens", type=int, default=16000)
+    parser.add_argument("--target-tokens", type=int, default=8000)
+    parser.add_argument("--rotate-after", type=float, default=600.0, help="seconds of audio per session")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
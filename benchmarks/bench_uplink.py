@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Uplink pacing policies against a local Live API stand-in.
+
+The Live API stand-in of benchmarks/standin.py replies with a short audio turn
+once it decides the user turn ended. With automatic activity detection on, it
+ends the turn from the audio itself (speech followed by `--server-silence` seconds
+of low energy, or audio_stream_end); with it disabled, at activityEnd.
+
+Each combination of turn end mode ("padding" / "activity") and pacing policy
+sends the same utterance through UplinkScheduler exactly as the chatbot scripts
+do, and checks that the server detected exactly one turn, after all the speech.
+
+    python3 benchmarks/bench_uplink.py --speech-seconds 3
+
+One JSON line is printed per run; the exit status is non-zero if a check failed.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from standin import LiveStandIn, make_client     # also puts the repo root and vendor/ on sys.path
+from uplink import POLICIES, UplinkScheduler, policy_for
+
+MIC_RATE = 16000
+FRAME_SAMPLES = 4096        # CHUNK // 2, what record_until_silence reads per frame
+PADDING_FRAMES = 6
+PADDING_SAMPLES = 8192      # silence_chunk() of the CHUNK = 8192 scripts
+REPLY_BYTES = 4800          # 100 ms of 24 kHz audio
+
+
+def utterance(seconds: float, turn_end: str) -> list[bytes]:
+    t = np.arange(int(seconds * MIC_RATE)) / MIC_RATE
+    voice = 8000 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    pcm = voice.astype(np.int16).tobytes()
+    frames = [pcm[i:i + 2 * FRAME_SAMPLES] for i in range(0, len(pcm), 2 * FRAME_SAMPLES)]
+    if turn_end == "padding":
+        frames.extend([bytes(2 * PADDING_SAMPLES)] * PADDING_FRAMES)
+    return frames
+
+
+async def run_one(server: LiveStandIn, port: int, turn_end: str, policy: str, args) -> dict:
+    config = {"response_modalities": ["AUDIO"]}
+    if turn_end == "activity":
+        config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
+    frames = utterance(args.speech_seconds, turn_end)
+
+    async with make_client(port).aio.live.connect(model="stand-in", config=config) as session:
+        uplink = UplinkScheduler(session, MIC_RATE, policy=policy, speedup=args.speedup)
+        t0 = time.monotonic()
+        if turn_end == "activity":
+            await session.send_realtime_input(activity_start={})
+        audio_s, send_s = await uplink.send_turn(frames)
+        if turn_end == "activity":
+            await session.send_realtime_input(activity_end={})
+        else:
+            await session.send_realtime_input(audio_stream_end=True)
+
+        first_audio = None
+        try:
+            async with asyncio.timeout(args.speech_seconds + 10):
+                async for resp in session.receive():
+                    sc = resp.server_content
+                    if first_audio is None and sc and sc.model_turn:
+                        first_audio = time.monotonic() - t0
+                    if sc and sc.turn_complete:
+                        break
+        except TimeoutError:
+            pass
+
+    sent = sum(len(f) // 2 for f in frames)
+    speech = int(args.speech_seconds * MIC_RATE)
+    ends = [turn["samples"] for turn in server.turns]
+    ok = len(ends) == 1 and speech <= ends[0] <= sent
+    return {
+        "bench": "uplink",
+        "turn_end": turn_end,
+        "policy": policy,
+        "default_for_mode": policy == policy_for(turn_end),
+        "audio_s": round(audio_s, 3),
+        "send_s": round(send_s, 3),
+        "first_audio_s": round(first_audio, 3) if first_audio is not None else None,
+        "turns_detected": len(ends),
+        "samples_at_turn_end": ends[0] if ends else None,
+        "speech_samples": speech,
+        "samples_sent": sent,
+        "ok": ok,
+    }
+
+
+async def main_async(args) -> bool:
+    server = LiveStandIn(reply=bytes(REPLY_BYTES), first_byte_delay=0.0, send_rate=0.0, silence=args.server_silence)
+    ok = True
+    async with server.running() as port:
+        for turn_end in args.turn_ends.split(","):
+            for policy in args.policies.split(","):
+                result = await run_one(server, port, turn_end, policy, args)
+                ok &= result["ok"]
+                print(json.dumps(result), flush=True)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--speech-seconds", type=float, default=3.0, help="length of the spoken part of the turn")
+    parser.add_argument("--speedup", type=float, default=4.0, help="speed of the accelerated policy")
+    parser.add_argument("--server-silence", type=float, default=0.5, help="silence the stand-in VAD needs to end a turn")
+    parser.add_argument("--turn-ends", default="padding,activity")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the two remote ends of the chatbot scripts, so the audio path
+can be measured off the robot and without network.
+
+LiveStandIn is a websocket server (the vendored `websockets`) that speaks enough
+of the Gemini Live protocol for genai.Client().aio.live.connect(): it answers the
+setup, collects realtime input and, once it decides a user turn ended, replies
+with scripted 24 kHz audio. With automatic activity detection on it ends the turn
+from the audio itself (speech followed by `silence` seconds of low energy, or
+audio_stream_end); with it disabled, at activityEnd. The reply timing is
+configurable: delay before the first audio message, message size, how fast the
+audio is sent relative to real time (with optional jitter) and the delay of
+turn_complete after the last audio. Every turn is logged in `turns` (current
+connection) and `all_turns`.
+
+Connection life can be scripted too: `setup_delay` before setupComplete (TLS and
+setup of a real connect), a GoAway `go_away_after` seconds into a connection
+followed by the close `go_away_notice` seconds later, and `drop_turns`: turn
+numbers (counted over all connections) whose connection is cut halfway through
+the reply. With session resumption requested in the setup, a
+sessionResumptionUpdate with a new handle follows every turnComplete; a handle
+the stand-in did not issue is refused.
+
+The session context is modeled in tokens: `tokens_per_second` for the audio of
+both sides, about one per 4 characters for clientContent text. Every 1000 tokens
+of context add `context_delay` seconds before the first reply audio, as a growing
+context slows the real model down. A resumed connection continues the context of
+its session. With contextWindowCompression in the setup, a context past the
+trigger is cut down to the sliding window target; without it, a session whose
+audio passes `session_limit` seconds is ended (close 1011) and its handles are
+refused from then on. Input/output transcriptions ("turn N ...") are sent when
+the setup asks for them.
+
+make_client() returns a genai.Client connected to it.
+
+FakeAudioClient replaces unitree_sdk2py's AudioClient. PlayStream blocks for
+`rpc` seconds like the DDS call and logs its timing; the audio is queued on a
+modeled speaker that starts `latency` after the hand-over and plays at `rate`, so
+time to first sound, underruns (the speaker ran dry within a stream) and when
+playback ends can be read back.
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, "vendor"))
+from google import genai  # noqa: E402
+from websockets.asyncio.server import serve  # noqa: E402
+from websockets.exceptions import ConnectionClosed  # noqa: E402
+
+MIC_RATE = 16000
+REPLY_RATE = 24000
+
+
+def b64decode(data: str) -> bytes:
+    # the SDK sends url-safe base64 without padding
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def make_client(port: int) -> genai.Client:
+    # Vertex mode without a project connects straight to a custom base_url; drop the
+    # SDK's TLS context so a plain ws:// URL is accepted
+    client = genai.Client(vertexai=True, http_options={"base_url": f"ws://127.0.0.1:{port}"})
+    client._api_client._websocket_ssl_ctx = {}
+    return client
+
+
+def voice(seconds: float, rate: int = REPLY_RATE, f0: float = 150.0, level_db: float = -16.0, seed: int = 1) -> bytes:
+    """Speech-like int16 PCM at `level_db` dBFS RMS: harmonics with a syllable envelope."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    f = f0 + 0.2 * f0 * np.sin(2 * np.pi * 0.7 * t + seed)
+    phase = 2 * np.pi * np.cumsum(f) / rate
+    x = sum(np.sin(k * phase) / k for k in range(1, 10))
+    x *= 0.2 + 0.8 * np.clip(np.sin(2 * np.pi * 2.5 * t + seed), 0, None)
+    x += 0.05 * rng.normal(0, 1, len(t))
+    x *= 32768 * 10 ** (level_db / 20) / np.sqrt(np.mean(x * x))
+    return np.clip(x, -32768, 32767).astype(np.int16).tobytes()
+
+
+class LiveStandIn:
+    """
+    Live API stand-in. `reply` is the 24 kHz int16 PCM of every reply, or a
+    callable(turn number) -> bytes. Turns of the current connection are in `turns`.
+    """
+
+    def __init__(self, reply=None, first_byte_delay: float = 0.3, chunk_bytes: int = 3840,
+                 send_rate: float = 2.0, jitter: float = 0.0, turn_complete_delay: float = 0.0,
+                 silence: float = 0.5, threshold_db: float = -40.0, seed: int = 0, setup_delay: float = 0.0,
+                 go_away_after: float | None = None, go_away_notice: float = 5.0, drop_turns=(),
+                 context_delay: float = 0.0, tokens_per_second: float = 25.0, session_limit: float | None = None):
+        self.reply = voice(2.0) if reply is None else reply
+        self.first_byte_delay = first_byte_delay
+        self.chunk_bytes = chunk_bytes
+        self.send_rate = send_rate          # seconds of reply audio sent per second (0: as fast as possible)
+        self.jitter = jitter                # extra random delay per message, up to this many seconds
+        self.turn_complete_delay = turn_complete_delay
+        self.silence = silence
+        self.threshold_db = threshold_db
+        self.rng = np.random.default_rng(seed)
+        self.setup_delay = setup_delay
+        self.go_away_after = go_away_after
+        self.go_away_notice = go_away_notice
+        self.drop_turns = set(drop_turns)
+        self.context_delay = context_delay      # seconds of extra first-byte delay per 1000 context tokens
+        self.tokens_per_second = tokens_per_second
+        self.session_limit = session_limit      # seconds of audio per session without compression
+        self.port = None
+        self.connections = 0
+        self.resumed = 0
+        self.refused = 0
+        self.go_aways = 0
+        self.drops = 0
+        self.handles = {}           # handle -> its session: {"id", "tokens", "audio_s", "ended"}
+        self.sessions = 0
+        self.compressions = 0
+        self.limits = 0             # sessions ended at session_limit
+        self.seeds = 0              # clientContent texts received
+        self.max_tokens = 0
+        self.turns = []
+        self.all_turns = []
+        self.samples = 0
+
+    @contextlib.asynccontextmanager
+    async def running(self, host: str = "127.0.0.1"):
+        """Serve on a free port for the duration of the block; yields the port."""
+        async with serve(self.handler, host, 0) as srv:
+            self.port = srv.sockets[0].getsockname()[1]
+            yield self.port
+
+    async def handler(self, ws):
+        setup = json.loads(await ws.recv()).get("setup", {})
+        ric = setup.get("realtimeInputConfig") or setup.get("realtime_input_config") or {}
+        aad = ric.get("automaticActivityDetection") or ric.get("automatic_activity_detection") or {}
+        server_vad = not aad.get("disabled", False)
+        resumption = setup.get("sessionResumption", setup.get("session_resumption"))
+        cwc = setup.get("contextWindowCompression") or setup.get("context_window_compression")
+        compression = None
+        if cwc:
+            window = cwc.get("slidingWindow") or cwc.get("sliding_window") or {}
+            compression = (int(cwc.get("triggerTokens", cwc.get("trigger_tokens"))),
+                           int(window.get("targetTokens", window.get("target_tokens"))))
+        transcribe = {side: f"{side}AudioTranscription" in setup or f"{side}_audio_transcription" in setup
+                      for side in ("input", "output")}
+        await asyncio.sleep(self.setup_delay)
+        if resumption and resumption.get("handle"):
+            session = self.handles.get(resumption["handle"])
+            if session is None or session["ended"]:
+                self.refused += 1
+                await ws.close(1008, "unknown session handle")
+                return
+            self.resumed += 1
+        else:
+            self.sessions += 1
+            session = {"id": self.sessions, "tokens": 0.0, "audio_s": 0.0, "ended": False}
+        await ws.send(json.dumps({"setupComplete": {}}))
+
+        self.connections += 1
+        self.turns = []
+        self.samples = 0
+        speech = False
+        quiet = 0
+        turn_start = 0
+        replying = None
+        lifetime = asyncio.create_task(self.go_away(ws)) if self.go_away_after is not None else None
+        try:
+            async for message in ws:
+                msg = json.loads(message)
+                cc = msg.get("clientContent") or msg.get("client_content") or {}
+                for turn in cc.get("turns") or []:
+                    for part in turn.get("parts") or []:
+                        if part.get("text"):
+                            self.seeds += 1
+                            self.add_context(session, len(part["text"]) / 4, compression)
+                ri = msg.get("realtimeInput") or msg.get("realtime_input") or {}
+                end = False
+                if "audio" in ri:
+                    pcm = np.frombuffer(b64decode(ri["audio"]["data"]), dtype=np.int16)
+                    self.samples += len(pcm)
+                    session["audio_s"] += len(pcm) / MIC_RATE
+                    self.add_context(session, len(pcm) / MIC_RATE * self.tokens_per_second, compression)
+                    if server_vad:
+                        db = 10 * np.log10(np.mean(pcm.astype(np.float32) ** 2) / 32768.0 ** 2 + 1e-10)
+                        if db > self.threshold_db:
+                            speech, quiet = True, 0
+                        elif speech:
+                            quiet += len(pcm)
+                            end = quiet >= self.silence * MIC_RATE
+                if "activityEnd" in ri or (server_vad and ri.get("audioStreamEnd", ri.get("audio_stream_end")) and speech):
+                    end = True
+                if end:
+                    speech, quiet = False, 0
+                    turn = {"turn": len(self.turns), "connection": self.connections, "samples": self.samples,
+                            "turn_samples": self.samples - turn_start, "end": time.monotonic()}
+                    turn_start = self.samples
+                    self.turns.append(turn)
+                    self.all_turns.append(turn)
+                    if replying is not None:
+                        await replying
+                    replying = asyncio.create_task(self.reply_turn(ws, turn, resumption is not None, session,
+                                                                   compression, transcribe))
+        except ConnectionClosed:
+            pass
+        finally:
+            if replying is not None:
+                replying.cancel()
+            if lifetime is not None:
+                lifetime.cancel()
+
+    async def go_away(self, ws):
+        await asyncio.sleep(self.go_away_after)
+        self.go_aways += 1
+        await ws.send(json.dumps({"goAway": {"timeLeft": f"{self.go_away_notice}s"}}))
+        await asyncio.sleep(self.go_away_notice)
+        await ws.close(1000, "session lifetime reached")
+
+    def add_context(self, session: dict, tokens: float, compression):
+        session["tokens"] += tokens
+        if compression is not None and session["tokens"] > compression[0]:
+            session["tokens"] = compression[1]
+            self.compressions += 1
+        self.max_tokens = max(self.max_tokens, session["tokens"])
+
+    async def reply_turn(self, ws, turn: dict, resumption: bool = False, session: dict | None = None,
+                         compression=None, transcribe=None):
+        pcm = self.reply(turn["turn"]) if callable(self.reply) else self.reply
+        drop = len(self.all_turns) - 1 in self.drop_turns
+        session = session or {"id": 0, "tokens": 0.0, "audio_s": 0.0, "ended": False}
+        turn["session"] = session["id"]
+        turn["context_tokens"] = round(session["tokens"])
+        n = len(self.all_turns) - 1
+        if transcribe and transcribe["input"]:
+            await ws.send(json.dumps({"serverContent": {"inputTranscription": {
+                "text": f"turn {n}: the user asks about compressor station {n % 7} and valve {n}"}}}))
+        await asyncio.sleep(self.first_byte_delay + self.context_delay * session["tokens"] / 1000)
+        t0 = time.monotonic()
+        turn["first_byte"] = t0
+        sent = 0
+        for offset in range(0, len(pcm), self.chunk_bytes):
+            if drop and offset >= len(pcm) // 2:
+                # the network goes: no close frame, the socket just dies
+                self.drop_turns.discard(len(self.all_turns) - 1)
+                self.drops += 1
+                turn["dropped"] = True
+                ws.transport.abort()
+                return
+            chunk = pcm[offset:offset + self.chunk_bytes]
+            if self.send_rate > 0:
+                delay = t0 + sent / 2 / REPLY_RATE / self.send_rate - time.monotonic()
+                if self.jitter > 0:
+                    delay += self.rng.uniform(0, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            data = base64.b64encode(chunk).decode()
+            await ws.send(json.dumps({"serverContent": {"modelTurn": {"parts": [
+                {"inlineData": {"mimeType": f"audio/pcm;rate={REPLY_RATE}", "data": data}}]}}}))
+            sent += len(chunk)
+        seconds = sent / 2 / REPLY_RATE
+        session["audio_s"] += seconds
+        self.add_context(session, seconds * self.tokens_per_second, compression)
+        if transcribe and transcribe["output"]:
+            await ws.send(json.dumps({"serverContent": {"outputTranscription": {
+                "text": f"turn {n}: valve {n} at station {n % 7} is checked"}}}))
+        await asyncio.sleep(self.turn_complete_delay)
+        await ws.send(json.dumps({"serverContent": {"turnComplete": True}}))
+        turn["complete"] = time.monotonic()
+        turn["reply_bytes"] = sent
+        if compression is None and self.session_limit is not None and session["audio_s"] > self.session_limit:
+            session["ended"] = True
+            self.limits += 1
+            await ws.close(1011, "session duration limit reached")
+            return
+        if resumption:
+            handle = f"handle-{len(self.handles)}"
+            self.handles[handle] = session
+            await ws.send(json.dumps({"sessionResumptionUpdate": {"newHandle": handle, "resumable": True}}))
+
+
+class FakeAudioClient:
+    """AudioClient stand-in with a modeled speaker; safe to call from the playout thread."""
+
+    def __init__(self, rate: int = MIC_RATE, rpc: float = 0.02, latency: float = 0.05):
+        self.rate = rate
+        self.rpc = rpc              # how long PlayStream blocks
+        self.latency = latency      # hand-over to sound
+        self.calls = []             # (start, end, stream_id, nbytes) per PlayStream
+        self.stop_times = []
+        self.leds = []
+        self.streams = {}           # stream_id -> first_call, first_sound, end, underruns, underrun_s, samples
+        self._end = 0.0             # when the speaker runs out of queued audio
+        self._lock = threading.Lock()
+
+    def SetTimeout(self, timeout: float):
+        pass
+
+    def Init(self):
+        pass
+
+    def LedControl(self, r: int, g: int, b: int):
+        self.leds.append((time.monotonic(), r, g, b))
+
+    def PlayStream(self, stream_name: str, stream_id: str, pcm_data) -> tuple[int, None]:
+        t0 = time.monotonic()
+        time.sleep(self.rpc)
+        t1 = time.monotonic()
+        samples = len(pcm_data) // 2
+        with self._lock:
+            self.calls.append((t0, t1, stream_id, len(pcm_data)))
+            ready = t1 + self.latency
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                stream = self.streams[stream_id] = {"first_call": t0, "first_sound": max(ready, self._end),
+                                                    "end": 0.0, "underruns": 0, "underrun_s": 0.0, "samples": 0}
+            elif ready > stream["end"]:
+                # the speaker ran dry before this block arrived
+                stream["underruns"] += 1
+                stream["underrun_s"] += ready - stream["end"]
+            start = max(ready, self._end)
+            self._end = start + samples / self.rate
+            stream["end"] = self._end
+            stream["samples"] += samples
+        return 0, None
+
+    def PlayStop(self, stream_name: str) -> int:
+        with self._lock:
+            now = time.monotonic()
+            self.stop_times.append(now)
+            self._end = min(self._end, now)
+            for stream in self.streams.values():
+                stream["end"] = min(stream["end"], now)
+        return 0
+
+    def playing(self, t: float | None = None) -> bool:
+        return (time.monotonic() if t is None else t) < self._end
+
+    @property
+    def play_end(self) -> float:
+        return self._end
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Wireless controller buttons as events on the asyncio loop.
+
+The remote's state arrives on rt/wirelesscontroller as WirelessController_
+messages, in a DDS thread, continuously while the remote is on. `keys` is a
+bitmask of the buttons held (KEYS below). ControllerInput watches one or more
+named bitmasks (a binding is held when all of its bits are set) and turns the
+message stream into press/release edges:
+
+- edges are detected in the DDS callback on the message where the state changes
+  and stamped with its arrival time, then posted to the loop with
+  call_soon_threadsafe. Nothing polls; the loop only wakes on an edge;
+- a change within `debounce` seconds of the previous edge of the same binding is
+  ignored as contact bounce. Since the remote keeps sending its state, a change
+  that persists is picked up from the first message after the debounce window;
+- stages wait with wait_press()/wait_release() and get the edge time, so the
+  recording can be cut at the capture sample that arrived with the edge
+  (MicCapture.index_at) however late the stage itself gets to run.
+
+    pad = ControllerInput({"talk": KEYS["B"]})
+    sub = ChannelSubscriber("rt/wirelesscontroller", WirelessController_)
+    sub.Init(pad.callback, 1)
+    await pad.start()
+    t = await pad.wait_press("talk")
+"""
+import asyncio
+import time
+
+# bit of every button in WirelessController_.keys
+KEYS = {name: 1 << bit for bit, name in enumerate(
+    ("R1", "L1", "start", "select", "R2", "L2", "F1", "F2",
+     "A", "B", "X", "Y", "up", "right", "down", "left"))}
+
+
+class ControllerInput:
+    def __init__(self, bindings: dict[str, int], debounce: float = 0.05, verbose: bool = True):
+        if not bindings or any(mask <= 0 for mask in bindings.values()):
+            raise ValueError(f"Every binding needs a non-empty key mask, got {bindings!r}")
+        self.bindings = dict(bindings)
+        self.debounce = debounce
+        self.verbose = verbose
+        self._loop = None
+
+        # DDS thread side: debounced state and time of the last accepted edge per binding
+        self._held = {name: False for name in self.bindings}
+        self._edge_t = {name: float("-inf") for name in self.bindings}
+
+        # loop side
+        self._pressed = {name: False for name in self.bindings}
+        self._press_t = {name: None for name in self.bindings}
+        self._release_t = {name: None for name in self.bindings}
+        self._press_events = {name: asyncio.Event() for name in self.bindings}
+        self._release_events = {name: asyncio.Event() for name in self.bindings}
+        for event in self._release_events.values():
+            event.set()
+
+        # counters
+        self.messages = 0
+        self.presses = 0
+        self.releases = 0
+        self.bounces = 0
+
+    async def start(self):
+        """Start posting edges to the running loop (edges before this only update the state)."""
+        self._loop = asyncio.get_running_loop()
+        for name, held in self._held.items():
+            if held:
+                self._post(name, True, time.monotonic())
+
+    def callback(self, msg):
+        """ChannelSubscriber handler, runs in the DDS thread."""
+        t = time.monotonic()
+        self.messages += 1
+        for name, mask in self.bindings.items():
+            held = (msg.keys & mask) == mask
+            if held == self._held[name]:
+                continue
+            if t - self._edge_t[name] < self.debounce:
+                self.bounces += 1
+                continue
+            self._held[name] = held
+            self._edge_t[name] = t
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._post, name, held, t)
+
+    def _post(self, name: str, held: bool, t: float):
+        if held == self._pressed[name]:
+            return
+        self._pressed[name] = held
+        if held:
+            self.presses += 1
+            self._press_t[name] = t
+            self._release_events[name].clear()
+            self._press_events[name].set()
+        else:
+            self.releases += 1
+            self._release_t[name] = t
+            self._press_events[name].clear()
+            self._release_events[name].set()
+        if self.verbose:
+            print(f"[PAD] {name} {'pressed' if held else 'released'}")
+
+    def is_pressed(self, name: str) -> bool:
+        return self._pressed[name]
+
+    def press_time(self, name: str) -> float | None:
+        """Monotonic arrival time of the message that pressed `name` last."""
+        return self._press_t[name]
+
+    def release_time(self, name: str) -> float | None:
+        """Monotonic arrival time of the message that released `name` last."""
+        return self._release_t[name]
+
+    async def wait_press(self, name: str, timeout: float | None = None) -> float | None:
+        """Wait until `name` is held; returns its press time (None on timeout). Returns at once if already held."""
+        try:
+            await asyncio.wait_for(self._press_events[name].wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._press_t[name]
+
+    async def wait_release(self, name: str, timeout: float | None = None) -> float | None:
+        """Wait until `name` is let go; returns its release time (None on timeout)."""
+        try:
+            await asyncio.wait_for(self._release_events[name].wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._release_t[name]
+
+    def summary(self) -> str:
+        return (f"[PAD] {self.messages} messages, {self.presses} presses, {self.releases} releases, "
+                f"{self.bounces} bounces ignored")
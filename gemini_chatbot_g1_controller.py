@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 import asyncio
 import time
-import socket
 
 import pyaudio
-import math
-from scipy import signal
 from google import genai
 from unitree_sdk2py.core.channel import ChannelFactoryInitialize, ChannelSubscriber
 from unitree_sdk2py.g1.audio.g1_audio_client import AudioClient
 from unitree_sdk2py.idl.unitree_go.msg.dds_._WirelessController_ import WirelessController_
-import numpy as np
-import struct
+
+from aec import EchoCanceller
+from controller_input import KEYS, ControllerInput
+from jitter_buffer import JitterBuffer
+from latency import TurnTracer
+from live_session import LiveSession, long_running
+from mic_capture import MicCapture
+from mic_sources import ReplaySource
+from playout import AdaptivePlayout, PlayoutEngine, ReferenceTrack
+from resampler import StreamingResampler
+from uplink import UplinkScheduler, policy_for
 
 
 
@@ -27,9 +33,6 @@ MIC_RATE = 16000
 #OUT_RATE = 24000
 CHUNK = 1024  # ~64ms at 16kHz
 
-MCAST_PORT=5555
-MCAST_GRP="239.168.123.161"
-
 # ---- Gemini Live ----
 
 model = "gemini-2.5-flash-native-audio-preview-12-2025"
@@ -52,6 +55,23 @@ config = {
     # "If you did not use Search, say 'not searched'. Keep answers concise.",
 }
 
+# how the end of an utterance is signalled to Gemini:
+# "activity": activity_start/activity_end around the audio, server-side VAD disabled
+# "padding": trailing silence so the server VAD notices the end of speech
+TURN_END = "activity"
+if TURN_END == "activity":
+    config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
+# pacing of the uplink: "realtime", "accelerated" or "burst" (see uplink.py)
+UPLINK_POLICY = policy_for(TURN_END)
+# close the Live connection after this many idle seconds; it reopens on the next send
+LIVE_IDLE_TIMEOUT = 300.0
+# all-day runs: sliding-window context compression, and every LIVE_ROTATE_AFTER seconds of
+# audio a fresh session seeded with a summary of the conversation (see live_session.py)
+LONG_RUNNING = True
+LIVE_ROTATE_AFTER = 3600.0 if LONG_RUNNING else None
+if LONG_RUNNING:
+    config = long_running(config)
+
 IN_RATE = 24000
 OUT_RATE = 16000
 CHUNK_SIZE = 96000
@@ -67,81 +87,40 @@ audioClient = AudioClient()
 audioClient.SetTimeout(10.0)
 audioClient.Init()
 
-controller_input_event = asyncio.Event()
-#loop = asyncio.get_event_loop()
-button_pressed = False
-
-def callback(msg: WirelessController_):
-    global button_pressed
-    if msg.keys == 512:
-        button_pressed = True
-    else:
-        button_pressed = False
-        print("button_unpressed")
+# per-turn stage timestamps, one JSON line per turn appended to LATENCY_LOG (None: summary only)
+LATENCY_LOG = "latency.jsonl"
+tracer = TurnTracer(LATENCY_LOG, info={"script": "g1_controller", "turn_end": TURN_END})
+# mic: None for the live multicast stream, or a recording (see MIC_RECORD) to run against, replayed at MIC_REPLAY_SPEED
+MIC_REPLAY = None
+MIC_REPLAY_SPEED = 1.0
+# save the mic stream as received (packets with arrival times) to this file, None to not record
+MIC_RECORD = None
+# subtract the robot's own voice from the mic before any stage reads it
+ECHO_CANCEL = True
+# what the robot is playing, the echo canceller's reference
+reference = ReferenceTrack(rate=OUT_RATE)
+# one multicast join for the whole process, every stage reads from its ring
+capture = MicCapture(rate=MIC_RATE, jitter=JitterBuffer(rate=MIC_RATE),
+                     echo=EchoCanceller(reference, rate=MIC_RATE) if ECHO_CANCEL else None,
+                     source=ReplaySource(MIC_REPLAY, speed=MIC_REPLAY_SPEED) if MIC_REPLAY else None,
+                     record=MIC_RECORD)
+# PlayStream runs in its own thread so the Live receive loop never waits on the robot
+playout = PlayoutEngine(audioClient, chunk_size=CHUNK_SIZE, reference=reference if ECHO_CANCEL else None, tracer=tracer)
+# when received reply audio is handed to the playout thread (small first block, then adaptive)
+playback = AdaptivePlayout(rate=OUT_RATE)
+# frames waiting to be uploaded while the user talks; when full the recorder waits
+# (the audio stays in the capture ring)
+STREAM_QUEUE_FRAMES = 32
+
+# push-to-talk: the controller buttons (bitmask, all of them held) that record while held
+TALK = "talk"
+TALK_KEYS = KEYS["B"]
+# press/release edges are posted to the loop by the DDS callback; changes within this many seconds of an edge are bounce
+PAD_DEBOUNCE = 0.05
+pad = ControllerInput({TALK: TALK_KEYS}, debounce=PAD_DEBOUNCE)
 
 sub = ChannelSubscriber("rt/wirelesscontroller", WirelessController_)
-sub.Init(callback, 1)
-
-def array_resample(array : bytearray, in_rate : int, out_rate : int):
-    factor = math.gcd(in_rate, out_rate)
-    up = out_rate//factor
-    down = in_rate//factor
-    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
-    y = signal.resample_poly(x, up, down)
-
-    data = np.clip(np.rint(y), -32768, 32767).astype(np.int16)
-
-    return data
-
-
-
-def play_pcm_stream(client, pcm_list, stream_name="example", chunk_size=96000, sleep_time=1.0, verbose=False, out_rate=16000):
-    """
-    Play PCM audio stream (16-bit little-endian format), sending data in chunks.
-
-    Parameters:
-        client: An object with a PlayStream method
-        pcm_list: list[int], PCM audio data in int16 format
-        stream_name: Stream name, default is "example"
-        chunk_size: Number of bytes to send per chunk, default is 96000 (3 seconds at 16kHz)
-        sleep_time: Delay between chunks in seconds
-    """
-    pcm_data = bytes(pcm_list)
-    stream_id = str(2093840)  # Unique stream ID based on current timestamp
-    offset = 0
-    chunk_index = 0
-    total_size = len(pcm_data)
-    print(f"total_size: {total_size}")
-
-    while offset < total_size:
-        x0 = time.time()
-        remaining = total_size - offset
-        current_chunk_size = min(chunk_size, remaining)
-        chunk = pcm_data[offset:offset + current_chunk_size]
-
-        sleep_time = current_chunk_size/out_rate/2
-        #print(f"sleep time: {sleep_time}")
-        if verbose:
-            # Print info about the current chunk
-            print(f"[CHUNK {chunk_index}] offset = {offset}, size = {current_chunk_size} bytes")
-            print("  First 10 samples (int16): ", end="")
-            for i in range(0, min(20, len(chunk) - 1), 2):
-                sample = struct.unpack_from('<h', chunk, i)[0]
-                print(sample, end=" ")
-            print()
-
-        # Send the chunk
-        ret_code, _ = client.PlayStream(stream_name, stream_id, chunk)
-        if ret_code != 0:
-            print(f"[ERROR] Failed to send chunk {chunk_index}, return code: {ret_code}")
-            break
-        else:
-            print(f"[INFO] Chunk {chunk_index} sent successfully")
-
-        offset += current_chunk_size
-        chunk_index += 1
-        x0 = time.time() - x0
-        #time.sleep(max(sleep_time-x0,0))
+sub.Init(pad.callback, 1)
 
 def silence_chunk() -> bytes:
     return b"\x00\x00" * CHUNK
@@ -149,59 +128,52 @@ def silence_chunk() -> bytes:
 async def wait_line(prompt: str = "") -> str:
     return (await asyncio.to_thread(input, prompt)).strip()
 
-async def record_until_enter(max_seconds: float = 30.0) -> list[bytes]:
-    """Record mic until user presses ENTER again."""
-    loop = asyncio.get_running_loop()
-    global button_pressed
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(("0.0.0.0", MCAST_PORT))
-
-    mreq = struct.pack("4s4s", socket.inet_aton(MCAST_GRP), socket.inet_aton("192.168.123.164"))
-
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-    #sock.setblocking(False)
-    #sock.settimeout(2.0)
-
-    frames: list[bytes] = []
-    print("[REC] Recording... press ENTER to stop and send.")
-    #stop_task = asyncio.create_task(asyncio.to_thread(input))
-    #stop_task = asyncio.create_task(controller_input_event.wait())
-    t0 = time.time()
-
-    try:
-        while True:
-            timeout = max_seconds - (time.time() - t0)
-            if timeout <= 0:
-                print("[REC] Max record time reached; sending.")
-                break
-
-            recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-            done, pending = await asyncio.wait(
-                {recv_task},
-                timeout=timeout
-            )
-            print(button_pressed)
-
-            #if stop_task in done:
-            if button_pressed == False:
-                for p in pending:
-                    p.cancel()
-                break
-
-            if recv_task in done:
-                data, _ = recv_task.result()
-                frames.append(data)
-    finally:
-        sock.close()
-
-
+async def stream_until_release(session, pressed_at: float, max_seconds: float = 30.0) -> float:
+    """
+    Record mic while the button is held, streaming it to Gemini meanwhile. Returns seconds sent.
+    The turn is the audio that arrived between the press (`pressed_at`) and release messages.
+    """
+    cursor = capture.cursor(capture.index_at(pressed_at))
+    tracer.mark("speech_start", cursor.time)
+    frames = asyncio.Queue(maxsize=STREAM_QUEUE_FRAMES)
+    sender = asyncio.create_task(stream_turn(session, frames))
+
+    print("[REC] Recording... release the button to stop and send.")
+    t0 = time.monotonic()
+    queued = cursor.pos
+    while not sender.done():
+        timeout = max_seconds - (time.monotonic() - t0)
+        if timeout <= 0:
+            print("[REC] Max record time reached; sending.")
+            break
+        data = await cursor.read(max_samples=CHUNK, timeout=min(timeout, 0.1))
+        if not pad.is_pressed(TALK):
+            break
+        if data:
+            await frames.put(data)
+            queued = cursor.pos
+    end = capture.write_pos
+    released = None
+    if not pad.is_pressed(TALK):
+        # cut at the packet that arrived with the release, however late this loop got to see it
+        released = pad.release_time(TALK)
+        end = capture.index_at(released)
+    tracer.mark("speech_end", released)
+    if sender.done():
+        # the upload failed, raise its error instead of queueing into nothing
+        return await sender
+
+    # audio up to the release that was not queued yet still belongs to the turn
+    tail = capture.read(queued, end)
+    for i in range(0, len(tail), CHUNK):
+        await frames.put(tail[i:i + CHUNK].tobytes())
+    if TURN_END == "padding":
+        # small silence tail to help VAD infer end-of-speech
+        for i in range(6):
+            await frames.put(silence_chunk())
+    await frames.put(None)
+    return await sender
 
-    # small silence tail to help VAD infer end-of-speech
-    frames.extend([silence_chunk()] * 6)
-    return frames
 
 async def play_reply_streaming(session):
     """Receive ONE model turn and play audio as it arrives (plus print transcript + tool debug)."""
@@ -222,9 +194,14 @@ async def play_reply_streaming(session):
         got_audio = False
         saw_tooling = False
         print(turn)
-        array = bytearray([])
-        chunk_accum = 0
+        # filter state carries over between blocks, so block edges do not click
+        resampler = StreamingResampler(IN_RATE, OUT_RATE)
+        # reply audio is resampled into this block as it arrives, the playout engine then takes the block over
+        block = playout.new_block()
+        playback.start_turn()
+        stream_id = playout.new_stream()
         async for resp in turn:
+            tracer.mark("first_message")
 
             sc = getattr(resp, "server_content", None)
 
@@ -232,6 +209,18 @@ async def play_reply_streaming(session):
             if not sc:
                 continue
 
+            if getattr(sc, "interrupted", False):
+                # the reply was cut (LiveSession resending the turn after a dropped connection,
+                # or the server heard the user): silence it and start over with what follows
+                playout.stop()
+                playout.pool.release(block)
+                resampler = StreamingResampler(IN_RATE, OUT_RATE)
+                block = playout.new_block()
+                playback.start_turn()
+                stream_id = playout.new_stream()
+                print("[PLAY] reply interrupted, starting over")
+                continue
+
             # Print model audio transcription (you enabled output_audio_transcription) :contentReference[oaicite:3]{index=3}
             ot = getattr(sc, "output_transcription", None)
             if ot and getattr(ot, "text", None):
@@ -251,20 +240,21 @@ async def play_reply_streaming(session):
                     inline = getattr(part, "inline_data", None)
 
                     if inline and isinstance(inline.data, (bytes, bytearray)):
+                        if not got_audio:
+                            report_first_audio()
                         got_audio = True
                         #await asyncio.to_thread(
-                        array.extend(bytes(inline.data))
-                        chunk_accum += len(inline.data)
+                        playback.arrived(resampler.process(inline.data, out=block).nbytes)
 
-            if chunk_accum > 72000:
-                resampled = array_resample(array, IN_RATE, OUT_RATE)
-                play_pcm_stream(audioClient, resampled, chunk_size = CHUNK_SIZE, sleep_time = DT)
-                chunk_accum = 0
-                array = bytearray([])
+            if playback.should_flush(block.nbytes):
+                playback.flushed(await playout.write(block, stream_id))
+                block = playout.new_block()
 
             if getattr(sc, "turn_complete", False):
-                resampled = array_resample(array, IN_RATE, OUT_RATE)
-                play_pcm_stream(audioClient, resampled, chunk_size = CHUNK_SIZE, sleep_time = DT)
+                tracer.mark("turn_complete")
+                resampler.flush(out=block)
+                playback.flushed(await playout.write(block, stream_id))
+                print(playback.summary())
                 break
 
         if not got_audio:
@@ -279,45 +269,73 @@ async def play_reply_streaming(session):
         #out_stream.close()
 
 
-async def send_one_turn(session, frames: list[bytes]):
+def report_first_audio():
+    tracer.mark("first_audio")
+    waited = tracer.elapsed("speech_end", "first_audio")
+    if waited is not None:
+        print(f"[LAT] first reply audio {waited:.2f}s after end of speech (turn end: {TURN_END})")
+
+
+async def stream_turn(session, frames: asyncio.Queue) -> float:
     """
-    Send one utterance to the *same* live session.
-    We pace chunks roughly in real-time so VAD behaves more reliably.
+    Send frames to the live session while they are being recorded (None ends the turn).
+    Returns the seconds of audio sent; nothing at all is sent for an empty turn.
     """
-    chunk_secs = CHUNK / MIC_RATE  # ~0.064s
-    for ch in frames:
-        print("estoy enviando")
-        await session.send_realtime_input(audio={"data": ch, "mime_type": f"audio/pcm;rate={MIC_RATE}"})
-        await asyncio.sleep(chunk_secs)  # helps VAD / turn-taking consistency
+    uplink = UplinkScheduler(session, MIC_RATE, policy=UPLINK_POLICY)
+    uplink.start_turn()
+    started = False
+    while (frame := await frames.get()) is not None:
+        if not started and TURN_END == "activity":
+            await session.send_realtime_input(activity_start={})
+        started = True
+        await uplink.send(frame)
+    if started and TURN_END == "activity":
+        await session.send_realtime_input(activity_end={})
+    tracer.mark("uplink_last")
+    audio_s, _ = uplink.end_turn()
+    print(uplink.summary())
+    return audio_s
 
 
 async def main():
     print(f"Mic device {IN_DEV} @ {MIC_RATE} Hz")
     #print(f"Output device {OUT_DEV} (pulse) @ {OUT_RATE} Hz")
     print("Controls:")
-    print("  ENTER       -> start recording")
-    print("  ENTER       -> stop and send")
-    print("  q + ENTER   -> quit\n")
-
-    async with client.aio.live.connect(model=model, config=config) as session:
-        while True:
-            #cmd = await wait_line("Ready. Press ENTER to record (or q to quit): ")
-            #if cmd.lower() == "q":
-            #    break
-            if not button_pressed:
-                await asyncio.sleep(0.05)
-                continue
+    print("  hold button    -> record")
+    print("  release        -> stop and send")
+    print("  Ctrl+C         -> quit\n")
 
-            print("grabando?")
-            frames = await record_until_enter(max_seconds=30.0)
-            if len(frames) <= 6:
-                print("[INFO] Too short; try again.\n")
-                continue
+    await capture.start()
+    await pad.start()
+    playout.start()
 
-            print("[Gemini] replying...")
-            await send_one_turn(session, frames)
-            await play_reply_streaming(session)
-            print()
+    try:
+        # connected before the first turn, and kept connected across GoAway and dropped sockets (see live_session.py)
+        async with LiveSession(client, model, config, idle_timeout=LIVE_IDLE_TIMEOUT,
+                               rotate_after=LIVE_ROTATE_AFTER) as session:
+            while True:
+                #cmd = await wait_line("Ready. Press ENTER to record (or q to quit): ")
+                #if cmd.lower() == "q":
+                #    break
+                # a button still held from the last turn starts the next one now, not at its old press
+                ready = time.monotonic()
+                pressed_at = max(await pad.wait_press(TALK), ready)
+                tracer.start_turn()
+                tracer.mark("wake", pressed_at)
+
+                print("grabando?")
+                sent = await stream_until_release(session, pressed_at, max_seconds=30.0)
+                if sent <= 0:
+                    print("[INFO] Too short; try again.\n")
+                    continue
+
+                print("[Gemini] replying...")
+                await play_reply_streaming(session)
+                print()
+    finally:
+        playout.stop()
+        await playout.close()
+        await capture.close()
 
     pya.terminate()
 
@@ -325,4 +343,7 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
+    finally:
+        print(pad.summary())
+        tracer.close()
\ No newline at end of file
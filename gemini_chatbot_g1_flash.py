@@ -1,27 +1,30 @@
 #!/usr/bin/env python3
 import asyncio
 import time
-import socket
 
-import math
-from scipy import signal
 from google import genai
 from unitree_sdk2py.core.channel import ChannelFactoryInitialize
 from unitree_sdk2py.g1.audio.g1_audio_client import AudioClient
-import numpy as np
-import struct
-import json
 import sys
 sys.path.append("./vendor")
-from vosk import Model, KaldiRecognizer
+from vosk import Model
+
+from aec import EchoCanceller
+from jitter_buffer import JitterBuffer
+from latency import TurnTracer
+from live_session import LiveSession, long_running
+from mic_capture import MicCapture
+from mic_sources import ReplaySource
+from playout import AdaptivePlayout, PlayoutEngine, ReferenceTrack
+from resampler import StreamingResampler
+from uplink import UplinkScheduler, policy_for
+from vad import BargeInDetector, Endpointer, EnergyGate
+from vosk_stt import RecognizerWorker, TimedRecognizer, find_word, partial_match
 
 # ---- Audio ----
 MIC_RATE = 16000
 CHUNK = 5120
 
-MCAST_PORT=5555
-MCAST_GRP="239.168.123.161"
-
 # ---- Gemini Live ----
 model = "gemini-2.5-flash-native-audio-preview-12-2025"
 tools = [{'google_search': {}}]
@@ -44,6 +47,23 @@ config = {
     },
 }
 
+# how the end of an utterance is signalled to Gemini:
+# "activity": activity_start/activity_end around the audio, server-side VAD disabled
+# "padding": trailing silence so the server VAD notices the end of speech
+TURN_END = "activity"
+if TURN_END == "activity":
+    config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
+# pacing of the uplink: "realtime", "accelerated" or "burst" (see uplink.py)
+UPLINK_POLICY = policy_for(TURN_END)
+# close the Live connection after this many idle seconds; it reopens on the next send or when the wake word starts
+LIVE_IDLE_TIMEOUT = 300.0
+# all-day runs: sliding-window context compression, and every LIVE_ROTATE_AFTER seconds of
+# audio a fresh session seeded with a summary of the conversation (see live_session.py)
+LONG_RUNNING = True
+LIVE_ROTATE_AFTER = 3600.0 if LONG_RUNNING else None
+if LONG_RUNNING:
+    config = long_running(config)
+
 
 IN_RATE = 24000
 OUT_RATE = 16000
@@ -56,14 +76,47 @@ client = genai.Client()
 queue = asyncio.Queue(0)
 turn_complete = asyncio.Event()
 answering = asyncio.Event()
+# set when the user talked over the reply, until that reply has ended on the server
+interrupted = asyncio.Event()
 
 # ---- STT ----
 VOSK_MODEL_PATH = "vosk-model-small-es-0.42"
 
 vosk_model = Model(VOSK_MODEL_PATH)
-recognizer = KaldiRecognizer(vosk_model, MIC_RATE)
+# "grammar": decode only the wake/end words (+ [unk]) and fire on partial results
+# "open": full Spanish language model, fire on final results
+WAKE_MODE = "grammar"
 WAKE_WORD = "robot"
 END_WORD = "gracias"
+recognizer = TimedRecognizer(vosk_model, MIC_RATE, keywords=[WAKE_WORD, END_WORD] if WAKE_MODE == "grammar" else None)
+# decoding runs in its own thread so Kaldi never blocks the event loop
+stt = RecognizerWorker(recognizer)
+# energy/zero-crossing gate: while idle Vosk only decodes audio that may be speech
+gate = EnergyGate(rate=MIC_RATE)
+# end-of-turn detection, thresholds calibrated at startup
+endpointer = Endpointer(rate=MIC_RATE)
+# per-turn stage timestamps, one JSON line per turn appended to LATENCY_LOG (None: summary only)
+LATENCY_LOG = "latency.jsonl"
+tracer = TurnTracer(LATENCY_LOG, info={"script": "g1_flash", "turn_end": TURN_END})
+# audio after the wake word that is kept as the start of the turn (0 disables)
+PRE_ROLL_SECONDS = 10.0
+
+# ---- Barge-in ----
+# keep listening while the robot talks and stop it as soon as the user talks over it
+BARGE_IN = True
+# mic audio looked at per step while listening for barge-in
+BARGE_IN_FRAME = 1600
+# mic: None for the live multicast stream, or a recording (see MIC_RECORD) to run against, replayed at MIC_REPLAY_SPEED
+MIC_REPLAY = None
+MIC_REPLAY_SPEED = 1.0
+# save the mic stream as received (packets with arrival times) to this file, None to not record
+MIC_RECORD = None
+# subtract the robot's own voice from the mic before VAD, Vosk and the uplink
+ECHO_CANCEL = True
+# what the robot is playing: echo cancellation reference, and tells its own voice in the mic from the user's
+reference = ReferenceTrack(rate=OUT_RATE)
+# finds the playback-to-mic delay itself (up to max_delay after the hand-over to PlayStream)
+barge_in = BargeInDetector(rate=MIC_RATE, max_delay=0.4)
 
 # ---- Unitree client ----
 net_if = "eth0"
@@ -71,102 +124,85 @@ ChannelFactoryInitialize(0, net_if)
 audioClient = AudioClient()
 audioClient.SetTimeout(10.0)
 audioClient.Init()
-
-def array_resample(array : bytearray, in_rate : int, out_rate : int):
-    factor = math.gcd(in_rate, out_rate)
-    up = out_rate//factor
-    down = in_rate//factor
-    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
-    y = signal.resample_poly(x, up, down)
-
-    data = np.clip(np.rint(y), -32768, 32767).astype(np.int16)
-
-    return data
-
-def play_pcm_stream(client, pcm_list, stream_id, stream_name="example", chunk_size=96000, sleep_time=1.0, verbose=False, out_rate=16000):
-    """
-    Play PCM audio stream (16-bit little-endian format), sending data in chunks.
-
-    Parameters:
-        client: An object with a PlayStream method
-        pcm_list: list[int], PCM audio data in int16 format
-        stream_name: Stream name, default is "example"
-        chunk_size: Number of bytes to send per chunk, default is 96000 (3 seconds at 16kHz)
-        sleep_time: Delay between chunks in seconds
-    """
-    pcm_data = bytes(pcm_list)
-    stream_id = str(stream_id)
-    offset = 0
-    chunk_index = 0
-    total_size = len(pcm_data)
-
-    while offset < total_size:
-        remaining = total_size - offset
-        current_chunk_size = min(chunk_size, remaining)
-        chunk = pcm_data[offset:offset + current_chunk_size]
-
-        if verbose:
-            # Print info about the current chunk
-            print(f"[CHUNK {chunk_index}] offset = {offset}, size = {current_chunk_size} bytes")
-            print("  First 10 samples (int16): ", end="")
-            for i in range(0, min(20, len(chunk) - 1), 2):
-                sample = struct.unpack_from('<h', chunk, i)[0]
-                print(sample, end=" ")
-            print()
-
-        # Send the chunk
-        ret_code, _ = client.PlayStream(stream_name, stream_id, chunk)
-        if ret_code != 0:
-            print(f"[ERROR] Failed to send chunk {chunk_index}, return code: {ret_code}")
-            break
-
-        offset += current_chunk_size
-        chunk_index += 1
-
-def stop_pcm_stream(client, stream_name: str ="example"):
-    client.PlayStop(stream_name)
+# PlayStream runs in its own thread so the Live receive loop never waits on the robot
+playout = PlayoutEngine(audioClient, chunk_size=CHUNK_SIZE, reference=reference if BARGE_IN or ECHO_CANCEL else None, tracer=tracer)
+# when received reply audio is handed to the playout thread (small first block, then adaptive)
+playback = AdaptivePlayout(rate=OUT_RATE)
 
 def silence_chunk() -> bytes:
     return b"\x00\x00" * CHUNK
 
-async def wait_for_wakeword(sock, wake_word: str = "robot", timeout=60.0):
+def pre_roll_start(capture, word: dict) -> int | None:
+    """Capture index where the turn should start: right after the wake word, at most PRE_ROLL_SECONDS back."""
+    if PRE_ROLL_SECONDS <= 0:
+        return None
+    index = word.get("end_index")
+    if index is None:
+        return None
+    return max(index, capture.write_pos - int(PRE_ROLL_SECONDS * MIC_RATE))
+
+
+async def wait_for_wakeword(capture, wake_word: str = "robot", timeout=60.0, on_speech=None):
     """
-    Waits for wake_word using Vosk STT, for a time = timeout
+    Waits for wake_word using Vosk STT, for a time = timeout.
+    Returns the capture index the next turn should start from (see PRE_ROLL_SECONDS).
+    on_speech() is called when the gate opens (speech that may be the wake phrase) and, in
+    open mode, on every partial result that may be the start of wake_word.
     """
-    loop = asyncio.get_running_loop()
-
-    frames: list[bytes] = []
+    cursor = capture.cursor()
 
     print("[WAKE] Esperando llamada")
 
     while True:
-        recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-        done, _ = await asyncio.wait(
-            {recv_task},
-            timeout=timeout,
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-
-        if recv_task in done:
-            data, _ = recv_task.result()
-        if recognizer.AcceptWaveform(data):
-            result = json.loads(recognizer.Result())
-            text = result.get("text", "")
-
-            if text:
+        data = await cursor.read(timeout=timeout)
+        if not data:
+            continue
+        start = cursor.pos - len(data) // 2
+        was_open = gate.is_open
+        if gate.process(data):
+            if not was_open:
+                if on_speech:
+                    # someone started talking, maybe the wake phrase: reopen the connection while they say it
+                    on_speech()
+                # gate just opened: include the lookback so the word onset is not clipped
+                look = max(start - gate.lookback_samples, capture.oldest_pos)
+                data = capture.read(look, start).tobytes() + data
+                start = look
+            stt.submit(data, start, cursor.time)
+        for event in stt.poll():
+            text = event["text"]
+            if on_speech and WAKE_MODE != "grammar" and text and partial_match(text, wake_word):
+                # open vocabulary: a partial may be the start of the phrase (with the grammar the
+                # partial already is the keyword, nothing left to overlap)
+                on_speech()
+            if not text or (event["type"] == "partial" and WAKE_MODE != "grammar"):
+                continue
+            if event["type"] == "final":
                 print("[WAKE] se detecto la palabra " + text)
-                if wake_word in text.split():
-                    print("[WAKE] Wake word detectada")
-                    recognizer.Reset()
-                    return
-
+            word = find_word(event["result"], wake_word)
+            if word:
+                print("[WAKE] Wake word detectada")
+                print(gate.summary())
+                stt.reset()
+                return pre_roll_start(capture, word)
+
+
+async def calibrate_vad(capture, seconds: float = 1.0):
+    """Measure the room noise for the end-of-turn detector (nobody should be talking)."""
+    cursor = capture.cursor()
+    await capture.wait_for(cursor.pos + int(seconds * MIC_RATE) - 1, timeout=seconds + 2.0)
+    pcm = cursor.read_available()
+    endpointer.calibrate(pcm)
+    barge_in.calibrate(pcm)
+    print(endpointer.describe())
+
+
+async def record_until_silence(capture, max_seconds: float = 30.0, end_word: str = "adios", timeout = 60.0, start: int | None = None) -> list[bytes]:
+    """Record mic until user stops speaking. `start` replays the ring from that capture index."""
+    cursor = capture.cursor(start)
+    tracer.mark("speech_start", cursor.time)
+    endpointer.reset()
 
-async def record_until_silence(sock, max_seconds: float = 30.0, end_word: str = "adios", timeout = 60.0, threshold = 0.002, silence_duration = 3.0) -> list[bytes]:
-    """Record mic until user stops speaking."""
-    loop = asyncio.get_running_loop()
-
-    frames: list[bytes] = []
     print("[REC] Recording...")
     t0 = time.time()
     end = False
@@ -177,36 +213,32 @@ async def record_until_silence(sock, max_seconds: float = 30.0, end_word: str =
             print("[REC] Max record time reached; sending.")
             break
 
-        recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-        done, _ = await asyncio.wait(
-            {recv_task},
-            timeout=timeout,
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-
-        if recv_task in done:
-            data, _ = recv_task.result()
-            #frames.append(data)    
-            await queue.put(data)
+        data = await cursor.read(max_samples=CHUNK, timeout=timeout)
+        if not data:
+            continue
+        await queue.put(data)
         
                         
-        if recognizer.AcceptWaveform(data):
-            result = json.loads(recognizer.Result())
-            text = result.get("text", "")
-            if text and time.time() - t0 > 1.0:
-                recognizer.Reset()
-                if end_word in text.split():
-                    end = True
+        stt.submit(data, cursor.pos - len(data) // 2, cursor.time)
+        text = " ".join(e["text"] for e in stt.poll() if e["type"] == "final")
+        if text and time.time() - t0 > 1.0:
+            stt.reset()
+            if end_word in text.split():
+                end = True
                 
         
         if answering.is_set():
             break
+        if endpointer.process(data):
+            print(f"[REC] Silencio detectado ({endpointer.speech_seconds:.1f}s de voz)")
+            break
 
+    tracer.mark("speech_end")
 
-    # small silence tail to help VAD infer end-of-speech
-    for i in range(5):
-        await queue.put(silence_chunk())
+    if TURN_END == "padding":
+        # small silence tail to help VAD infer end-of-speech
+        for i in range(5):
+            await queue.put(silence_chunk())
     await queue.put(None) # None to denote the end of the prompt    
     
     await queue.join() # Waits for queue to empty
@@ -221,10 +253,14 @@ async def play_reply_streaming(session):
         got_audio = False
         saw_tooling = False
 
-        array = bytearray([])
-        chunk_accum = 0
+        # filter state carries over between blocks, so block edges do not click
+        resampler = StreamingResampler(IN_RATE, OUT_RATE)
+        # reply audio is resampled into this block as it arrives, the playout engine then takes the block over
+        block = playout.new_block()
+        playback.start_turn()
 
         async for resp in turn: 
+            tracer.mark("first_message")
 
             sc = getattr(resp, "server_content", None)
             if not sc:
@@ -249,20 +285,39 @@ async def play_reply_streaming(session):
                     inline = getattr(part, "inline_data", None)
                     
                     if inline and isinstance(inline.data, (bytes, bytearray)):
+                        if interrupted.is_set():
+                            # rest of a reply the user talked over
+                            continue
                         if not stream_id:
-                            stream_id = int(time.time() * 1000)
+                            stream_id = playout.new_stream()
+                            report_first_audio()
                         got_audio = True
                         answering.set()
-                        array.extend(bytes(inline.data))
-                        chunk_accum += len(inline.data)
+                        playback.arrived(resampler.process(inline.data, out=block).nbytes)
+
+            if getattr(sc, "interrupted", False) or (interrupted.is_set() and getattr(sc, "turn_complete", False)):
+                if not interrupted.is_set():
+                    # the server heard the user first
+                    playout.stop()
+                    print("[BARGE] reply interrupted by the server")
+                # the audio collected since the last flush is never played, give its block back
+                playout.pool.release(block)
+                print(playback.summary())
+                stream_id = None
+                interrupted.clear()
+                answering.clear()
+                break
 
-            if chunk_accum > 0:
-                resampled = await asyncio.to_thread(array_resample, array, IN_RATE, OUT_RATE)
-                await asyncio.to_thread(play_pcm_stream, audioClient, resampled, stream_id, chunk_size = CHUNK_SIZE, sleep_time = DT)
-                chunk_accum = 0
-                array = bytearray([])
+            if playback.should_flush(block.nbytes):
+                playback.flushed(await playout.write(block, stream_id))
+                block = playout.new_block()
 
             if got_audio and getattr(sc, "turn_complete", False):
+                tracer.mark("turn_complete")
+                # audio still collected plus the last samples held back by the resampling filter
+                resampler.flush(out=block)
+                playback.flushed(await playout.write(block, stream_id))
+                print(playback.summary())
                 stream_id = None
                 turn_complete.set()
                 answering.clear()
@@ -274,67 +329,145 @@ async def play_reply_streaming(session):
             print("[INFO] No tool/code-execution observed this turn (likely answered without Search).")
 
 
+def interrupt_reply(onset_time: float):
+    """Silence the robot and drop the rest of the reply the user talked over."""
+    if not turn_complete.is_set():
+        interrupted.set()
+    answering.clear()
+    detected = time.monotonic()
+    stopped = playout.stop()
+    print(f"[BARGE] user talked over the reply: detected {1000 * (detected - onset_time):.0f}ms "
+          f"after speech onset")
+
+    def report(done):
+        # runs on the playout thread once PlayStop returned
+        print(f"[BARGE] robot stopped {1000 * (time.monotonic() - onset_time):.0f}ms after speech onset "
+              f"(PlayStop {1000 * done.result():.0f}ms)")
+
+    stopped.add_done_callback(report)
+
+
+async def listen_for_barge_in(capture) -> int | None:
+    """
+    Listen while a reply is on its way or playing. Returns the capture index where the
+    user started talking over it (the robot has then been stopped), or None once the
+    reply is over.
+    """
+    cursor = capture.cursor()
+    barge_in.reset()
+    while not turn_complete.is_set() or playout.queued or reference.playing():
+        data = await cursor.read(max_samples=BARGE_IN_FRAME, timeout=0.1)
+        if not data or not (answering.is_set() or playout.queued or reference.playing()):
+            continue
+        n = len(data) // 2
+        if barge_in.process(data, reference.read(cursor.time - n / MIC_RATE, n)):
+            onset = cursor.pos - barge_in.onset_samples
+            interrupt_reply(capture.time_of(onset))
+            print(barge_in.describe())
+            return max(onset - barge_in.lookback_samples, capture.oldest_pos)
+    return None
+
+
+def report_first_audio():
+    tracer.mark("first_audio")
+    waited = tracer.elapsed("speech_end", "first_audio")
+    if waited is not None:
+        print(f"[LAT] first reply audio {waited:.2f}s after end of speech (turn end: {TURN_END})")
+
+
 async def send_one_turn(session):
     """
     Send one utterance to the *same* live session.
-    We pace chunks roughly in real-time so VAD behaves more reliably.
+    Frames are paced by UPLINK_POLICY; the ring backlog (pre-roll) never needs real-time pacing
+    when the turn end is signalled explicitly.
     """
+    uplink = UplinkScheduler(session, MIC_RATE, policy=UPLINK_POLICY)
+    in_turn = False
     while True:
-        t0 = time.time()
         frame = await queue.get()
         
         if frame is None:
             queue.task_done()
-            await session.send_realtime_input(audio_stream_end=True)
+            if TURN_END == "activity":
+                if in_turn:
+                    await session.send_realtime_input(activity_end={})
+            else:
+                await session.send_realtime_input(audio_stream_end=True)
+            if in_turn:
+                tracer.mark("uplink_last")
+                uplink.end_turn()
+                print(uplink.summary())
+            in_turn = False
             continue
-            
-        chunk_secs = len(frame) / 2 / MIC_RATE
-        #for ch in frames:
+
+        if not in_turn:
+            uplink.start_turn()
+            if TURN_END == "activity":
+                await session.send_realtime_input(activity_start={})
+            in_turn = True
         try:
-            await session.send_realtime_input(audio={"data": frame, "mime_type": f"audio/pcm;rate={MIC_RATE}"})
+            await uplink.send(frame)
         except Exception as e:
             print(f"[SESSION ERROR]: {e}")
         queue.task_done()
-        await asyncio.sleep(chunk_secs - (time.time() - t0))  # helps VAD / turn-taking consistency
 
 
 
 async def main():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(("0.0.0.0", MCAST_PORT))
-
-    mreq = struct.pack("4s4s", socket.inet_aton(MCAST_GRP), socket.inet_aton("192.168.123.164"))
-
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-    sock.setblocking(False)
+    capture = MicCapture(rate=MIC_RATE, jitter=JitterBuffer(rate=MIC_RATE),
+                         echo=EchoCanceller(reference, rate=MIC_RATE) if ECHO_CANCEL else None,
+                         source=ReplaySource(MIC_REPLAY, speed=MIC_REPLAY_SPEED) if MIC_REPLAY else None,
+                         record=MIC_RECORD)
+    await capture.start()
+    playout.start()
+    stt.start()
+    await calibrate_vad(capture)
 
     send_task = None
     play_task = None
     try:
-        async with client.aio.live.connect(model=model, config=config) as session:
+        # connected before the first turn, and kept connected across GoAway and dropped sockets (see live_session.py)
+        async with LiveSession(client, model, config, idle_timeout=LIVE_IDLE_TIMEOUT,
+                               rotate_after=LIVE_ROTATE_AFTER) as session:
             end = True
+            start = None
+            woke = None
             turn_complete.set()
             while True:
                 if end:
-                    await wait_for_wakeword(sock, WAKE_WORD)
+                    start = await wait_for_wakeword(capture, WAKE_WORD, on_speech=session.wake)
+                    woke = time.monotonic()
                     end = False
                     if send_task is None:
                         send_task = asyncio.create_task(send_one_turn(session))
                         play_task = asyncio.create_task(play_reply_streaming(session))
 
                 try:
-                    await turn_complete.wait()
+                    if BARGE_IN:
+                        barged = await listen_for_barge_in(capture)
+                        if barged is not None:
+                            start = barged
+                    else:
+                        await turn_complete.wait()
                 except Exception as e:
                     print(f"Excepcion {e}")
                 turn_complete.clear()
-                end = await record_until_silence(sock, max_seconds = 30.0, end_word = END_WORD)
+                # the previous reply is over (or was talked over): a new turn starts
+                tracer.start_turn()
+                if woke is not None:
+                    tracer.mark("wake", woke)
+                    woke = None
+                end = await record_until_silence(capture, max_seconds = 30.0, end_word = END_WORD, start = start)
+                start = None
     finally:
         if send_task:
             send_task.cancel()
         if play_task:
             play_task.cancel()
-        stop_pcm_stream(audioClient)
+        playout.stop()
+        await playout.close()
+        await stt.stop()
+        await capture.close()
         print("Exiting...")
 
 
@@ -343,3 +476,5 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         pass
+    finally:
+        tracer.close()
@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
 import asyncio
+import collections
 import time
-import socket
 
 import pyaudio
-import math
-from scipy import signal
 from google import genai
 from unitree_sdk2py.core.channel import ChannelFactoryInitialize
 from unitree_sdk2py.g1.audio.g1_audio_client import AudioClient
-import numpy as np
-import struct
-import json
 import sys
 sys.path.append("./vendor")
-from vosk import Model, KaldiRecognizer
+from vosk import Model
+
+from aec import EchoCanceller
+from jitter_buffer import JitterBuffer
+from latency import TurnTracer
+from live_session import LiveSession, long_running
+from mic_capture import MicCapture
+from mic_sources import ReplaySource
+from playout import AdaptivePlayout, PlayoutEngine, ReferenceTrack
+from resampler import StreamingResampler
+from uplink import UplinkScheduler, policy_for
+from vad import Endpointer
+from vosk_stt import RecognizerWorker, TimedRecognizer
 # ---- Your known-good devices ----
 IN_DEV = 24     # ReSpeaker 4 Mic Array
 #OUT_DEV = 26    # pulse (routes to default BT sink)
@@ -26,9 +33,6 @@ MIC_RATE = 16000
 #OUT_RATE = 24000
 CHUNK = 8192
 
-MCAST_PORT=5555
-MCAST_GRP="239.168.123.161"
-
 # ---- Gemini Live ----
 model = "gemini-2.5-flash-native-audio-preview-12-2025"
 tools = [{}]
@@ -52,6 +56,22 @@ config = {
     # "If you did not use Search, say 'not searched'. Keep answers concise.",
 }
 
+# how the end of an utterance is signalled to Gemini:
+# "activity": activity_start/activity_end around the audio, server-side VAD disabled
+# "padding": trailing silence so the server VAD notices the end of speech
+TURN_END = "activity"
+if TURN_END == "activity":
+    config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
+# pacing of the uplink: "realtime", "accelerated" or "burst" (see uplink.py)
+UPLINK_POLICY = policy_for(TURN_END)
+# the mic is streamed all the time, so the context grows by every second of the day
+# all-day runs: sliding-window context compression, and every LIVE_ROTATE_AFTER seconds of
+# audio a fresh session seeded with a summary of the conversation (see live_session.py)
+LONG_RUNNING = True
+LIVE_ROTATE_AFTER = 3600.0 if LONG_RUNNING else None
+if LONG_RUNNING:
+    config = long_running(config)
+
 
 IN_RATE = 24000
 OUT_RATE = 16000
@@ -66,7 +86,9 @@ turn_complete = asyncio.Event()
 VOSK_MODEL_PATH = "vosk-model-small-es-0.42"
 
 vosk_model = Model(VOSK_MODEL_PATH)
-recognizer = KaldiRecognizer(vosk_model, MIC_RATE)
+recognizer = TimedRecognizer(vosk_model, MIC_RATE)
+# decoding runs in its own thread so Kaldi never blocks the event loop
+stt = RecognizerWorker(recognizer)
 WAKE_WORD = "robot"
 END_WORD = "gracias"
 
@@ -76,62 +98,32 @@ audioClient = AudioClient()
 audioClient.SetTimeout(10.0)
 audioClient.Init()
 
-def array_resample(array : bytearray, in_rate : int, out_rate : int):
-    factor = math.gcd(in_rate, out_rate)
-    up = out_rate//factor
-    down = in_rate//factor
-    x = np.frombuffer(array, dtype=np.int16).astype(np.float32)
-    y = signal.resample_poly(x, up, down)
-
-    data = np.clip(np.rint(y), -32768, 32767).astype(np.int16)
-
-    return data
-
-def play_pcm_stream(client, pcm_list, stream_name="example", chunk_size=96000, sleep_time=1.0, verbose=False, out_rate=16000):
-    """
-    Play PCM audio stream (16-bit little-endian format), sending data in chunks.
-
-    Parameters:
-        client: An object with a PlayStream method
-        pcm_list: list[int], PCM audio data in int16 format
-        stream_name: Stream name, default is "example"
-        chunk_size: Number of bytes to send per chunk, default is 96000 (3 seconds at 16kHz)
-        sleep_time: Delay between chunks in seconds
-    """
-    pcm_data = bytes(pcm_list)
-    stream_id = str(2093840)  # Unique stream ID based on current timestamp
-    offset = 0
-    chunk_index = 0
-    total_size = len(pcm_data)
-
-    while offset < total_size:
-        x0 = time.time()
-        remaining = total_size - offset
-        current_chunk_size = min(chunk_size, remaining)
-        chunk = pcm_data[offset:offset + current_chunk_size]
-
-        sleep_time = current_chunk_size/out_rate/2
-        #print(f"sleep time: {sleep_time}")
-        if verbose:
-            # Print info about the current chunk
-            print(f"[CHUNK {chunk_index}] offset = {offset}, size = {current_chunk_size} bytes")
-            print("  First 10 samples (int16): ", end="")
-            for i in range(0, min(20, len(chunk) - 1), 2):
-                sample = struct.unpack_from('<h', chunk, i)[0]
-                print(sample, end=" ")
-            print()
-
-        # Send the chunk
-        ret_code, _ = client.PlayStream(stream_name, stream_id, chunk)
-        if ret_code != 0:
-            print(f"[ERROR] Failed to send chunk {chunk_index}, return code: {ret_code}")
-            break
-        else:
-            print(f"[INFO] Chunk {chunk_index} sent successfully")
-
-        offset += current_chunk_size
-        chunk_index += 1
-        x0 = time.time() - x0
+# per-turn stage timestamps, one JSON line per turn appended to LATENCY_LOG (None: summary only)
+LATENCY_LOG = "latency.jsonl"
+tracer = TurnTracer(LATENCY_LOG, info={"script": "repeater", "turn_end": TURN_END})
+# mic: None for the live multicast stream, or a recording (see MIC_RECORD) to run against, replayed at MIC_REPLAY_SPEED
+MIC_REPLAY = None
+MIC_REPLAY_SPEED = 1.0
+# save the mic stream as received (packets with arrival times) to this file, None to not record
+MIC_RECORD = None
+# subtract the robot's own voice from the mic before any stage reads it
+ECHO_CANCEL = True
+# what the robot is playing, the echo canceller's reference
+reference = ReferenceTrack(rate=OUT_RATE)
+# one multicast join for the whole process, every stage reads from its ring
+capture = MicCapture(rate=MIC_RATE, jitter=JitterBuffer(rate=MIC_RATE),
+                     echo=EchoCanceller(reference, rate=MIC_RATE) if ECHO_CANCEL else None,
+                     source=ReplaySource(MIC_REPLAY, speed=MIC_REPLAY_SPEED) if MIC_REPLAY else None,
+                     record=MIC_RECORD)
+# PlayStream runs in its own thread so the Live receive loop never waits on the robot
+playout = PlayoutEngine(audioClient, chunk_size=CHUNK_SIZE, reference=reference if ECHO_CANCEL else None, tracer=tracer)
+# when received reply audio is handed to the playout thread (small first block, then adaptive)
+playback = AdaptivePlayout(rate=OUT_RATE)
+# end-of-turn detection, thresholds calibrated at startup
+endpointer = Endpointer(rate=MIC_RATE)
+# (speech start, speech end) of recorded turns; the recorder runs ahead of the reply,
+# so the sender stamps them on the turn when it uploads it
+turn_stamps = collections.deque()
 
 def silence_chunk() -> bytes:
     return b"\x00\x00" * CHUNK
@@ -143,167 +135,91 @@ async def wait_line(prompt: str = "") -> str:
 
 async def record_until_enter(max_seconds: float = 30.0) -> list[bytes]:
     """Record mic until user presses ENTER again."""
-    loop = asyncio.get_running_loop()
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(("0.0.0.0", MCAST_PORT))
+    cursor = capture.cursor()
 
-    mreq = struct.pack("4s4s", socket.inet_aton(MCAST_GRP), socket.inet_aton("192.168.123.164"))
-
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-    #sock.setblocking(False)
-    #sock.settimeout(2.0)
-
-    frames: list[bytes] = []
     print("[REC] Recording... press ENTER to stop and send.")
     stop_task = asyncio.create_task(asyncio.to_thread(input))
-    t0 = time.time()
 
-    try:
-        while True:
-            timeout = max_seconds - (time.time() - t0)
-            if timeout <= 0:
-                print("[REC] Max record time reached; sending.")
-                break
-
-            recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-            done, _ = await asyncio.wait(
-                {recv_task, stop_task},
-                timeout=timeout,
-                return_when=asyncio.FIRST_COMPLETED,
-            )
+    done, _ = await asyncio.wait({stop_task}, timeout=max_seconds)
+    if stop_task not in done:
+        print("[REC] Max record time reached; sending.")
 
-            if stop_task in done:
-                break
+    # everything captured since the cursor was opened is already in the ring
+    frames = cursor.read_frames(CHUNK // 2)
 
-            if recv_task in done:
-                data, _ = recv_task.result()
-                frames.append(data)
-    finally:
-        sock.close()
-
-    # small silence tail to help VAD infer end-of-speech
-    frames.extend([silence_chunk()] * 6)
+    if TURN_END == "padding":
+        # small silence tail to help VAD infer end-of-speech
+        frames.extend([silence_chunk()] * 6)
     return frames
 
 
 async def wait_for_wakeword(wake_word, timeout=60.0):
-    loop = asyncio.get_running_loop()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    mreq = struct.pack("4s4s", socket.inet_aton(MCAST_GRP), socket.inet_aton("192.168.123.164"))
-    sock.bind(("0.0.0.0", MCAST_PORT)) 
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-     
-    #sock.setblocking(False)
-    #sock.settimeout(2.0)
-
-    frames: list[bytes] = []
+    cursor = capture.cursor()
 
     print("[WAKE] Esperando llamada")
 
     while True:
-        recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-        done, _ = await asyncio.wait(
-            {recv_task},
-            timeout=timeout,
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-
-        if recv_task in done:
-            data, _ = recv_task.result()
-        if recognizer.AcceptWaveform(data):
-            result = json.loads(recognizer.Result())
-            text = result.get("text", "")
-
-            if text:
+        data = await cursor.read(timeout=timeout)
+        if not data:
+            continue
+        stt.submit(data, cursor.pos - len(data) // 2, cursor.time)
+        for event in stt.poll():
+            text = event["text"]
+            if event["type"] == "final" and text:
                 print("[WAKE] se detecto la palabra " + text)
                 if wake_word in text.split():
                     print("[WAKE] Wake word detectada")
-                    recognizer.Reset()
+                    stt.reset()
                     return
 
 
-async def record_until_silence(max_seconds: float = 30.0, end_word: str = "adios", timeout = 60.0, threshold = 0.002, silence_duration = 3.0) -> list[bytes]:
-    """Record mic until user presses ENTER again."""
-    loop = asyncio.get_running_loop()
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(("0.0.0.0", MCAST_PORT))
+async def calibrate_vad(capture, seconds: float = 1.0):
+    """Measure the room noise for the end-of-turn detector (nobody should be talking)."""
+    cursor = capture.cursor()
+    await capture.wait_for(cursor.pos + int(seconds * MIC_RATE) - 1, timeout=seconds + 2.0)
+    endpointer.calibrate(cursor.read_available())
+    print(endpointer.describe())
 
-    mreq = struct.pack("4s4s", socket.inet_aton(MCAST_GRP), socket.inet_aton("192.168.123.164"))
 
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-    #sock.setblocking(False)
-    #sock.settimeout(2.0)
+async def record_until_silence(max_seconds: float = 30.0, end_word: str = "adios", timeout = 60.0) -> list[bytes]:
+    """Record mic until the user stops speaking."""
+    cursor = capture.cursor()
+    speech_start = cursor.time
+    endpointer.reset()
 
-    frames: list[bytes] = []
     print("[REC] Recording...")
-    stop_task = asyncio.create_task(asyncio.to_thread(input))
     t0 = time.time()
     end = False
-    silence = None
-    noise = False 
-    try:
-        while True:
-            timeout = max_seconds - (time.time() - t0)
-            if timeout <= 0:
-                print("[REC] Max record time reached; sending.")
-                break
-
-            recv_task = asyncio.create_task(loop.sock_recvfrom(sock, CHUNK))
-
-            done, _ = await asyncio.wait(
-                {recv_task},
-                timeout=timeout,
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-
-
-            if recv_task in done:
-                data, _ = recv_task.result()
-                #frames.append(data)    
-                await queue.put(data)
-            
-                            
-            if recognizer.AcceptWaveform(data):
-                result = json.loads(recognizer.Result())
-                text = result.get("text", "")
-                print(text)
-                if text and time.time() - t0 > 1.0:
-                    recognizer.Reset()
-                    if end_word in text.split():
-                        end = True
-                    
-            
-            audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-            # Calculamos el valor cuadrático medio (RMS)
-            ms = np.mean(audio_data**2)
-            
-            if ms > threshold:
-                noise = True
-
-            if noise and ms < threshold:
-
-                if silence is None:
-                    silence = time.time()
-                elif time.time() - silence > silence_duration:
-                    print("[REC] Silencio detectado")
-                    break
-            else:
-                silence = None
+    while True:
+        timeout = max_seconds - (time.time() - t0)
+        if timeout <= 0:
+            print("[REC] Max record time reached; sending.")
+            break
 
+        data = await cursor.read(timeout=timeout)
+        if not data:
+            continue
+        await queue.put(data)
+
+        stt.submit(data, cursor.pos - len(data) // 2, cursor.time)
+        text = " ".join(e["text"] for e in stt.poll() if e["type"] == "final")
+        if text:
+            print(text)
+        if text and time.time() - t0 > 1.0:
+            stt.reset()
+            if end_word in text.split():
+                end = True
+
+        if endpointer.process(data):
+            print(f"[REC] Silencio detectado ({endpointer.speech_seconds:.1f}s de voz)")
+            break
 
-    finally:
-        sock.close()
+    turn_stamps.append((speech_start, time.monotonic()))
 
-    # small silence tail to help VAD infer end-of-speech
-    for i in range(5):
-        await queue.put(silence_chunk())
+    if TURN_END == "padding":
+        # small silence tail to help VAD infer end-of-speech
+        for i in range(5):
+            await queue.put(silence_chunk())
 
     await queue.put(None)    
     
@@ -330,15 +246,32 @@ async def play_reply_streaming(session):
             got_audio = False
             saw_tooling = False
 
-            array = bytearray([])
-            chunk_accum = 0
+            # filter state carries over between blocks, so block edges do not click
+            resampler = StreamingResampler(IN_RATE, OUT_RATE)
+            # reply audio is resampled into this block as it arrives, the playout engine then takes the block over
+            block = playout.new_block()
+            playback.start_turn()
+            stream_id = playout.new_stream()
 
             async for resp in turn: 
+                tracer.mark("first_message")
 
                 sc = getattr(resp, "server_content", None)
                 if not sc:
                     continue
 
+                if getattr(sc, "interrupted", False):
+                    # the reply was cut (LiveSession resending the turn after a dropped connection,
+                    # or the server heard the user): silence it and start over with what follows
+                    playout.stop()
+                    playout.pool.release(block)
+                    resampler = StreamingResampler(IN_RATE, OUT_RATE)
+                    block = playout.new_block()
+                    playback.start_turn()
+                    stream_id = playout.new_stream()
+                    print("[PLAY] reply interrupted, starting over")
+                    continue
+
                 # Print model audio transcription (you enabled output_audio_transcription) :contentReference[oaicite:3]{index=3}
                 ot = getattr(sc, "output_transcription", None)
                 if ot and getattr(ot, "text", None):
@@ -358,21 +291,22 @@ async def play_reply_streaming(session):
                         inline = getattr(part, "inline_data", None)
                         
                         if inline and isinstance(inline.data, (bytes, bytearray)):
+                            if not got_audio:
+                                report_first_audio()
                             got_audio = True
                             #await asyncio.to_thread(
-                            array.extend(bytes(inline.data))
-                            chunk_accum += len(inline.data)
+                            playback.arrived(resampler.process(inline.data, out=block).nbytes)
 
-                if chunk_accum > 72000:
+                if playback.should_flush(block.nbytes):
                     #await send_keep_alive(session)
-                    resampled = await asyncio.to_thread(array_resample, array, IN_RATE, OUT_RATE)
-                    await asyncio.to_thread(play_pcm_stream, audioClient, resampled, chunk_size = CHUNK_SIZE, sleep_time = DT)
-                    chunk_accum = 0
-                    array = bytearray([])
+                    playback.flushed(await playout.write(block, stream_id))
+                    block = playout.new_block()
 
                 if getattr(sc, "turn_complete", False):
-                    resampled = array_resample(array, IN_RATE, OUT_RATE)
-                    play_pcm_stream(audioClient, resampled, chunk_size = CHUNK_SIZE, sleep_time = DT)
+                    tracer.mark("turn_complete")
+                    resampler.flush(out=block)
+                    playback.flushed(await playout.write(block, stream_id))
+                    print(playback.summary())
                     turn_complete.set()
                     break
                     
@@ -389,34 +323,51 @@ async def play_reply_streaming(session):
             #out_stream.close()
 
 
+def report_first_audio():
+    tracer.mark("first_audio")
+    waited = tracer.elapsed("speech_end", "first_audio")
+    if waited is not None:
+        print(f"[LAT] first reply audio {waited:.2f}s after end of speech (turn end: {TURN_END})")
+
+
 async def send_one_turn(session):
     """
-    Send one utterance to the *same* live session.
-    We pace chunks roughly in real-time so VAD behaves more reliably.
+    Send one utterance to the *same* live session, paced by UPLINK_POLICY.
     """
+    uplink = UplinkScheduler(session, MIC_RATE, policy=UPLINK_POLICY)
     while True:
-        while queue.qsize() < 6:
+        while queue.qsize() < (6 if TURN_END == "padding" else 1):
             await asyncio.sleep(0.01)
 
         await asyncio.wait_for(turn_complete.wait(), timeout = 15.0)
         turn_complete.clear()
+        # the previous reply is complete, everything from here on belongs to this turn
+        tracer.start_turn()
+        uplink.start_turn()
+        if TURN_END == "activity":
+            await session.send_realtime_input(activity_start={})
         while True:
-            t0 = time.time()
             frame = await queue.get()
             
             if frame is None:
                 queue.task_done()
-                await session.send_realtime_input(audio_stream_end=True)
+                speech_start, speech_end = turn_stamps.popleft()
+                tracer.mark("speech_start", speech_start)
+                tracer.mark("speech_end", speech_end)
+                if TURN_END == "activity":
+                    await session.send_realtime_input(activity_end={})
+                else:
+                    await session.send_realtime_input(audio_stream_end=True)
+                tracer.mark("uplink_last")
+                uplink.end_turn()
+                print(uplink.summary())
                 break                
                 
-            chunk_secs = len(frame) / 2 / MIC_RATE
-            #for ch in frames:
             try:
-                await session.send_realtime_input(audio={"data": frame, "mime_type": f"audio/pcm;rate={MIC_RATE}"})
+                await uplink.send(frame)
             except Exception as e:
                 print(f"[SESSION ERROR]: {e}")
             queue.task_done()
-            await asyncio.sleep(chunk_secs - (time.time()- t0))  # helps VAD / turn-taking consistency
 
 async def send_keep_alive(session):
     await session.send_realtime_input(audio={"data": silence_chunk(), "mime_type": f"audio/pcm;rate={MIC_RATE}"})
@@ -431,30 +382,47 @@ async def main():
     print("  ENTER       -> stop and send")
     print("  q + ENTER   -> quit\n")
 
-    async with client.aio.live.connect(model=model, config=config) as session:
-        end = True
-        send_task = None
-        turn_complete.set()
-        while True:
-            #cmd = await wait_line("Ready. Press ENTER to record (or q to quit): ")
-            #if cmd.lower() == "q":
-            #    break
-
-            #frames = await record_until_enter(max_seconds=30.0)
-            #if len(frames) <= 6:
-            #    print("[INFO] Too short; try again.\n")
-            #    continue
-            if send_task is None:
-                send_task = asyncio.create_task(send_one_turn(session))
-                play_task = asyncio.create_task(play_reply_streaming(session))
-
-            end = await record_until_silence(max_seconds = 180.0, end_word = END_WORD)
+    await capture.start()
+    playout.start()
+    stt.start()
+    await calibrate_vad(capture)
+
+    send_task = None
+    play_task = None
+    try:
+        # connected before the first turn, and kept connected across GoAway and dropped sockets (see live_session.py)
+        async with LiveSession(client, model, config, rotate_after=LIVE_ROTATE_AFTER) as session:
+            end = True
+            turn_complete.set()
+            while True:
+                #cmd = await wait_line("Ready. Press ENTER to record (or q to quit): ")
+                #if cmd.lower() == "q":
+                #    break
+
+                #frames = await record_until_enter(max_seconds=30.0)
+                #if len(frames) <= 6:
+                #    print("[INFO] Too short; try again.\n")
+                #    continue
+                if send_task is None:
+                    send_task = asyncio.create_task(send_one_turn(session))
+                    play_task = asyncio.create_task(play_reply_streaming(session))
+
+                end = await record_until_silence(max_seconds = 180.0, end_word = END_WORD)
             
-            #    continue
-            print("[Gemini] replying...")     
-            #await send_one_turn(session, frames)
-            #await play_reply_streaming(session)
-            print()
+                #    continue
+                print("[Gemini] replying...")     
+                #await send_one_turn(session, frames)
+                #await play_reply_streaming(session)
+                print()
+    finally:
+        if send_task:
+            send_task.cancel()
+        if play_task:
+            play_task.cancel()
+        playout.stop()
+        await playout.close()
+        await stt.stop()
+        await capture.close()
 
     pya.terminate()
 
@@ -464,3 +432,5 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         pass
+    finally:
+        tracer.close()
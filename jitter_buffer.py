@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Loss / duplicate handling for the PC1 mic multicast.
+
+The datagrams are raw int16 PCM without sequence numbers, so problems can only be
+inferred from packet sizes and arrival times; true reordering cannot be detected.
+JitterBuffer keeps a media clock (anchor time + samples delivered) and compares
+every arrival with it:
+
+- a packet that arrives more than `tolerance` after its slot is held until the
+  next one shows up. If the next one follows in a burst, the stream was only
+  delayed and both are delivered (counted as late). Otherwise packets were lost
+  and the missing slots are filled with silence or a repeat of the last packet,
+- an early packet identical to one of the last few packets is a duplicate and is
+  dropped,
+- a gap longer than `max_gap` is taken as the stream pausing, not as loss, and the
+  clock is re-anchored.
+
+Small lateness is slowly folded into the anchor so PC1/PC2 clock drift does not
+turn into concealment. The tolerance follows the measured interarrival jitter
+(RFC 3550 estimator).
+"""
+import collections
+import time
+
+import numpy as np
+
+MIC_RATE = 16000
+CONCEALMENT = ("silence", "repeat")
+
+
+class JitterBuffer:
+    def __init__(self, rate: int = MIC_RATE, conceal: str = "silence", min_tolerance: float = 0.03,
+                 max_gap: float = 0.5, drift_alpha: float = 0.01, history: int = 4,
+                 report_interval: float | None = 60.0):
+        if conceal not in CONCEALMENT:
+            raise ValueError(f"Unknown concealment {conceal!r}, expected one of {CONCEALMENT}")
+        self.rate = rate
+        self.conceal = conceal
+        self.min_tolerance = min_tolerance
+        self.max_gap = max_gap
+        self.drift_alpha = drift_alpha
+        self.report_interval = report_interval
+
+        self._anchor = None     # arrival time of sample 0 on the media clock
+        self._samples = 0       # samples delivered downstream (received + concealed)
+        self._last_t = None
+        self._held = None       # packet that arrived after a gap, waiting for the next one
+        self._recent = collections.deque(maxlen=history)
+        self._sizes = collections.Counter()
+        self._last_report = None
+
+        # counters
+        self.packets = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.restarts = 0
+        self.concealed_samples = 0
+        self.jitter = 0.0       # seconds
+
+    @property
+    def nominal(self) -> int:
+        """Most common packet size in samples."""
+        return self._sizes.most_common(1)[0][0] if self._sizes else 0
+
+    @property
+    def tolerance(self) -> float:
+        return max(self.min_tolerance, 0.5 * self.nominal / self.rate, 4 * self.jitter)
+
+    def process(self, data, t: float | None = None) -> list[tuple[bytes, float]]:
+        """Take one datagram, return the (pcm, arrival_time) chunks to hand downstream, in order."""
+        if t is None:
+            t = time.monotonic()
+        n = len(data) // 2
+        if n == 0:
+            return []
+        self.packets += 1
+        if self._sizes.total() < 1000:
+            self._sizes[n] += 1
+        dur = n / self.rate
+        self._maybe_report(t)
+
+        if self._last_t is not None:
+            d = (t - self._last_t) - dur
+            self.jitter += (abs(d) - self.jitter) / 16
+        self._last_t = t
+
+        out = []
+        if self._held is not None:
+            out.extend(self._release(t))
+
+        if self._anchor is None:
+            self._anchor = t - dur
+            out.append(self._accept(data, n, t))
+            return out
+
+        offset = t - (self._anchor + (self._samples + n) / self.rate)
+
+        if offset > self.max_gap:
+            self.restarts += 1
+            self._anchor = t - (self._samples + n) / self.rate
+        elif offset > self.tolerance:
+            nominal = self.nominal or n
+            self._held = (bytes(data), n, t, int(offset * self.rate) // nominal * nominal)
+            return out
+        elif offset < -0.5 * dur:
+            if bytes(data) in self._recent:
+                self.duplicates += 1
+                return out
+            # sender ahead of our clock: earliest arrivals define it
+            self._anchor += offset
+        elif offset > 0:
+            self._anchor += offset * self.drift_alpha
+
+        out.append(self._accept(data, n, t))
+        return out
+
+    def _release(self, t: float) -> list[tuple[bytes, float]]:
+        """Decide what the held packet was: late (next one came in a burst) or preceded by a loss."""
+        pcm, n, t_held, missing = self._held
+        self._held = None
+        out = []
+        if t - t_held < 0.5 * n / self.rate:
+            self.late += 1
+        elif missing:
+            out.append((self._concealment(missing), t_held - n / self.rate))
+            self.lost += max(1, missing // (self.nominal or n))
+            self.concealed_samples += missing
+            self._samples += missing
+        out.append(self._accept(pcm, n, t_held))
+        return out
+
+    def flush(self) -> list[tuple[bytes, float]]:
+        """Deliver a held packet without waiting for the next arrival (e.g. on shutdown)."""
+        if self._held is None:
+            return []
+        pcm, n, t_held, _ = self._held
+        self._held = None
+        return [self._accept(pcm, n, t_held)]
+
+    def _accept(self, data, n: int, t: float) -> tuple[bytes, float]:
+        pcm = bytes(data)
+        self._recent.append(pcm)
+        self._samples += n
+        return pcm, t
+
+    def _concealment(self, samples: int) -> bytes:
+        if self.conceal == "repeat" and self._recent:
+            last = np.frombuffer(self._recent[-1], dtype=np.int16)
+            return np.resize(last, samples).tobytes()
+        return bytes(2 * samples)
+
+    def stats(self) -> dict:
+        expected = self.packets - self.duplicates + self.lost
+        return {
+            "packets": self.packets,
+            "lost": self.lost,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "restarts": self.restarts,
+            "loss_rate": self.lost / expected if expected else 0.0,
+            "jitter_ms": 1000 * self.jitter,
+            "concealed_s": self.concealed_samples / self.rate,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"[JITTER] packets={s['packets']} lost={s['lost']} ({100 * s['loss_rate']:.2f}%) "
+                f"late={s['late']} dup={s['duplicates']} restarts={s['restarts']} "
+                f"jitter={s['jitter_ms']:.1f}ms concealed={s['concealed_s']:.2f}s")
+
+    def _maybe_report(self, t: float):
+        if self.report_interval is None:
+            return
+        if self._last_report is None:
+            self._last_report = t
+        elif t - self._last_report >= self.report_interval:
+            self._last_report = t
+            print(self.summary())
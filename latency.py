@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Per-turn latency tracing.
+
+Every script runs a turn through the same stages: something starts it (wake word,
+Enter key or controller button), the user talks, the audio is uploaded, Gemini
+answers and the reply is handed to the robot and played. TurnTracer stamps the
+monotonic time of each of these events:
+
+    wake           wake word detected (Enter / button press in the manual scripts)
+    speech_start   capture time of the first mic sample of the turn
+    speech_end     the recorder decided the user stopped talking
+    uplink_last    last uplink frame, or the end-of-turn signal, sent
+    first_message  first Live message received for the turn
+    first_audio    first reply audio part received
+    first_play     first PlayStream call of the reply
+    turn_complete  turn_complete received
+    drained        when the robot runs out of reply audio (last hand-over plus its
+                   duration, or the PlayStop of an interrupted reply)
+
+and writes one compact JSON line per turn: the event times in ms after the
+earliest event of the turn, and the stage durations below. close() prints p50/p95
+of every stage over the session, so the stage that dominates is visible at once.
+
+mark() may be called from any thread (PlayoutEngine stamps first_play and drained
+from its own). The first stamp of an event in a turn wins, unless last=True.
+Stamps while no turn is open are ignored, and so are stamps tagged with the
+turn_id of a turn that is already over: the playout thread tags them with the
+turn the audio was queued in, so the tail of a reply that is still playing when
+the next turn starts (repeater, barge-in) does not land in the next record.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+
+EVENTS = ("wake", "speech_start", "speech_end", "uplink_last", "first_message",
+          "first_audio", "first_play", "turn_complete", "drained")
+
+# (name, from event, to event)
+STAGES = (
+    ("speaking", "speech_start", "speech_end"),
+    ("uplink", "speech_end", "uplink_last"),
+    ("server", "uplink_last", "first_message"),
+    ("first_audio", "first_message", "first_audio"),
+    ("handover", "first_audio", "first_play"),
+    ("reply", "first_play", "turn_complete"),
+    ("playback", "turn_complete", "drained"),
+    ("response", "speech_end", "first_play"),   # what the user waits for
+)
+
+
+class TurnTracer:
+    def __init__(self, path: str | None = None, info: dict | None = None):
+        self.path = path            # JSONL output, appended to; None keeps the records in memory only
+        self.info = info or {}      # copied into every record (script, turn end mode, ...)
+        self.turns = 0
+        self.turn_id = 0            # bumped by start_turn(), to tag stamps made later with their turn
+        self.stages = {name: [] for name, _, _ in STAGES}
+        self._turn = None
+        self._wall = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def start_turn(self) -> int:
+        """Close the open turn (if any) and open a new one. Returns its turn_id."""
+        self.end_turn()
+        with self._lock:
+            self._turn = {}
+            self._wall = time.time()
+            self.turn_id += 1
+            return self.turn_id
+
+    def mark(self, event: str, t: float | None = None, last: bool = False, turn: int | None = None):
+        """Stamp `event` at `t` (default: now). With `turn`, only if that turn_id is still the open turn."""
+        if event not in EVENTS:
+            raise ValueError(f"Unknown event {event!r}, expected one of {EVENTS}")
+        t = time.monotonic() if t is None else t
+        with self._lock:
+            if turn is not None and turn != self.turn_id:
+                return
+            if self._turn is not None and (last or event not in self._turn):
+                self._turn[event] = t
+
+    def elapsed(self, start: str, end: str) -> float | None:
+        """Seconds between two events of the open turn, None unless both were stamped."""
+        with self._lock:
+            turn = self._turn or {}
+            if start in turn and end in turn:
+                return turn[end] - turn[start]
+        return None
+
+    def end_turn(self) -> dict | None:
+        """Write the open turn out and return its record (None if nothing was stamped)."""
+        with self._lock:
+            turn, self._turn = self._turn, None
+        if not turn:
+            return None
+        self.turns += 1
+        t0 = min(turn.values())
+        record = {"turn": self.turns, "time": round(self._wall, 3), **self.info,
+                  "ms": {e: round(1000 * (turn[e] - t0)) for e in EVENTS if e in turn}, "stages": {}}
+        for name, a, b in STAGES:
+            if a in turn and b in turn:
+                ms = round(1000 * (turn[b] - turn[a]))
+                record["stages"][name] = ms
+                self.stages[name].append(ms)
+        if self.path is not None:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return record
+
+    def close(self):
+        self.end_turn()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        print(self.summary())
+
+    def percentiles(self) -> dict:
+        """{stage: (p50, p95, turns)} in ms, for the stages seen at least once."""
+        return {name: (float(np.percentile(v, 50)), float(np.percentile(v, 95)), len(v))
+                for name, v in self.stages.items() if v}
+
+    def summary(self) -> str:
+        stats = self.percentiles()
+        if not stats:
+            return "[LAT] no turns traced"
+        parts = " ".join(f"{name}={p50:.0f}/{p95:.0f}" for name, (p50, p95, _) in stats.items())
+        return f"[LAT] {self.turns} turns, p50/p95 ms: {parts}"
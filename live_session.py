@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""
+A Live API session that outlives its websocket.
+
+The Live API closes connections on its own: a session has a maximum duration,
+the server announces maintenance with a GoAway message some seconds ahead, and
+the network to the robot is not perfect. With one client.aio.live.connect() per
+run the script died with the socket, and every start paid TLS plus setup before
+the first turn. LiveSession keeps a connection up in the background instead:
+
+- it connects as soon as it is entered (before the wake word, so the first turn
+  finds the session warm) and reconnects whenever the connection ends, with
+  backoff while the server cannot be reached;
+- session resumption is always requested. The newest resumable handle is used
+  for the next connection, so the conversation context survives it. A handle the
+  server refuses is dropped and a fresh session is opened;
+- on GoAway it moves to a new connection between turns, or, inside a turn, shortly
+  before the announced time runs out;
+- with `idle_timeout`, a connection nothing was sent or received on for that long
+  (outside a turn) is closed instead of kept alive, and the session hibernates
+  until wake() or the next send. The wake word scripts call wake() when their
+  energy gate opens, so the connection is set up while the user is still saying
+  the wake phrase (a gate opening on noise costs a reconnect that hibernates
+  again); the push-to-talk scripts send from the press on, which reopens it. The
+  handle is kept, so the reopened session resumes the conversation;
+- for all-day runs, long_running() turns on context window compression in the
+  config: past `trigger_tokens` the server drops the oldest turns down to
+  `target_tokens` (sliding window), so a turn does not get slower as the
+  conversation grows and the session has no duration limit. It also turns on the
+  transcription of both sides. With `rotate_after`, once that many seconds of
+  audio went through one session, LiveSession moves to a fresh session between
+  turns and seeds it with a text summary of the transcript (compact_summary(),
+  or `summarize`). A new session opened because a handle was refused is seeded
+  the same way, so it keeps the gist of the conversation instead of nothing;
+- one task reads the socket all the time (resumption updates and GoAway are seen
+  even while no turn is being received) and queues model messages for receive();
+- everything the script sends after the last resumable state (the newest
+  handle, or the end of the model's last turn) is kept and sent again on the new
+  connection, so the user's audio of a turn cut by a drop is not lost (at most
+  `max_backlog` seconds of it; with last_consumed_client_message_index the server
+  says exactly which messages its state includes). While no
+  connection is up, sends wait for one: the audio stays in the recorder's queue
+  and the capture ring. If the reply had already started, an interrupted message
+  is queued before the reply to the resent turn.
+
+It has the methods of the SDK session the scripts use (send_realtime_input,
+send_client_content, send_tool_response, receive), so it can be passed where the
+session was. Metrics: connect and reconnect times, GoAway notices, resumed vs
+fresh reconnects and how many turns had to wait for a connection (cold turns);
+summary() prints them, together with hibernations, reopen times, the time
+actually connected and the rotations.
+
+    async with LiveSession(client, model, config) as session:
+        ...
+
+    async with LiveSession(client, model, long_running(config), rotate_after=3600) as session:
+        ...
+"""
+import asyncio
+import collections
+import time
+
+import numpy as np
+from google.genai import types
+
+MIC_RATE = 16000
+REPLY_RATE = 24000
+# transcript entries kept for the summary a new session is seeded with
+TRANSCRIPT_TURNS = 200
+
+
+def _seconds(duration) -> float | None:
+    """A protobuf Duration as sent in GoAway.time_left ("12.5s"), or a number."""
+    if duration is None:
+        return None
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    try:
+        return float(str(duration).rstrip("s"))
+    except ValueError:
+        return None
+
+
+def _turn_done(sc) -> bool:
+    return bool(sc and sc.turn_complete)
+
+
+def long_running(config: dict, trigger_tokens: int = 32000, target_tokens: int = 16000) -> dict:
+    """`config` with sliding-window context compression and transcription of both sides."""
+    config = dict(config)
+    config["context_window_compression"] = {"trigger_tokens": trigger_tokens,
+                                            "sliding_window": {"target_tokens": target_tokens}}
+    config.setdefault("input_audio_transcription", {})
+    config.setdefault("output_audio_transcription", {})
+    return config
+
+
+def compact_summary(transcript, max_chars: int = 2000) -> str:
+    """The newest (role, text) entries of `transcript` that fit in about `max_chars`, as one text."""
+    lines = []
+    size = 0
+    for role, text in reversed(transcript):
+        line = f"{role}: {text}"
+        if lines and size + len(line) > max_chars:
+            break
+        lines.append(line[:max_chars])
+        size += len(line) + 1
+    lines.reverse()
+    return (f"Summary of the conversation so far (the last {len(lines)} of {len(transcript)} lines), "
+            f"continue it without mentioning this summary:\n" + "\n".join(lines))
+
+
+class LiveSession:
+    def __init__(self, client, model: str, config: dict, rate: int = MIC_RATE, max_backlog: float = 30.0,
+                 go_away_margin: float = 1.0, retry_delay: tuple[float, float] = (0.5, 10.0),
+                 idle_timeout: float | None = None, rotate_after: float | None = None,
+                 summarize=None, summary_chars: int = 2000):
+        self.client = client
+        self.model = model
+        self.config = dict(config)
+        self.rate = rate
+        self.max_backlog = max_backlog          # seconds of sent audio kept for resending
+        self.go_away_margin = go_away_margin    # switch this long before a GoAway deadline
+        self.retry_delay = retry_delay          # first and largest wait between failed connects
+        self.idle_timeout = idle_timeout        # close after this long without traffic (None: never)
+        self.rotate_after = rotate_after        # seconds of audio in one session before a fresh one (None: never)
+        self.summarize = summarize or (lambda transcript: compact_summary(transcript, summary_chars))
+        self.transcript = collections.deque(maxlen=TRANSCRIPT_TURNS)   # (role, text) of the finished turns
+        self.handle = None
+
+        self._session = None
+        self._ready = asyncio.Event()
+        self._switch = asyncio.Event()
+        self._messages = asyncio.Queue()
+        self._task = None
+        self._go_away_timer = None
+        # sent after the last resumable state: [message index on its connection or None, method, kwargs, seconds]
+        self._backlog = collections.deque()
+        self._backlog_s = 0.0
+        self._sent = 0              # client messages on the current connection
+        self._turn_open = False
+        self._turn_cold = False
+        self._reply_started = False
+        self._dropped_at = None
+        self._answered = False      # a turn was completed: a session without its handle loses context
+        self._last_activity = time.monotonic()
+        self._hibernating = False
+        self._wake = asyncio.Event()
+        self._woken_at = None
+        self._up_since = None
+        self._heard = {"user": "", "model": ""}     # transcription of the turn in progress
+        self._session_audio = 0.0   # seconds of audio both ways since the session was opened
+        self._rotate = False
+
+        # metrics
+        self.connects = 0
+        self.connect_seconds = []   # first connection (pre-warm)
+        self.reconnect_seconds = []  # from losing a connection to the next one being ready
+        self.resumed = 0
+        self.fresh = 0              # reconnects without a usable handle: context lost
+        self.go_aways = 0
+        self.failures = 0
+        self.resent = 0
+        self.turns = 0
+        self.cold_turns = 0
+        self.cold_wait = 0.0
+        self.hibernations = 0
+        self.reopen_seconds = []    # from wake() (or the send that woke it) to the connection being ready
+        self.speculative = 0        # reopens started by wake() before anything was sent
+        self.connected_seconds = 0.0
+        self.rotations = 0
+        self.seeded = 0             # new sessions given a summary of the transcript
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        print(self.summary())
+
+    async def start(self):
+        """Start connecting in the background; sends wait until the connection is ready."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def hibernating(self) -> bool:
+        return self._hibernating
+
+    def wake(self, speculative: bool = True):
+        """A turn is probably coming: reopen a hibernating session now, or put off hibernating."""
+        self._last_activity = time.monotonic()
+        if self._hibernating:
+            self._hibernating = False
+            self._woken_at = self._last_activity
+            self.speculative += speculative
+            print(f"[LIVE] waking up{' (speculative)' if speculative else ''}")
+            self._wake.set()
+
+    async def wait_ready(self, timeout: float | None = None) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    # ---- what the scripts call on the session ----
+
+    async def send_realtime_input(self, **kwargs):
+        await self._send("send_realtime_input", kwargs)
+
+    async def send_client_content(self, **kwargs):
+        await self._send("send_client_content", kwargs)
+
+    async def send_tool_response(self, **kwargs):
+        await self._send("send_tool_response", kwargs)
+
+    async def receive(self):
+        """Messages of ONE model turn, like the SDK session's receive(), across reconnects."""
+        while True:
+            msg = await self._messages.get()
+            yield msg
+            if _turn_done(msg.server_content):
+                return
+
+    # ---- sending ----
+
+    async def _send(self, method: str, kwargs: dict):
+        self.wake(speculative=False)
+        if not self._turn_open:
+            self._turn_open = True
+            self._turn_cold = False
+            self.turns += 1
+        audio = kwargs.get("audio")
+        seconds = len(audio["data"]) / 2 / self.rate if isinstance(audio, dict) and "data" in audio else 0.0
+        self._session_audio += seconds
+        entry = [None, method, kwargs, seconds]
+        self._backlog.append(entry)
+        self._backlog_s += seconds
+        while self._backlog_s > self.max_backlog and len(self._backlog) > 1:
+            self._backlog_s -= self._backlog.popleft()[3]
+
+        while True:
+            if not self._ready.is_set():
+                if not self._turn_cold:
+                    self._turn_cold = True
+                    self.cold_turns += 1
+                t0 = time.monotonic()
+                await self._ready.wait()
+                self.cold_wait += time.monotonic() - t0
+            if entry[0] is not None:
+                return      # sent while the new connection resent the backlog
+            session = self._session
+            try:
+                self._sent += 1
+                entry[0] = self._sent
+                await getattr(session, method)(**kwargs)
+                return
+            except Exception as e:
+                # the socket is going away; the entry is resent on the next connection
+                entry[0] = None
+                if session is self._session:
+                    print(f"[LIVE] send failed ({type(e).__name__}: {e}), reconnecting")
+                    self._ready.clear()
+                    self._switch.set()
+
+    async def _resend(self, session):
+        """Send the backlog on a new connection, including what is appended meanwhile."""
+        k = 0
+        while k < len(self._backlog):
+            entry = self._backlog[k]
+            self._sent += 1
+            entry[0] = self._sent
+            await getattr(session, entry[1])(**entry[2])
+            self.resent += 1
+            k += 1
+
+    def _trim(self, consumed: int):
+        """Forget messages the server reports as part of the resumable state."""
+        while self._backlog and self._backlog[0][0] is not None and self._backlog[0][0] <= consumed:
+            self._backlog_s -= self._backlog.popleft()[3]
+
+    # ---- receiving ----
+
+    async def _pump(self, session):
+        while True:
+            async for msg in session.receive():
+                self._handle(msg)
+
+    def _handle(self, msg):
+        self._last_activity = time.monotonic()
+        update = msg.session_resumption_update
+        if update is not None:
+            if update.resumable and update.new_handle:
+                self.handle = update.new_handle
+                if update.last_consumed_client_message_index is not None:
+                    # counted from the setup message as 0, so the first message sent after it is 1
+                    self._trim(update.last_consumed_client_message_index)
+                else:
+                    # the handle covers what the server had when it sent the update
+                    self._trim(self._sent)
+        if msg.go_away is not None:
+            self._go_away(_seconds(msg.go_away.time_left))
+        if update is not None or msg.go_away is not None:
+            if msg.server_content is None and msg.tool_call is None:
+                return
+
+        sc = msg.server_content
+        if sc is not None:
+            self._transcribe(sc)
+        if sc is not None and sc.model_turn is not None:
+            self._reply_started = True
+        self._messages.put_nowait(msg)
+        if _turn_done(sc):
+            for role in ("user", "model"):
+                if self._heard[role].strip():
+                    self.transcript.append((role, self._heard[role].strip()))
+                self._heard[role] = ""
+            self._answered = True
+            self._turn_open = False
+            self._reply_started = False
+            self._backlog.clear()
+            self._backlog_s = 0.0
+            if self._go_away_timer is not None:
+                # a GoAway came in during the turn: move now, between turns
+                self._switch.set()
+            if self.rotate_after is not None and self._session_audio >= self.rotate_after:
+                self._rotate = True
+                self._switch.set()
+
+    def _transcribe(self, sc):
+        """Collect the transcriptions and count the model's audio of the turn in progress."""
+        if sc.interrupted:
+            self._heard["model"] = ""
+        if sc.input_transcription is not None and sc.input_transcription.text:
+            self._heard["user"] += sc.input_transcription.text
+        if sc.output_transcription is not None and sc.output_transcription.text:
+            self._heard["model"] += sc.output_transcription.text
+        if sc.model_turn is not None:
+            for part in sc.model_turn.parts or []:
+                if part.inline_data is not None and part.inline_data.data:
+                    self._session_audio += len(part.inline_data.data) / 2 / REPLY_RATE
+
+    def _go_away(self, time_left: float | None):
+        self.go_aways += 1
+        print(f"[LIVE] server going away in {time_left if time_left is not None else '?'}s")
+        if not self._turn_open or time_left is None:
+            self._switch.set()
+        elif self._go_away_timer is None:
+            delay = max(0.0, time_left - self.go_away_margin)
+            self._go_away_timer = asyncio.get_running_loop().call_later(delay, self._switch.set)
+
+    # ---- connection ----
+
+    async def _idle(self):
+        """Return once the connection was unused for idle_timeout seconds, outside a turn."""
+        while True:
+            left = self._last_activity + self.idle_timeout - time.monotonic()
+            if left <= 0 and not self._turn_open:
+                return
+            await asyncio.sleep(left if left > 0 else self.idle_timeout)
+
+    def _connect_config(self, handle: str | None) -> dict:
+        config = dict(self.config)
+        config["session_resumption"] = {"handle": handle} if handle else {}
+        return config
+
+    async def _run(self):
+        delay = self.retry_delay[0]
+        while True:
+            if self._hibernating:
+                await self._wake.wait()
+                self._wake.clear()
+            rotate = self._rotate
+            handle = None if rotate else self.handle
+            started = time.monotonic()
+            pump = switch = idle = None
+            ready = False
+            try:
+                async with self.client.aio.live.connect(model=self.model, config=self._connect_config(handle)) as session:
+                    self._session = session
+                    self._sent = 0
+                    for entry in self._backlog:
+                        entry[0] = None     # indices count per connection
+                    self._switch.clear()
+                    if rotate:
+                        self.handle = None      # the old session's handles must not be used any more
+                    pump = asyncio.create_task(self._pump(session))
+                    seeded = handle is None and bool(self.transcript)
+                    if seeded:
+                        await self._seed(session)
+                    if handle is None:
+                        self._session_audio = 0.0
+                        self._rotate = False
+                    if self._reply_started:
+                        # the rest of the reply is lost, the resent turn is answered again
+                        self._messages.put_nowait(types.LiveServerMessage(
+                            server_content=types.LiveServerContent(interrupted=True)))
+                        self._reply_started = False
+                    await self._resend(session)
+                    ready = True
+                    self._connected(started, handle, rotate, seeded)
+                    self._ready.set()
+                    delay = self.retry_delay[0]
+
+                    switch = asyncio.create_task(self._switch.wait())
+                    waits = {pump, switch}
+                    if self.idle_timeout is not None:
+                        idle = asyncio.create_task(self._idle())
+                        waits.add(idle)
+                    await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                    if pump.done() and not pump.cancelled() and pump.exception() is not None:
+                        raise pump.exception()
+                    if idle is not None and idle.done() and not switch.done():
+                        self._hibernating = True
+                        self.hibernations += 1
+                        print(f"[LIVE] idle for {self.idle_timeout:.0f}s, closing the connection until the next turn")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[LIVE] connection {'lost' if ready else 'failed'}: {type(e).__name__}: {e}")
+                if not ready:
+                    self.failures += 1
+                    if handle is not None and handle == self.handle:
+                        # the server did not take the handle (expired?): start a fresh session next time
+                        self.handle = None
+            finally:
+                self._ready.clear()
+                self._session = None
+                for task in (pump, switch, idle):
+                    if task is not None:
+                        task.cancel()
+                if self._go_away_timer is not None:
+                    self._go_away_timer.cancel()
+                    self._go_away_timer = None
+                if ready:
+                    self._dropped_at = time.monotonic()
+                    self.connected_seconds += self._dropped_at - self._up_since
+            if not ready:
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, self.retry_delay[1])
+
+    async def _seed(self, session):
+        """Give a new session the summary of the transcript as context, without asking for a reply."""
+        text = self.summarize(list(self.transcript))
+        self._sent += 1
+        await session.send_client_content(turns=[{"role": "user", "parts": [{"text": text}]}], turn_complete=False)
+        self.seeded += 1
+
+    def _connected(self, started: float, handle: str | None, rotate: bool = False, seeded: bool = False):
+        self.connects += 1
+        now = time.monotonic()
+        self._up_since = now
+        if self._dropped_at is None:
+            self.connect_seconds.append(now - started)
+            print(f"[LIVE] connected in {now - started:.2f}s")
+            return
+        # without a handle the completed turns are lost (but for the summary); the open one is resent
+        lost = not handle and self._answered and not rotate
+        if handle:
+            self.resumed += 1
+        elif rotate:
+            self.rotations += 1
+        elif lost:
+            self.fresh += 1
+        how = ('resumed' if handle else 'rotated to a new session' if rotate
+               else 'new session, context lost' if lost else 'new session')
+        if seeded:
+            how += f", seeded with a summary of {len(self.transcript)} lines"
+        if self._woken_at is not None:
+            seconds = now - self._woken_at
+            self._woken_at = None
+            self.reopen_seconds.append(seconds)
+            print(f"[LIVE] reopened in {seconds:.2f}s ({how})")
+            return
+        seconds = now - self._dropped_at
+        self.reconnect_seconds.append(seconds)
+        print(f"[LIVE] reconnected in {seconds:.2f}s ({how}"
+              f"{f', resent {len(self._backlog)} messages' if self._backlog else ''})")
+
+    def metrics(self) -> dict:
+        def ms(values):
+            return [round(1000 * float(np.percentile(values, q))) for q in (50, 95)] if values else None
+
+        return {"connects": self.connects, "reconnects": len(self.reconnect_seconds),
+                "resumed": self.resumed, "fresh": self.fresh, "go_aways": self.go_aways,
+                "failures": self.failures, "resent": self.resent,
+                "connect_ms": ms(self.connect_seconds), "reconnect_p50_p95_ms": ms(self.reconnect_seconds),
+                "turns": self.turns, "cold_turns": self.cold_turns, "cold_wait_s": round(self.cold_wait, 3),
+                "hibernations": self.hibernations, "reopens": len(self.reopen_seconds),
+                "speculative": self.speculative, "reopen_p50_p95_ms": ms(self.reopen_seconds),
+                "connected_s": round(self.connected_seconds, 1), "rotations": self.rotations,
+                "seeded": self.seeded, "session_audio_s": round(self._session_audio, 1)}
+
+    def summary(self) -> str:
+        m = self.metrics()
+        reconnect = (f", reconnect p50/p95 {m['reconnect_p50_p95_ms'][0]}/{m['reconnect_p50_p95_ms'][1]}ms"
+                     if m["reconnect_p50_p95_ms"] else "")
+        hibernation = ""
+        if m["hibernations"]:
+            reopen = (f", reopen p50/p95 {m['reopen_p50_p95_ms'][0]}/{m['reopen_p50_p95_ms'][1]}ms"
+                      if m["reopen_p50_p95_ms"] else "")
+            hibernation = (f"; hibernated {m['hibernations']}x, {m['reopens']} reopens "
+                           f"({m['speculative']} speculative){reopen}, connected {m['connected_s']:.0f}s")
+        rotation = (f"; {m['rotations']} rotations, {m['seeded']} sessions seeded with a summary"
+                    if m["rotations"] or m["seeded"] else "")
+        return (f"[LIVE] {m['connects']} connections ({m['reconnects']} reconnects; {m['resumed']} resumed, "
+                f"{m['fresh']} fresh; {m['go_aways']} GoAway){reconnect}; "
+                f"{m['cold_turns']}/{m['turns']} turns waited for a connection ({m['cold_wait_s']:.2f}s){hibernation}{rotation}")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Persistent capture of the G1 microphone stream.
+
+PC1 publishes the mic as int16 mono PCM over UDP multicast. MicCapture joins the
+group once, keeps the socket for the whole process and writes every packet into a
+preallocated int16 ring buffer. Wake-word, recording and uplink stages read from it
+through their own CaptureCursor, so no packet is lost when the script switches stage.
+
+Packets come from a source (mic_sources.py): the live multicast stream by default,
+or a ReplaySource playing back a recording at real time or faster. With `record`
+every packet is also saved, as received, for replaying later. An optional
+JitterBuffer sits between the source and the ring to conceal lost packets and drop
+duplicates, and an optional EchoCanceller removes the robot's own voice from every
+packet before it is stored, so all readers get the cancelled mic.
+"""
+import asyncio
+import socket
+import time
+
+import numpy as np
+
+from aec import EchoCanceller
+from jitter_buffer import JitterBuffer
+from mic_sources import MicRecorder, MulticastSource
+
+MIC_RATE = 16000
+RING_SECONDS = 60.0
+PKT_HISTORY = 4096      # packets kept for timestamp lookups
+
+
+class MicCapture:
+    """
+    Long-lived owner of the mic source and of the shared ring buffer.
+
+    Samples are addressed by their absolute index since start(); `write_pos` is the
+    index of the next sample to be written. Only the last `capacity` samples are
+    kept, older data is overwritten.
+
+    `sock` and `receiver` configure the default MulticastSource; `source` replaces
+    it. `record` is a MicRecorder or the path of a new recording.
+    """
+
+    def __init__(self, rate: int = MIC_RATE, seconds: float = RING_SECONDS, sock: socket.socket | None = None,
+                 receiver: str = "thread", jitter: JitterBuffer | None = None, echo: EchoCanceller | None = None,
+                 source=None, record: MicRecorder | str | None = None):
+        self.rate = rate
+        self.source = source if source is not None else MulticastSource(sock, receiver)
+        self.recorder = MicRecorder(record, rate) if isinstance(record, str) else record
+        self.jitter = jitter
+        self.echo = echo
+        self.echo_errors = 0
+        self.capacity = int(rate * seconds)
+        self._ring = np.zeros(self.capacity, dtype=np.int16)
+        self.write_pos = 0
+
+        # absolute index of the last sample + 1 and arrival time of each packet
+        self._pkt_end = np.zeros(PKT_HISTORY, dtype=np.int64)
+        self._pkt_time = np.zeros(PKT_HISTORY, dtype=np.float64)
+        self.packets = 0
+
+        self._started = False
+        self._waiters: list[asyncio.Future] = []
+
+    async def start(self):
+        """Start receiving from the source in the background (once)."""
+        if self._started:
+            return
+        self._started = True
+        await self.source.start(self)
+
+    async def close(self):
+        if self._started:
+            await self.source.close()
+            self._started = False
+        if self.jitter is not None:
+            for pcm, t in self.jitter.flush():
+                self._write_ring(pcm, t)
+            self.wake()
+            print(self.jitter.summary())
+        if self.echo is not None:
+            print(self.echo.summary() + (f" errors={self.echo_errors}" if self.echo_errors else ""))
+        if self.recorder is not None:
+            self.recorder.close()
+            print(self.recorder.summary())
+
+    def write(self, data, t: float | None = None):
+        """Append one packet of int16 PCM to the ring and wake the readers. `t` is its arrival time (time.monotonic)."""
+        self.store(data, t)
+        self.wake()
+
+    def store(self, data, t: float | None = None):
+        """write() without waking the readers, for a source thread that calls wake() once per batch on the loop."""
+        if t is None:
+            t = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.write(data, t)
+        if self.jitter is None:
+            self._write_ring(data, t)
+            return
+        for pcm, tc in self.jitter.process(data, t):
+            self._write_ring(pcm, tc)
+
+    def _write_ring(self, data, t: float):
+        samples = np.frombuffer(data, dtype=np.int16, count=len(data) // 2)
+        n = len(samples)
+        if n == 0:
+            return
+        if self.echo is not None:
+            try:
+                samples = self.echo.process(samples, t)
+            except Exception as e:
+                # the raw mic is better than a dead capture thread
+                self.echo_errors += 1
+                if self.echo_errors == 1:
+                    print(f"[AEC] failed ({type(e).__name__}: {e}), passing the mic through")
+        skip = max(0, n - self.capacity)
+        samples = samples[skip:]
+
+        start = (self.write_pos + skip) % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._ring[start:start + first] = samples[:first]
+        self._ring[:len(samples) - first] = samples[first:]
+        self.write_pos += n
+
+        slot = self.packets % PKT_HISTORY
+        self._pkt_end[slot] = self.write_pos
+        self._pkt_time[slot] = t
+        self.packets += 1
+
+    def wake(self):
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    @property
+    def oldest_pos(self) -> int:
+        """Index of the oldest sample still held in the ring."""
+        return max(0, self.write_pos - self.capacity)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy samples [start, end) out of the ring. `start` is clamped to the oldest sample kept."""
+        start = max(start, self.oldest_pos)
+        end = min(end, self.write_pos)
+        if end <= start:
+            return np.zeros(0, dtype=np.int16)
+        i0 = start % self.capacity
+        i1 = i0 + (end - start)
+        if i1 <= self.capacity:
+            return self._ring[i0:i1].copy()
+        return np.concatenate((self._ring[i0:], self._ring[:i1 - self.capacity]))
+
+    def time_of(self, index: int) -> float:
+        """Monotonic capture time of sample `index`, derived from the arrival time of its packet."""
+        count = min(self.packets, PKT_HISTORY)
+        if count == 0:
+            return time.monotonic()
+        last = (self.packets - 1) % PKT_HISTORY
+        if count == 1 or index >= self._pkt_end[(self.packets - 2) % PKT_HISTORY]:
+            # newest packet, the common case for readers keeping up
+            return float(self._pkt_time[last] - (self._pkt_end[last] - index) / self.rate)
+        order = np.arange(self.packets - count, self.packets) % PKT_HISTORY
+        ends = self._pkt_end[order]
+        k = min(int(np.searchsorted(ends, index, side="right")), count - 1)
+        return float(self._pkt_time[order[k]] - (ends[k] - index) / self.rate)
+
+    def index_at(self, t: float) -> int:
+        """Inverse of time_of: index of the sample captured at monotonic time `t`."""
+        count = min(self.packets, PKT_HISTORY)
+        if count == 0:
+            return self.write_pos
+        order = np.arange(self.packets - count, self.packets) % PKT_HISTORY
+        times = self._pkt_time[order]
+        k = min(int(np.searchsorted(times, t)), count - 1)
+        index = int(self._pkt_end[order[k]] - (times[k] - t) * self.rate)
+        return min(max(index, self.oldest_pos), self.write_pos)
+
+    async def wait_for(self, index: int, timeout: float | None = None) -> bool:
+        """Wait until sample `index` has been written. Returns False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.write_pos <= index:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            fut = loop.create_future()
+            self._waiters.append(fut)
+            try:
+                await asyncio.wait_for(fut, remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def cursor(self, start: int | None = None) -> "CaptureCursor":
+        """New reader positioned at `start` (default: now)."""
+        return CaptureCursor(self, self.write_pos if start is None else start)
+
+
+class CaptureCursor:
+    """Independent read position over a MicCapture ring."""
+
+    def __init__(self, capture: MicCapture, pos: int):
+        self.capture = capture
+        self.pos = pos
+        self.overruns = 0
+
+    def available(self) -> int:
+        return self.capture.write_pos - self.pos
+
+    @property
+    def time(self) -> float:
+        """Capture time of the next sample this cursor will return."""
+        return self.capture.time_of(self.pos)
+
+    def seek(self, pos: int):
+        self.pos = pos
+
+    def _check_overrun(self):
+        oldest = self.capture.oldest_pos
+        if self.pos < oldest:
+            self.overruns += 1
+            print(f"[CAPTURE] Reader fell behind, skipping {oldest - self.pos} samples")
+            self.pos = oldest
+
+    def read_available(self, max_samples: int | None = None) -> bytes:
+        """Return whatever is buffered after the cursor (possibly b'') and advance."""
+        self._check_overrun()
+        end = self.capture.write_pos
+        if max_samples is not None:
+            end = min(end, self.pos + max_samples)
+        data = self.capture.read(self.pos, end)
+        self.pos += len(data)
+        return data.tobytes()
+
+    async def read(self, max_samples: int | None = None, timeout: float | None = None) -> bytes:
+        """Wait for new audio and return it. Returns b'' if nothing arrived before `timeout`."""
+        if self.available() <= 0:
+            await self.capture.wait_for(self.pos, timeout)
+        return self.read_available(max_samples)
+
+    def read_frames(self, frame_samples: int) -> list[bytes]:
+        """Drain everything buffered after the cursor as a list of fixed-size frames (last one may be shorter)."""
+        self._check_overrun()
+        data = self.capture.read(self.pos, self.capture.write_pos)
+        self.pos += len(data)
+        return [data[i:i + frame_samples].tobytes() for i in range(0, len(data), frame_samples)]
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Where MicCapture gets its packets from, and how the mic stream is saved.
+
+- MulticastSource: the live stream PC1 publishes over UDP multicast. The socket is
+  drained either by a dedicated reader thread (default) that empties it in batches
+  and wakes the loop once per batch, or by an asyncio DatagramProtocol. Neither
+  creates a Task per packet; benchmarks/bench_capture_rx.py compares them with
+  the old per-packet receive loop.
+- MicRecorder: saves the packets exactly as received, with their arrival times,
+  so a session on the plant floor (compressor noise, a missed wake word) can be
+  run again later. The file is a short header followed by one record per packet
+  (arrival time since the first packet, length, raw PCM); a name ending in .gz is
+  gzip-compressed.
+- ReplaySource: feeds a recording back with the original packet timing, at real
+  time or `speed` times faster (0: as fast as the readers keep up), so any
+  chatbot script or benchmark can run against it. Packets carry their replayed
+  arrival times, so jitter buffer, echo canceller and timestamps behave as live.
+
+    python3 mic_sources.py record plant.g1mic --seconds 600
+    python3 mic_sources.py info plant.g1mic
+    python3 mic_sources.py wav plant.g1mic plant.wav
+"""
+import argparse
+import asyncio
+import atexit
+import gzip
+import select
+import socket
+import struct
+import threading
+import time
+
+MCAST_PORT = 5555
+MCAST_GRP = "239.168.123.161"
+LOCAL_IP = "192.168.123.164"
+
+RECV_BYTES = 65536      # larger than any datagram PC1 sends, nothing gets truncated
+RECEIVERS = ("thread", "protocol")
+
+RECORDING_MAGIC = b"G1MICREC"
+_HEADER = struct.Struct("<8sId")    # magic, sample rate, wall-clock time of the first packet
+_PACKET = struct.Struct("<dI")      # arrival seconds since the first packet, payload bytes
+
+
+def open_multicast_socket(group: str = MCAST_GRP, port: int = MCAST_PORT, local_ip: str = LOCAL_IP) -> socket.socket:
+    """Bind to the mic multicast group and return a non-blocking socket."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+
+    mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(local_ip))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    sock.setblocking(False)
+    return sock
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+class MulticastSource:
+    """The live mic: joins the multicast group (once) and feeds every datagram to the capture."""
+
+    def __init__(self, sock: socket.socket | None = None, receiver: str = "thread"):
+        if receiver not in RECEIVERS:
+            raise ValueError(f"Unknown receiver {receiver!r}, expected one of {RECEIVERS}")
+        self.receiver = receiver
+        self._sock = sock
+        self._transport = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    async def start(self, capture):
+        if self._transport is not None or self._thread is not None:
+            return
+        if self._sock is None:
+            self._sock = open_multicast_socket()
+        loop = asyncio.get_running_loop()
+
+        if self.receiver == "protocol":
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _CaptureProtocol(capture), sock=self._sock)
+        else:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._reader_thread, args=(capture, loop),
+                                            name="mic-capture", daemon=True)
+            self._thread.start()
+
+    async def close(self):
+        if self._transport is not None:
+            self._transport.close()     # also closes the socket
+            self._transport = None
+            self._sock = None
+        if self._thread is not None:
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _reader_thread(self, capture, loop):
+        """Wait for the socket, then drain everything queued in the kernel before waking the loop once."""
+        sock = self._sock
+        # the socket stays non-blocking: select() does the waiting (and wakes up to check
+        # _stop during silence), so the drain below can never sit on an empty socket
+        sock.setblocking(False)
+        buf = bytearray(RECV_BYTES)
+        view = memoryview(buf)
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select((sock,), (), (), 0.5)
+            except InterruptedError:
+                continue
+            except (OSError, ValueError):
+                break           # socket closed under us
+            if not ready:
+                continue        # no packet for 0.5s, PC1 paused or restarting
+            stored = 0
+            failed = False
+            while True:
+                try:
+                    n = sock.recv_into(buf)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    failed = True
+                    break
+                capture.store(view[:n], time.monotonic())
+                stored += 1
+            if stored:
+                loop.call_soon_threadsafe(capture.wake)
+            if failed:
+                break
+
+
+class _CaptureProtocol(asyncio.DatagramProtocol):
+    """Feeds datagrams straight into the ring from the loop's reader callback."""
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def datagram_received(self, data, addr):
+        self.capture.write(data, time.monotonic())
+
+    def error_received(self, exc):
+        print(f"[CAPTURE] Socket error: {exc}")
+
+
+class MicRecorder:
+    """Appends received packets to a recording. write() is called from the capture's receive path."""
+
+    def __init__(self, path: str, rate: int = 16000):
+        self.path = path
+        self.rate = rate
+        self._file = _open(path, "wb")
+        self._t0 = None
+        self.packets = 0
+        self.nbytes = 0
+        # the scripts do not all close their capture; finish the file (gzip trailer) on exit anyway
+        atexit.register(self.close)
+
+    def write(self, data, t: float):
+        if self._file is None:
+            return
+        if self._t0 is None:
+            self._t0 = t
+            self._file.write(_HEADER.pack(RECORDING_MAGIC, self.rate, time.time()))
+        self._file.write(_PACKET.pack(t - self._t0, len(data)))
+        self._file.write(data)
+        self.packets += 1
+        self.nbytes += len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self) -> str:
+        return (f"[RECORD] {self.path}: {self.packets} packets, "
+                f"{self.nbytes / 2 / self.rate:.1f}s of audio")
+
+
+def read_recording(path: str):
+    """Yield (arrival seconds since the first packet, PCM bytes) for every packet of a recording."""
+    with _open(path, "rb") as f:
+        head = f.read(_HEADER.size)
+        if not head:
+            return
+        magic, _, _ = _HEADER.unpack(head)
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a mic recording")
+        try:
+            while len(head := f.read(_PACKET.size)) == _PACKET.size:
+                t, n = _PACKET.unpack(head)
+                data = f.read(n)
+                if len(data) < n:
+                    break       # cut short (recorder killed mid-write)
+                yield t, data
+        except EOFError:
+            pass                # gzip stream without its trailer, same thing
+
+
+def recording_info(path: str) -> dict:
+    """Sample rate, start time (wall clock), length and packet count of a recording."""
+    with _open(path, "rb") as f:
+        head = f.read(_HEADER.size)
+    if len(head) < _HEADER.size:
+        return {"rate": None, "started": None, "packets": 0, "seconds": 0.0, "audio_s": 0.0}
+    _, rate, started = _HEADER.unpack(head)
+    packets = nbytes = 0
+    last = 0.0
+    for t, data in read_recording(path):
+        packets += 1
+        nbytes += len(data)
+        last = t
+    return {"rate": rate, "started": started, "packets": packets, "seconds": last, "audio_s": nbytes / 2 / rate}
+
+
+class ReplaySource:
+    """Feeds a recording to the capture with its packet timing, `speed` times faster (0: unpaced)."""
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop            # start over at the end instead of stopping
+        self.done = asyncio.Event()
+        self.packets = 0
+        self._task = None
+
+    async def start(self, capture):
+        if self._task is None:
+            self.done.clear()
+            self._task = asyncio.create_task(self._replay(capture))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _replay(self, capture):
+        t0 = time.monotonic()
+        offset = 0.0        # recording time already replayed by earlier loops
+        while True:
+            last = 0.0
+            for t, data in read_recording(self.path):
+                last = t
+                if self.speed > 0:
+                    due = t0 + (offset + t) / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # let the readers run between packets
+                    due = time.monotonic()
+                    await asyncio.sleep(0)
+                capture.write(data, due)
+                self.packets += 1
+            if not self.loop or self.packets == 0:
+                break
+            offset += last + 0.02
+        self.done.set()
+
+
+async def _record(args):
+    from mic_capture import MicCapture
+
+    capture = MicCapture(rate=args.rate, record=args.path)
+    await capture.start()
+    print(f"[RECORD] recording the mic to {args.path} for {args.seconds:.0f}s (Ctrl+C stops)")
+    try:
+        await asyncio.sleep(args.seconds)
+    finally:
+        await capture.close()
+
+
+def _wav(args):
+    import wave
+
+    info = recording_info(args.path)
+    with wave.open(args.out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(info["rate"] or 16000)
+        for _, data in read_recording(args.path):
+            w.writeframes(data)
+    print(f"{args.out}: {info['audio_s']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="save the live multicast mic stream")
+    rec.add_argument("path")
+    rec.add_argument("--seconds", type=float, default=3600.0)
+    rec.add_argument("--rate", type=int, default=16000)
+    info = sub.add_parser("info", help="describe a recording")
+    info.add_argument("path")
+    wav = sub.add_parser("wav", help="export a recording as WAV (lost packets are not filled in)")
+    wav.add_argument("path")
+    wav.add_argument("out")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        try:
+            asyncio.run(_record(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "info":
+        print(recording_info(args.path))
+    else:
+        _wav(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Preallocated int16 buffers for the reply audio path.
+
+The reply audio used to be copied at every step: bytes(inline.data), a bytearray
+accumulator, float32 conversion, resampling, int16 conversion, bytes(pcm_list)
+inside play_pcm_stream and one slice per PlayStream chunk. A PcmBuffer is a numpy
+int16 array that is written in place (the resampler writes its output straight
+into tail()) and read through views, so a block of 16 kHz audio travels from the
+resampler to AudioClient.PlayStream without further copies: bytes() returns a
+memoryview of the filled part and chunks are memoryview slices.
+
+Blocks handed to the playout engine come from a BufferPool and return to it once
+the robot has them, so a steady reply reuses the same few arrays.
+"""
+import collections
+
+import numpy as np
+
+
+class PcmBuffer:
+    def __init__(self, capacity: int = 48000):
+        self._data = np.empty(max(1, capacity), dtype=np.int16)
+        self._len = 0               # samples filled
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        return 2 * self._len
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        self._len = 0
+
+    def reserve(self, n: int):
+        """Make room for `n` more samples (grows by doubling, keeping the content)."""
+        need = self._len + n
+        if need > len(self._data):
+            data = np.empty(max(need, 2 * len(self._data)), dtype=np.int16)
+            data[:self._len] = self._data[:self._len]
+            self._data = data
+
+    def tail(self, n: int) -> np.ndarray:
+        """Writable view of the next `n` free samples; commit() what was written."""
+        self.reserve(n)
+        return self._data[self._len:self._len + n]
+
+    def commit(self, n: int):
+        self._len += n
+
+    def append(self, pcm):
+        """Copy int16 PCM (bytes-like or array) to the end of the buffer."""
+        x = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+        self.tail(len(x))[:] = x
+        self.commit(len(x))
+
+    def view(self) -> np.ndarray:
+        """The filled samples (a view, valid until the buffer is cleared or grows)."""
+        return self._data[:self._len]
+
+    def bytes(self) -> memoryview:
+        """The filled samples as a byte memoryview; list() of it gives the bytes, as of a bytes object."""
+        return memoryview(self._data[:self._len]).cast("B")
+
+
+class BufferPool:
+    """Free list of PcmBuffers. acquire() and release() may be called from different threads."""
+
+    def __init__(self, capacity: int = 48000, keep: int = 8):
+        self.capacity = capacity
+        self.keep = keep
+        self._free = collections.deque()
+        self.allocated = 0
+
+    def acquire(self) -> PcmBuffer:
+        try:
+            return self._free.pop()
+        except IndexError:
+            self.allocated += 1
+            return PcmBuffer(self.capacity)
+
+    def release(self, buf: PcmBuffer):
+        buf.clear()
+        if len(self._free) < self.keep:
+            self._free.append(buf)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Playout to the G1 speaker from a dedicated thread.
+
+AudioClient.PlayStream is a blocking DDS RPC (up to the client timeout). Called
+from play_reply_streaming it stops the event loop, or at least the receive loop,
+from reading further Live messages while a block is being handed over. A
+PlayoutEngine owns one long-lived thread that takes 16 kHz int16 blocks from a
+bounded queue and passes them to PlayStream, merging whatever is queued into
+RPCs of up to `chunk_size` bytes. The receive loop only enqueues.
+
+stop() drops everything not yet sent and queues a PlayStop for the thread, for
+barge-in; it returns at once with a future for the RPC's duration. With a
+TurnTracer the engine stamps the first PlayStream of a reply and, whenever its
+queue runs empty, when the robot will run out of audio (`play_end`). Both are
+tagged with the tracer turn the audio was queued in, so stamps that come after
+the next turn started are dropped.
+
+Blocks are PcmBuffers from the engine's pool (new_block()): write() hands the
+block itself to the thread, which passes memoryview chunks of it to PlayStream and
+then returns it to the pool. Other PCM given to write() is copied into a pooled
+block once.
+
+AdaptivePlayout decides when the reply audio collected so far is handed over. The
+first block is small so the robot starts talking early; after that a block is
+sent once it is as long as the audio the robot still has queued (so block sizes
+grow with the buffer, up to `max_block`), or right away if that lead drops below
+a safety margin derived from the largest recent gap between Live messages. When
+the robot runs dry anyway (audio arriving slower than it plays), the block needed
+to restart is doubled, so a slow stream settles on a buffer that lasts. The
+robot is assumed to play from the moment a block is handed over, which gives the
+time-to-first-sound and underrun estimates reported per turn.
+
+ReferenceTrack keeps what was handed to the robot laid out on the same clock (gaps
+are silence, stop() cuts it short). Barge-in compares the mic with it to tell the
+robot's own voice from the user's.
+"""
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+
+import numpy as np
+
+from latency import TurnTracer
+from pcm_buffer import BufferPool, PcmBuffer
+
+OUT_RATE = 16000
+_CLOSE = object()
+
+
+class _Stop:
+    """A stop() for the playout thread: PlayStop as of `t`, then `done` gets the RPC's duration."""
+
+    def __init__(self, t: float, turn: int | None):
+        self.t = t
+        self.turn = turn        # tracer turn_id the drained stamp belongs to
+        self.done = concurrent.futures.Future()
+
+
+class ReferenceTrack:
+    """The last `seconds` of robot playback on the monotonic clock. add() and stop() may run in another thread."""
+
+    def __init__(self, rate: int = OUT_RATE, seconds: float = 10.0):
+        self.rate = rate
+        self.capacity = int(rate * seconds)
+        self._ring = np.zeros(self.capacity, dtype=np.int16)
+        self._t0 = None         # monotonic time of sample 0
+        self._end = 0           # samples laid out so far (silence included)
+        self._lock = threading.Lock()
+
+    def _index(self, t: float) -> int:
+        return round((t - self._t0) * self.rate)
+
+    def add(self, pcm, t: float | None = None):
+        """Audio handed to the robot at `t`; it plays after whatever is still playing."""
+        x = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+        t = time.monotonic() if t is None else t
+        with self._lock:
+            if self._t0 is None:
+                self._t0 = t
+            start = max(self._end, self._index(t))
+            if start > self._end:
+                gap = min(start - self._end, self.capacity)
+                self._write(start - gap, np.zeros(gap, dtype=np.int16))
+            keep = x[-self.capacity:]
+            self._write(start + len(x) - len(keep), keep)
+            self._end = start + len(x)
+
+    def _write(self, pos: int, x: np.ndarray):
+        done = 0
+        while done < len(x):
+            i = (pos + done) % self.capacity
+            m = min(len(x) - done, self.capacity - i)
+            self._ring[i:i + m] = x[done:done + m]
+            done += m
+
+    def stop(self, t: float | None = None):
+        """The robot went quiet at `t`: drop what was scheduled after it."""
+        t = time.monotonic() if t is None else t
+        with self._lock:
+            if self._t0 is not None:
+                self._end = min(self._end, max(0, self._index(t)))
+
+    def end_time(self) -> float:
+        """When the robot runs out of audio (in the past when it is quiet)."""
+        with self._lock:
+            return self._t0 + self._end / self.rate if self._t0 is not None else 0.0
+
+    def playing(self, t: float | None = None) -> bool:
+        return (time.monotonic() if t is None else t) < self.end_time()
+
+    def read(self, t: float, n: int) -> np.ndarray:
+        """`n` samples played from time `t` on (silence where nothing was playing or it is no longer kept)."""
+        out = np.zeros(n, dtype=np.int16)
+        with self._lock:
+            if self._t0 is None:
+                return out
+            start = self._index(t)
+            lo = max(start, self._end - self.capacity, 0)
+            hi = min(start + n, self._end)
+            pos = lo
+            while pos < hi:
+                i = pos % self.capacity
+                m = min(hi - pos, self.capacity - i)
+                out[pos - start:pos - start + m] = self._ring[i:i + m]
+                pos += m
+        return out
+
+
+class AdaptivePlayout:
+    def __init__(self, rate: int = 24000, first_block: float = 0.1, max_block: float = 3.0,
+                 min_lead: float = 0.2, gap_decay: float = 0.9):
+        self.rate = rate                # of the PCM being counted (the Live output rate)
+        self.first_block = first_block
+        self.max_block = max_block
+        self.min_lead = min_lead
+        self.gap_decay = gap_decay
+        self.start_turn()
+
+    def start_turn(self):
+        self._first_arrival = None
+        self._last_arrival = None
+        self._received = 0.0        # seconds of reply audio received
+        self._play_start = None     # when the robot started (or resumed) playing
+        self._sent = 0.0            # seconds handed over since _play_start
+        self.gap = 0.0              # decaying maximum of the time between audio messages
+        self._start_block = self.first_block
+        self.first_sound = None
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.blocks = 0
+
+    def arrived(self, nbytes: int, t: float | None = None):
+        """Count reply audio as it is received."""
+        t = time.monotonic() if t is None else t
+        if self._first_arrival is None:
+            self._first_arrival = t
+        elif self._last_arrival is not None:
+            self.gap = max(t - self._last_arrival, self.gap * self.gap_decay)
+        self._last_arrival = t
+        self._received += nbytes / 2 / self.rate
+
+    def lead(self, t: float | None = None) -> float:
+        """Seconds of audio the robot still has to play."""
+        if self._play_start is None:
+            return 0.0
+        t = time.monotonic() if t is None else t
+        return max(0.0, self._play_start + self._sent - t)
+
+    def should_flush(self, pending_bytes: int, t: float | None = None) -> bool:
+        """Whether the `pending_bytes` collected so far should be handed over now."""
+        if pending_bytes <= 0:
+            return False
+        t = time.monotonic() if t is None else t
+        pending = pending_bytes / 2 / self.rate
+        lead = self.lead(t)
+        if lead <= 0:
+            # (re)starting: small the first time, larger after every underrun
+            return pending >= self._start_block
+        if lead < max(self.min_lead, 2 * self.gap):
+            return True
+        return pending >= min(self.max_block, max(self.first_block, lead))
+
+    def flushed(self, nbytes: int, t: float | None = None):
+        """Record that `nbytes` were handed to the playout engine."""
+        if nbytes <= 0:
+            return
+        t = time.monotonic() if t is None else t
+        if self._play_start is None:
+            self._play_start = t
+            self.first_sound = t - (self._first_arrival if self._first_arrival is not None else t)
+        elif self._play_start + self._sent < t:
+            # the robot ran out of audio before this block arrived
+            self.underruns += 1
+            self.underrun_seconds += t - (self._play_start + self._sent)
+            self._play_start = t - self._sent
+            self._start_block = min(self.max_block, 2 * self._start_block)
+        self._sent += nbytes / 2 / self.rate
+        self.blocks += 1
+
+    @property
+    def arrival_ratio(self) -> float:
+        """Reply audio received per second of wall time (above 1: faster than playback)."""
+        if self._first_arrival is None or self._last_arrival is None or self._last_arrival <= self._first_arrival:
+            return 0.0
+        return self._received / (self._last_arrival - self._first_arrival)
+
+    def summary(self) -> str:
+        first = f"{1000 * self.first_sound:.0f}ms" if self.first_sound is not None else "n/a"
+        return (f"[PLAY] first sound {first} after the first reply audio, blocks={self.blocks} "
+                f"underruns={self.underruns} ({self.underrun_seconds:.2f}s) "
+                f"arrival={self.arrival_ratio:.1f}x realtime")
+
+
+class PlayoutEngine:
+    def __init__(self, client, stream_name: str = "example", rate: int = OUT_RATE,
+                 chunk_size: int = 96000, max_blocks: int = 256, reference: ReferenceTrack | None = None,
+                 tracer: TurnTracer | None = None):
+        self.client = client
+        self.reference = reference      # records what is handed to the robot, if given
+        self.tracer = tracer            # stamps first_play and drained, if given
+        self.stream_name = stream_name
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self._blocks = queue.Queue(maxsize=max_blocks)
+        self.pool = BufferPool(capacity=chunk_size // 2)
+        self._thread = None
+        self._gen = 0           # bumped by stop(); blocks of older generations are discarded
+        self._turn = None       # tracer turn of the block played last, for the drained stamp
+
+        self.rpcs = 0
+        self.errors = 0
+        self.stops = 0
+        self.bytes_sent = 0
+        self.max_rpc_seconds = 0.0
+        self.play_end = 0.0     # monotonic time the robot runs out of the audio handed over so far
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="playout", daemon=True)
+        self._thread.start()
+
+    async def close(self):
+        if self._thread is None:
+            return
+        await asyncio.to_thread(self._blocks.put, _CLOSE)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        print(self.summary())
+
+    @staticmethod
+    def new_stream() -> str:
+        """Stream id for a new reply (the robot plays blocks of one id back to back)."""
+        return str(int(time.time() * 1000))
+
+    def new_block(self) -> PcmBuffer:
+        """Empty block to collect reply audio in; write() gives it back to the engine."""
+        return self.pool.acquire()
+
+    async def write(self, pcm, stream_id: str) -> int:
+        """
+        Queue int16 PCM for playout and return its size in bytes. A PcmBuffer from
+        new_block() is queued as is and must not be touched afterwards. Only waits
+        (without blocking the loop) when the queue is full.
+        """
+        if isinstance(pcm, PcmBuffer):
+            block = pcm
+        else:
+            block = self.pool.acquire()
+            block.append(pcm)
+        nbytes = block.nbytes
+        if not nbytes:
+            self.pool.release(block)
+            return 0
+        item = (self._gen, str(stream_id), block, self._tracer_turn())
+        try:
+            self._blocks.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self._blocks.put, item)
+        return nbytes
+
+    def stop(self) -> concurrent.futures.Future:
+        """
+        Discard queued audio and have the playout thread stop what the robot is playing.
+        Never waits for the robot: the returned future gets how long PlayStop took (the
+        thread sends it right after any PlayStream in flight).
+        """
+        self._gen += 1
+        close = False
+        keep = []       # earlier stops the thread has not got to yet, their futures still resolve
+        while True:
+            try:
+                item = self._blocks.get_nowait()
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                close = True
+            elif isinstance(item, _Stop):
+                keep.append(item)
+            else:
+                self.pool.release(item[2])
+            self._blocks.task_done()
+        request = _Stop(time.monotonic(), self._tracer_turn())
+        for item in keep + [request]:
+            self._blocks.put_nowait(item)
+        if close:
+            self._blocks.put_nowait(_CLOSE)
+        return request.done
+
+    def _tracer_turn(self) -> int | None:
+        return self.tracer.turn_id if self.tracer is not None else None
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Wait until every queued block was handed to the robot. False on timeout."""
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._blocks.join), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @property
+    def queued(self) -> int:
+        return self._blocks.qsize()
+
+    def _run(self):
+        carry = None    # block taken off the queue that did not fit the previous RPC
+        while True:
+            item = carry if carry is not None else self._blocks.get()
+            if item is _CLOSE:
+                self._blocks.task_done()
+                return
+            if isinstance(item, _Stop):
+                carry = None
+                self._stop_playback(item)
+                self._blocks.task_done()
+                continue
+            carry = self._play(item)
+            if carry is None and self.tracer is not None and self._blocks.empty():
+                self.tracer.mark("drained", self.play_end, last=True, turn=self._turn)
+
+    def _play(self, item) -> tuple | None:
+        """Send one queued block; returns the item taken off the queue that did not fit."""
+        gen, stream_id, block, turn = item
+        self._turn = turn
+        carry = None
+        taken = 1
+        # merge small blocks already waiting for the same stream into one RPC (copies
+        # only the merged ones, and only when the thread fell behind)
+        while block.nbytes < self.chunk_size:
+            try:
+                nxt = self._blocks.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(nxt, tuple) or nxt[0] != gen or nxt[1] != stream_id:
+                carry = nxt
+                break
+            block.append(nxt[2].view())
+            self.pool.release(nxt[2])
+            taken += 1
+        if gen == self._gen:
+            self._send(stream_id, block.bytes(), gen, turn)
+        self.pool.release(block)
+        for _ in range(taken):
+            self._blocks.task_done()
+        return carry
+
+    def _send(self, stream_id: str, data: memoryview, gen: int, turn: int | None):
+        for offset in range(0, len(data), self.chunk_size):
+            if gen != self._gen:
+                return
+            chunk = data[offset:offset + self.chunk_size]
+            t0 = time.monotonic()
+            if self.tracer is not None:
+                self.tracer.mark("first_play", t0, turn=turn)
+            try:
+                ret_code, _ = self.client.PlayStream(self.stream_name, stream_id, chunk)
+            except Exception as e:
+                ret_code = e
+            elapsed = time.monotonic() - t0
+            self.rpcs += 1
+            self.max_rpc_seconds = max(self.max_rpc_seconds, elapsed)
+            if ret_code != 0:
+                self.errors += 1
+                print(f"[PLAY] PlayStream failed, return code: {ret_code}")
+                return
+            if gen != self._gen:
+                # stop() ran during the RPC: its PlayStop is next in the queue and silences this chunk too
+                return
+            self.bytes_sent += len(chunk)
+            self.play_end = max(self.play_end, t0) + len(chunk) / 2 / self.rate
+            if self.reference is not None:
+                self.reference.add(chunk, t0)
+
+    def _stop_playback(self, request: _Stop):
+        t0 = time.monotonic()
+        try:
+            self.client.PlayStop(self.stream_name)
+        except Exception as e:
+            self.errors += 1
+            print(f"[PLAY] PlayStop failed: {e}")
+        elapsed = time.monotonic() - t0
+        if self.reference is not None:
+            self.reference.stop(request.t)
+        self.stops += 1
+        self.play_end = min(self.play_end, request.t)
+        if self.tracer is not None:
+            self.tracer.mark("drained", self.play_end, last=True, turn=request.turn)
+        request.done.set_result(elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "rpcs": self.rpcs,
+            "errors": self.errors,
+            "audio_s": self.bytes_sent / 2 / self.rate,
+            "max_rpc_s": self.max_rpc_seconds,
+            "queued_blocks": self.queued,
+            "stops": self.stops,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"[PLAY] audio={s['audio_s']:.1f}s rpcs={s['rpcs']} errors={s['errors']} "
+                f"max_rpc={1000 * s['max_rpc_s']:.0f}ms stops={s['stops']}")
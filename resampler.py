@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Streaming polyphase resampler for the Gemini playback path (24 kHz -> 16 kHz).
+
+resample_poly() on every received block redesigns the FIR filter each time and
+treats each block as if it were surrounded by silence, which clicks at every block
+boundary. StreamingResampler designs the filter once per (in_rate, out_rate) pair
+(the same Kaiser FIR as resample_poly) and keeps the last input samples between
+calls, so feeding a reply block by block and calling flush() at the end gives the
+same samples as resampling the whole reply at once.
+
+int16 input gives int16 output (rounded and clipped); float input gives float32.
+The input history and the float outputs live in arrays that are allocated once and
+reused, and with `out=` (a PcmBuffer) the int16 output is written straight into the
+block that goes to the playout engine, so a received Live message is converted
+once and otherwise not copied.
+"""
+import functools
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+
+@functools.lru_cache(maxsize=None)
+def polyphase_taps(in_rate: int, out_rate: int) -> tuple[int, int, np.ndarray, int]:
+    """
+    Filter for in_rate -> out_rate split into phases: (up, down, taps, skip).
+
+    taps[p] are the coefficients of phase p in reverse order, ready to be dotted
+    with a window of the input; `skip` is the number of leading outputs that only
+    cover the filter delay (resample_poly drops them as well).
+    """
+    g = math.gcd(in_rate, out_rate)
+    up, down = out_rate // g, in_rate // g
+    # same design as scipy.signal.resample_poly(window=("kaiser", 5.0))
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+    pre_pad = down - half_len % down
+    h = np.concatenate((np.zeros(pre_pad), h))
+    length = -(-len(h) // up)
+    h = np.concatenate((h, np.zeros(length * up - len(h))))
+    taps = h.reshape(length, up).T[:, ::-1].astype(np.float32)
+    skip = (half_len + pre_pad) // down
+    return up, down, np.ascontiguousarray(taps), skip
+
+
+class StreamingResampler:
+    def __init__(self, in_rate: int = 24000, out_rate: int = 16000):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up, self.down, self.taps, self.skip = polyphase_taps(in_rate, out_rate)
+        self.length = self.taps.shape[1]
+        self._store = np.zeros(4 * self.length, dtype=np.float32)
+        self._y = np.empty(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget the stream; the next sample is treated as the first one."""
+        # _store[k] is input sample (self._base + k) for k < _len; zeros stand for the
+        # silence before the stream
+        self._store[:self.length - 1] = 0
+        self._len = self.length - 1
+        self._base = -(self.length - 1)
+        self._received = 0
+        self._next = self.skip      # next output index, counting the delay outputs
+        self._int16 = True
+
+    def process(self, pcm, out=None) -> np.ndarray:
+        """
+        Resample one block. Returns the output samples that are complete so far,
+        appended to the PcmBuffer `out` if given (then the return value is a view of it).
+        """
+        x = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else np.asarray(pcm)
+        self._int16 = x.dtype == np.int16
+        self._append(x)
+        return self._emit(self._produce(self._received), out)
+
+    def flush(self, out=None) -> np.ndarray:
+        """Outputs still held back by the filter delay, then reset for the next stream."""
+        end = self.skip + -(-self._received * self.up // self.down)
+        needed = (end - 1) * self.down // self.up + 1 if end > self._next else 0
+        if needed > self._received:
+            self._append(None, needed - self._received)
+        y = self._emit(self._produce(self._received, end), out)
+        self.reset()
+        return y
+
+    def _append(self, x: np.ndarray | None, zeros: int = 0):
+        """Copy `x` (converted to float32) or `zeros` zero samples after the history."""
+        n = len(x) if x is not None else zeros
+        need = self._len + n
+        if need > len(self._store):
+            store = np.empty(max(need, 2 * len(self._store)), dtype=np.float32)
+            store[:self._len] = self._store[:self._len]
+            self._store = store
+        if x is not None:
+            self._store[self._len:need] = x
+        else:
+            self._store[self._len:need] = 0
+        self._len = need
+        self._received += n
+
+    def _produce(self, available: int, end: int | None = None) -> np.ndarray:
+        """Compute outputs whose newest input sample is below `available` (and below `end`)."""
+        stop = (available * self.up - 1) // self.down + 1 if available else 0
+        if end is not None:
+            stop = min(stop, end)
+        start = self._next
+        if stop <= start:
+            return np.zeros(0, dtype=np.float32)
+
+        windows = sliding_window_view(self._store[:self._len], self.length)
+        if len(self._y) < stop - start:
+            self._y = np.empty(2 * (stop - start), dtype=np.float32)
+        y = self._y[:stop - start]
+        # outputs start+k, start+k+up, ... share a phase and their windows are `down` apart
+        for k in range(min(self.up, stop - start)):
+            n = start + k
+            row = n * self.down // self.up - (self.length - 1) - self._base
+            count = len(range(n, stop, self.up))
+            np.matmul(windows[row:row + count * self.down:self.down], self.taps[n * self.down % self.up],
+                      out=y[k::self.up])
+
+        self._next = stop
+        # keep only the history the next output needs, at the start of the store
+        first = (stop * self.down // self.up) - (self.length - 1)
+        drop = first - self._base
+        if drop > 0:
+            keep = self._len - drop
+            self._store[:keep] = self._store[drop:self._len]
+            self._len = keep
+            self._base = first
+        return y
+
+    def _emit(self, y: np.ndarray, out) -> np.ndarray:
+        """Hand over outputs computed into the scratch array (which the next call reuses)."""
+        if not self._int16:
+            if out is not None:
+                raise ValueError("out= needs int16 input")
+            return y.copy()
+        np.rint(y, out=y)
+        np.clip(y, -32768, 32767, out=y)
+        if out is None:
+            return y.astype(np.int16)
+        dst = out.tail(len(y))
+        dst[:] = y
+        out.commit(len(y))
+        return dst
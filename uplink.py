@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Pacing of the mic audio sent to the Live API.
+
+A turn that is already buffered does not have to be uploaded at the speed it was
+spoken. UplinkScheduler sends frames on monotonic deadlines computed from the
+number of samples sent so far (sleep overshoot does not accumulate), with one of
+these policies:
+
+- "realtime": one second of audio per second, what the server VAD expects when
+  the end of the turn is marked by trailing silence,
+- "accelerated": `speedup` times faster than real time,
+- "burst": no pacing at all, frames go out as fast as the socket takes them.
+
+With explicit activity_start/activity_end the server does not need the timing,
+so policy_for() picks "burst" there and "realtime" for silence padding.
+"""
+import asyncio
+import time
+
+MIC_RATE = 16000
+POLICIES = ("realtime", "accelerated", "burst")
+
+
+def policy_for(turn_end: str) -> str:
+    """Best pacing policy for a turn end mode ("activity" or "padding")."""
+    return "burst" if turn_end == "activity" else "realtime"
+
+
+class UplinkScheduler:
+    def __init__(self, session, rate: int = MIC_RATE, policy: str = "realtime", speedup: float = 4.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown uplink policy {policy!r}, expected one of {POLICIES}")
+        self.session = session
+        self.rate = rate
+        self.policy = policy
+        self.speedup = speedup if policy == "accelerated" else 1.0
+        self.mime_type = f"audio/pcm;rate={rate}"
+
+        self._t0 = None
+        self._samples = 0
+        self.last_turn = None   # (audio seconds, wall seconds) of the last finished turn
+
+    def start_turn(self):
+        self._t0 = None
+        self._samples = 0
+
+    def end_turn(self) -> tuple[float, float]:
+        """Close the current turn, return (audio seconds, seconds spent sending)."""
+        wall = time.monotonic() - self._t0 if self._t0 is not None else 0.0
+        self.last_turn = (self._samples / self.rate, wall)
+        self._t0 = None
+        return self.last_turn
+
+    async def send(self, frame: bytes):
+        """Send one frame, waiting until its deadline under the current policy."""
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = now
+        elif self.policy != "burst":
+            delay = self._t0 + self._samples / self.rate / self.speedup - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self.session.send_realtime_input(audio={"data": frame, "mime_type": self.mime_type})
+        self._samples += len(frame) // 2
+
+    async def send_turn(self, frames: list[bytes]) -> tuple[float, float]:
+        """Send a buffered utterance, return (audio seconds, seconds spent sending)."""
+        self.start_turn()
+        for frame in frames:
+            await self.send(frame)
+        return self.end_turn()
+
+    def summary(self) -> str:
+        audio, wall = self.last_turn or (0.0, 0.0)
+        speed = f" x{self.speedup:g}" if self.policy == "accelerated" else ""
+        return f"[UPLINK] {audio:.2f}s of audio sent in {wall:.2f}s ({self.policy}{speed})"
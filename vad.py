@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Cheap voice-activity front ends for the mic stream.
+
+EnergyGate decides, per chunk of int16 PCM, whether speech is likely, so the
+wake-word stage only hands audio to Vosk when someone may be talking. Each chunk
+is split into short frames; a frame counts as voiced when its energy is
+`open_db` above an adaptive noise floor and its zero-crossing rate is in the
+speech range (rules out hum and hiss). The gate stays open for `hangover` seconds
+after the last voiced frame, and `lookback` tells the caller how much audio before
+the opening chunk to feed as well, so word onsets are not clipped.
+
+Endpointer finds where a turn ends while recording. It works frame by frame
+(chunks are re-split across calls), opens on `start_db` above the noise floor and
+only closes below the lower `stop_db` (hysteresis), needs `min_speech` of voice
+before anything counts as a turn, and reports the end after `end_silence` of
+quiet. calibrate() measures the room at startup and sets both thresholds from how
+much the background fluctuates; between turns the floor keeps following it, so a
+compressor switching on does not hold turns open.
+
+BargeInDetector listens while the robot talks. The mic then also hears the robot,
+so a frame only counts as the user when it is `start_db` above the noise floor
+and `echo_margin_db` above the echo expected from what the robot was playing (its
+level plus the echo return). The playback-to-mic delay is found by lining up the
+two energy envelopes (up to `max_delay`; until they agree, the loudest played
+frame in that span is assumed and the echo return keeps its pessimistic start
+value). The echo return is then learned from frames without the user, and a frame
+far above the estimate only nudges it, so the user's first syllables do not teach
+the detector to ignore them. `min_speech` of voiced frames, with gaps up to
+`max_gap`, is a barge-in.
+"""
+import collections
+
+import numpy as np
+
+MIC_RATE = 16000
+
+
+def frame_features(pcm, rate: int = MIC_RATE, frame_ms: float = 20.0) -> tuple[np.ndarray, np.ndarray]:
+    """Per-frame energy (dBFS) and zero-crossing rate of int16 PCM. A trailing partial frame is ignored."""
+    x = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+    size = int(rate * frame_ms / 1000)
+    count = len(x) // size
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    frames = x[:count * size].reshape(count, size).astype(np.float32) * (1.0 / 32768.0)
+    energy = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return energy, zcr
+
+
+class EnergyGate:
+    def __init__(self, rate: int = MIC_RATE, frame_ms: float = 20.0, open_db: float = 9.0,
+                 zcr_range: tuple[float, float] = (0.005, 0.45), hangover: float = 0.8,
+                 lookback: float = 0.3, floor_rise_db: float = 0.05, min_floor_db: float = -80.0):
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.open_db = open_db
+        self.zcr_range = zcr_range
+        self.hangover = hangover
+        self.lookback_samples = int(lookback * rate)
+        self.floor_rise_db = floor_rise_db      # per frame, how fast the floor may climb
+        self.min_floor_db = min_floor_db
+
+        self.floor_db = None
+        self.is_open = False
+        self._quiet = 0.0       # seconds since the last voiced frame
+
+        self.total_samples = 0
+        self.open_samples = 0
+        self.openings = 0
+
+    def process(self, pcm) -> bool:
+        """Update with one chunk, return whether the gate is open for it."""
+        energy, zcr = frame_features(pcm, self.rate, self.frame_ms)
+        n = len(pcm) // 2 if not isinstance(pcm, np.ndarray) else len(pcm)
+        self.total_samples += n
+        if len(energy) == 0:
+            if self.is_open:
+                self.open_samples += n
+            return self.is_open
+
+        quietest = max(float(energy.min()), self.min_floor_db)
+        if self.floor_db is None or quietest < self.floor_db:
+            self.floor_db = quietest
+        else:
+            self.floor_db = min(quietest, self.floor_db + self.floor_rise_db * len(energy))
+
+        voiced = (energy > self.floor_db + self.open_db) & (zcr >= self.zcr_range[0]) & (zcr <= self.zcr_range[1])
+        if voiced.any():
+            last = len(voiced) - 1 - int(np.argmax(voiced[::-1]))
+            self._quiet = (len(voiced) - 1 - last) * self.frame_ms / 1000
+            if not self.is_open:
+                self.openings += 1
+            self.is_open = True
+        else:
+            self._quiet += n / self.rate
+            if self._quiet > self.hangover:
+                self.is_open = False
+
+        if self.is_open:
+            self.open_samples += n
+        return self.is_open
+
+    @property
+    def duty_cycle(self) -> float:
+        """Fraction of the audio that was passed on to the recognizer."""
+        return self.open_samples / self.total_samples if self.total_samples else 0.0
+
+    def summary(self) -> str:
+        return (f"[GATE] duty={100 * self.duty_cycle:.1f}% openings={self.openings} "
+                f"floor={self.floor_db if self.floor_db is not None else float('nan'):.1f}dBFS "
+                f"audio={self.total_samples / self.rate:.0f}s")
+
+
+class Endpointer:
+    def __init__(self, rate: int = MIC_RATE, frame_ms: float = 20.0, start_db: float = 10.0,
+                 hysteresis_db: float = 3.0, min_start_db: float = 5.0, min_speech: float = 0.25,
+                 end_silence: float = 0.5, floor_alpha: float = 0.02, min_floor_db: float = -80.0):
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.frame_samples = int(rate * frame_ms / 1000)
+        self.start_db = start_db
+        self.stop_db = start_db - hysteresis_db
+        self.hysteresis_db = hysteresis_db
+        self.min_start_db = min_start_db
+        self.min_speech_frames = max(1, round(min_speech * 1000 / frame_ms))
+        self.end_silence_frames = max(1, round(end_silence * 1000 / frame_ms))
+        self.floor_alpha = floor_alpha      # per non-speech frame, how fast the floor follows the room
+        self.min_floor_db = min_floor_db
+
+        self.floor_db = None
+        self._rest = np.zeros(0, dtype=np.int16)
+        self.reset()
+
+    def reset(self):
+        """Start a new turn; the noise floor is kept."""
+        self._rest = np.zeros(0, dtype=np.int16)
+        self._active = False        # above the start threshold (hysteresis state)
+        self._voiced = 0            # consecutive active frames
+        self._silent = 0            # consecutive inactive frames since speech
+        self.in_speech = False
+        self.speech_frames = 0
+        self.frames = 0
+        self.end_frame = None
+
+    def calibrate(self, pcm) -> float:
+        """Set the noise floor and thresholds from audio of the room with nobody talking. Returns the floor in dBFS."""
+        energy, _ = frame_features(pcm, self.rate, self.frame_ms)
+        if len(energy):
+            # percentiles ignore the odd door slam or cough during calibration
+            p10, p50, p90 = np.percentile(energy, [10, 50, 90])
+            self.floor_db = max(float(p50), self.min_floor_db)
+            self.start_db = max(self.min_start_db, float(p90 - p10) + 4.0)
+            self.stop_db = self.start_db - self.hysteresis_db
+        return self.floor_db
+
+    def process(self, pcm) -> bool:
+        """Feed recorded audio. True once the end of the turn has been reached."""
+        x = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+        if len(self._rest):
+            x = np.concatenate((self._rest, x))
+        usable = len(x) - len(x) % self.frame_samples
+        self._rest = x[usable:].copy()
+        energy, _ = frame_features(x[:usable], self.rate, self.frame_ms)
+
+        for e in energy.tolist():
+            self.frames += 1
+            if self.floor_db is None:
+                self.floor_db = max(e, self.min_floor_db)
+            threshold = self.floor_db + (self.stop_db if self._active else self.start_db)
+            self._active = e > threshold
+
+            if self._active:
+                self._voiced += 1
+                self._silent = 0
+                if self.in_speech:
+                    self.speech_frames += 1
+                elif self._voiced >= self.min_speech_frames:
+                    self.in_speech = True
+                    self.speech_frames = self._voiced
+            else:
+                self._voiced = 0
+                if e < self.floor_db:
+                    self.floor_db = max(e, self.min_floor_db)
+                elif not self.in_speech:
+                    self.floor_db += self.floor_alpha * (e - self.floor_db)
+                if self.in_speech:
+                    self._silent += 1
+                    if self._silent >= self.end_silence_frames and self.end_frame is None:
+                        self.end_frame = self.frames - self._silent
+        return self.end_frame is not None
+
+    @property
+    def speech_seconds(self) -> float:
+        return self.speech_frames * self.frame_ms / 1000
+
+    def describe(self) -> str:
+        return (f"[VAD] floor={self.floor_db if self.floor_db is not None else float('nan'):.1f}dBFS "
+                f"start=+{self.start_db:.1f}dB stop=+{self.stop_db:.1f}dB end_silence={self.end_delay:.2f}s")
+
+    @property
+    def end_delay(self) -> float:
+        """Audio between the last voiced frame and the end decision, in seconds."""
+        return self.end_silence_frames * self.frame_ms / 1000
+
+
+class BargeInDetector:
+    def __init__(self, rate: int = MIC_RATE, frame_ms: float = 20.0, start_db: float = 10.0,
+                 echo_margin_db: float = 6.0, min_speech: float = 0.2, max_gap: float = 0.3,
+                 lookback: float = 0.3, max_delay: float = 0.4, history: float = 4.0, min_correlation: float = 0.5,
+                 erl_db: float = 0.0, erl_alpha: float = 0.05, min_reference_db: float = -60.0,
+                 floor_alpha: float = 0.02, min_floor_db: float = -80.0):
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.frame_samples = int(rate * frame_ms / 1000)
+        self.start_db = start_db
+        self.echo_margin_db = echo_margin_db
+        self.min_speech_frames = max(1, round(min_speech * 1000 / frame_ms))
+        self.max_gap_frames = round(max_gap * 1000 / frame_ms)
+        self.lookback_samples = int(lookback * rate)
+        self.max_lag = round(max_delay * 1000 / frame_ms)
+        self.history = max(round(history * 1000 / frame_ms), 4 * self.max_lag)
+        self.min_correlation = min_correlation
+        self.erl_db = erl_db                # echo return: mic level minus playback level, starts pessimistic
+        self.erl_alpha = erl_alpha          # per frame without the user
+        self.min_reference_db = min_reference_db
+        self.floor_alpha = floor_alpha
+        self.min_floor_db = min_floor_db
+
+        self.floor_db = None
+        self.lag = None             # playback-to-mic delay in frames, once the envelopes agree on one
+        self.detections = 0
+        self._mic = collections.deque(maxlen=self.history)
+        self._ref = collections.deque([-100.0] * (self.max_lag + 1), maxlen=self.history + self.max_lag + 1)
+        self.reset()
+
+    def reset(self):
+        """Start listening over a new reply; the noise floor, delay and echo return are kept."""
+        self._rest = np.zeros(0, dtype=np.int16)
+        self._rest_ref = np.zeros(0, dtype=np.int16)
+        self._voiced = 0            # voiced frames in the current run
+        self._gap = 0               # unvoiced frames since the last voiced one
+        self._frames = 0
+        self._onset = None          # frame index where the current run started
+        self.onset_samples = None   # samples from the onset to the end of the audio fed, once detected
+
+    def calibrate(self, pcm) -> float:
+        """Noise floor from audio of the room with nobody talking (and the robot quiet)."""
+        energy, _ = frame_features(pcm, self.rate, self.frame_ms)
+        if len(energy):
+            self.floor_db = max(float(np.median(energy)), self.min_floor_db)
+        return self.floor_db
+
+    def _frames_of(self, x: np.ndarray, rest: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if len(rest):
+            x = np.concatenate((rest, x))
+        usable = len(x) - len(x) % self.frame_samples
+        energy, _ = frame_features(x[:usable], self.rate, self.frame_ms)
+        return energy, x[usable:].copy()
+
+    def _estimate_lag(self):
+        """Delay that best lines the played envelope up with the mic envelope (while the robot talks)."""
+        mic = np.array(self._mic)
+        ref = np.array(self._ref)[-len(mic) - self.max_lag:]
+        if len(mic) < 2 * self.max_lag or len(ref) < len(mic) + self.max_lag:
+            return
+        best, best_lag = self.min_correlation, None
+        for lag in range(self.max_lag + 1):
+            r = ref[self.max_lag - lag:self.max_lag - lag + len(mic)]
+            active = r > self.min_reference_db
+            if active.sum() < self.max_lag:
+                continue
+            c = np.corrcoef(mic[active], r[active])[0, 1]
+            if c > best:
+                best, best_lag = c, lag
+        if best_lag is not None:
+            self.lag = best_lag
+
+    def process(self, pcm, reference=None) -> bool:
+        """
+        Feed mic audio and what the robot played over the same span (int16, same
+        length; None when it was quiet). True once the user talks over it.
+        """
+        x = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+        if reference is None:
+            ref = np.zeros(len(x), dtype=np.int16)
+        else:
+            ref = np.frombuffer(reference, dtype=np.int16) if not isinstance(reference, np.ndarray) else reference
+        energy, self._rest = self._frames_of(x, self._rest)
+        ref_energy, self._rest_ref = self._frames_of(ref, self._rest_ref)
+        self._ref.extend(ref_energy.tolist())
+        self._mic.extend(energy.tolist())
+        self._estimate_lag()
+        refs = list(self._ref)
+
+        for k, e in enumerate(energy.tolist()):
+            self._frames += 1
+            # index in refs of the played frame captured together with this mic frame
+            j = len(refs) - len(energy) + k
+            if self.lag is None:
+                echo_db = max(refs[j - self.max_lag:j + 1])
+            else:
+                echo_db = max(refs[j - self.lag - 1:j - self.lag + 2])
+            if self.floor_db is None:
+                self.floor_db = max(e, self.min_floor_db)
+            voiced = e > self.floor_db + self.start_db
+            if echo_db > self.min_reference_db:
+                voiced = voiced and e > echo_db + self.erl_db + self.echo_margin_db
+                if not voiced and not self._voiced and self.lag is not None:
+                    d = min(e - echo_db, self.erl_db + self.echo_margin_db / 2)
+                    self.erl_db += self.erl_alpha * (d - self.erl_db)
+            elif not voiced:
+                if e < self.floor_db:
+                    self.floor_db = max(e, self.min_floor_db)
+                else:
+                    self.floor_db += self.floor_alpha * (e - self.floor_db)
+
+            if voiced:
+                if self._voiced == 0:
+                    self._onset = self._frames - 1
+                self._voiced += 1
+                self._gap = 0
+                if self._voiced >= self.min_speech_frames:
+                    self.detections += 1
+                    self.onset_samples = (self._frames - self._onset) * self.frame_samples + len(self._rest)
+                    return True
+            elif self._voiced:
+                self._gap += 1
+                if self._gap > self.max_gap_frames:
+                    self._voiced = 0
+        return False
+
+    def describe(self) -> str:
+        delay = f"{self.lag * self.frame_ms:.0f}ms" if self.lag is not None else "unknown"
+        return (f"[BARGE] floor={self.floor_db if self.floor_db is not None else float('nan'):.1f}dBFS "
+                f"echo_return={self.erl_db:+.1f}dB delay={delay} detections={self.detections}")
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Vosk helpers shared by the wake-word scripts.
+
+Vosk reports word times in seconds of audio fed to the recognizer since it was
+created. TimedRecognizer remembers which MicCapture sample every fed sample came
+from, so a word's start/end time can be turned back into a ring index, e.g. to
+start the turn right after the wake word instead of after Vosk's final result.
+
+Given a keyword list, TimedRecognizer decodes with a grammar (the keywords plus
+[unk]) instead of the full language model. That is much cheaper, and with
+partial word timings enabled the wake word can be acted on from PartialResult.
+
+RecognizerWorker moves the decoding off the asyncio loop: frames go through a
+bounded queue to a thread (libvosk is called through cffi, which releases the GIL)
+and partial/final results come back as events, together with how far decoding
+lags behind the capture.
+"""
+import asyncio
+import bisect
+import json
+import queue
+import sys
+import threading
+import time
+sys.path.append("./vendor")
+from vosk import KaldiRecognizer
+
+MIC_RATE = 16000
+MAX_SEGMENTS = 256
+LAG_WARNING = 1.0       # seconds behind real time before complaining
+
+
+def check_keywords(model, keywords: list[str]):
+    """Fail at startup if a keyword uses a word the model cannot decode."""
+    missing = [w for phrase in keywords for w in phrase.split() if model.vosk_model_find_word(w) < 0]
+    if missing:
+        raise ValueError(f"Words not in the Vosk model vocabulary: {', '.join(missing)}")
+
+
+class TimedRecognizer:
+    """
+    KaldiRecognizer with word timestamps (SetWords) mapped onto capture indices.
+    With `keywords` it only decodes those phrases (grammar mode).
+    """
+
+    def __init__(self, model, rate: int = MIC_RATE, keywords: list[str] | None = None):
+        self.rate = rate
+        self.keywords = keywords
+        if keywords:
+            check_keywords(model, keywords)
+            self.rec = KaldiRecognizer(model, rate, json.dumps(list(keywords) + ["[unk]"]))
+            self.rec.SetPartialWords(True)
+        else:
+            self.rec = KaldiRecognizer(model, rate)
+        self.rec.SetWords(True)
+        self.fed = 0
+        # contiguous runs of fed audio: recognizer sample offset -> capture index
+        self._stream_starts: list[int] = []
+        self._capture_starts: list[int] = []
+
+    def AcceptWaveform(self, data, index: int | None = None) -> bool:
+        """Feed int16 PCM. `index` is the capture index of its first sample (omit if contiguous with the last call)."""
+        n = len(data) // 2
+        if index is not None and (not self._stream_starts or self._expected_index() != index):
+            self._stream_starts.append(self.fed)
+            self._capture_starts.append(index)
+            if len(self._stream_starts) > MAX_SEGMENTS:
+                del self._stream_starts[0], self._capture_starts[0]
+        self.fed += n
+        return self.rec.AcceptWaveform(data)
+
+    def _expected_index(self) -> int:
+        return self._capture_starts[-1] + (self.fed - self._stream_starts[-1])
+
+    def Result(self) -> str:
+        return self.rec.Result()
+
+    def PartialResult(self) -> str:
+        return self.rec.PartialResult()
+
+    def FinalResult(self) -> str:
+        return self.rec.FinalResult()
+
+    def Reset(self):
+        return self.rec.Reset()
+
+    def capture_index(self, seconds: float) -> int | None:
+        """Capture index of the sample the recognizer saw at `seconds` (a Vosk word time)."""
+        if not self._stream_starts:
+            return None
+        s = int(round(seconds * self.rate))
+        k = bisect.bisect_right(self._stream_starts, s) - 1
+        if k < 0:
+            return None
+        return self._capture_starts[k] + (s - self._stream_starts[k])
+
+    def annotate(self, result: dict) -> dict:
+        """Add capture indices (`start_index`/`end_index`) to every word of a Vosk result."""
+        for entry in result.get("result", []) + result.get("partial_result", []):
+            entry["start_index"] = self.capture_index(entry["start"])
+            entry["end_index"] = self.capture_index(entry["end"])
+        return result
+
+
+class RecognizerWorker:
+    """
+    Decodes in a background thread. Stages submit() audio from the loop and read
+    back events with poll() or next_event(); every event is a dict:
+
+        {"type": "partial" | "final", "text": str, "result": dict, "lag": float}
+
+    reset() discards queued audio and undelivered events along with the decoder
+    state, so a new stage never sees results from the previous one.
+    """
+
+    def __init__(self, recognizer: TimedRecognizer, max_frames: int = 64, partials: bool = True):
+        self.recognizer = recognizer
+        self.partials = partials
+        self._frames = queue.Queue(maxsize=max_frames)
+        self._events: asyncio.Queue | None = None
+        self._loop = None
+        self._thread = None
+        self._gen = 0
+
+        self.dropped = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.decoded_seconds = 0.0
+        self.busy_seconds = 0.0
+        self._last_warning = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._thread = threading.Thread(target=self._run, name="vosk-worker", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        self._frames.put(None)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        print(self.summary())
+
+    def submit(self, data: bytes, index: int | None = None, t: float | None = None) -> bool:
+        """Queue audio for decoding. `t` is the capture time of its last sample. False if the queue was full."""
+        try:
+            self._frames.put_nowait((self._gen, data, index, time.monotonic() if t is None else t))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print("[VOSK] Decoder queue full, dropping audio")
+            return False
+
+    def reset(self):
+        # the thread skips frames of older generations and resets the decoder on the first new one
+        self._gen += 1
+        while True:
+            try:
+                self._events.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+    def poll(self) -> list[dict]:
+        """Events published since the last call (never blocks)."""
+        events = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except asyncio.QueueEmpty:
+                return events
+            if event["gen"] == self._gen:
+                events.append(event)
+
+    async def next_event(self, timeout: float | None = None) -> dict | None:
+        """Wait for the next event of the current stage, None on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                event = await asyncio.wait_for(self._events.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if event["gen"] == self._gen:
+                return event
+
+    def _publish(self, event: dict):
+        self._loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+    def _run(self):
+        rec = self.recognizer
+        last_partial = ""
+        decoder_gen = self._gen
+        while True:
+            item = self._frames.get()
+            if item is None:
+                return
+            gen, data, index, t = item
+            if gen != self._gen:
+                continue
+            if gen != decoder_gen:
+                rec.Reset()
+                decoder_gen = gen
+                last_partial = ""
+
+            t0 = time.perf_counter()
+            final = rec.AcceptWaveform(data, index)
+            if final:
+                result = rec.annotate(json.loads(rec.Result()))
+                event = {"type": "final", "text": result.get("text", ""), "result": result}
+                last_partial = ""
+            elif self.partials:
+                result = rec.annotate(json.loads(rec.PartialResult()))
+                text = result.get("partial", "")
+                event = None
+                if text != last_partial:
+                    last_partial = text
+                    event = {"type": "partial", "text": text, "result": result}
+            else:
+                event = None
+            self.busy_seconds += time.perf_counter() - t0
+            self.decoded_seconds += len(data) / 2 / rec.rate
+
+            self.lag = time.monotonic() - t
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > LAG_WARNING and t - self._last_warning > 10.0:
+                self._last_warning = t
+                print(f"[VOSK] Decoding is {self.lag:.2f}s behind real time")
+
+            if event is not None:
+                event["gen"] = gen
+                event["lag"] = self.lag
+                self._publish(event)
+
+    def stats(self) -> dict:
+        return {
+            "lag_s": self.lag,
+            "max_lag_s": self.max_lag,
+            "decoded_s": self.decoded_seconds,
+            "real_time_factor": self.busy_seconds / self.decoded_seconds if self.decoded_seconds else 0.0,
+            "dropped_frames": self.dropped,
+            "queued_frames": self._frames.qsize(),
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"[VOSK] decoded={s['decoded_s']:.1f}s rtf={s['real_time_factor']:.3f} "
+                f"lag={s['lag_s']:.3f}s max_lag={s['max_lag_s']:.3f}s dropped={s['dropped_frames']}")
+
+
+def find_word(result: dict, word: str) -> dict | None:
+    """Last occurrence of `word` in a final or partial Vosk result with word timings, or None."""
+    for entry in reversed(result.get("result", []) or result.get("partial_result", [])):
+        if entry.get("word") == word:
+            return entry
+    return None
+
+
+def partial_match(text: str, phrase: str, min_chars: int = 3) -> bool:
+    """
+    True if `text` (a partial hypothesis) ends in the beginning of `phrase` or contains all of it:
+    the last words match the first words of the phrase, the last one possibly cut short
+    ("hola rob" for "robot", "oye" for "oye robot"). Cheap enough for every partial result.
+    Only useful with the open vocabulary: with a keyword grammar the first partial already is
+    the whole keyword.
+    """
+    words = text.split()
+    target = phrase.split()
+    if not words or not target:
+        return False
+    if any(words[i:i + len(target)] == target for i in range(len(words))):
+        return True
+    for n in range(min(len(words), len(target)), 0, -1):
+        *head, last = words[-n:]
+        if head == target[:n - 1] and (last == target[n - 1]
+                                       or (len(last) >= min_chars and target[n - 1].startswith(last))):
+            return True
+    return False